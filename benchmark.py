@@ -0,0 +1,708 @@
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import tempfile
+import analytics
+import cashflows
+import charts
+import data_loader
+import isin_query
+import snapshot_store
+import synthetic_data
+import tables
+from data_loader import (parse_debitor_file, parse_debitor_files, parse_debitor_frames, parse_redemption_file,
+                         redemption_stream, split_file_name, store_files)
+import metrics_cube
+import refresh
+from nasdaq_stub import BUNDLED_FILES, NasdaqStub, bundled_announcements
+from snapshot_store import SNAPSHOT_HASH_FUNCS, SnapshotHandle, apply_schema
+
+
+def parse_debitor_file_etree(file_path):
+    """
+    The original load_xml() parse path: full ET.parse DOM and one dict per record.
+    Kept as the baseline the streaming parser is measured against.
+    """
+    all_data = []
+    tree = ET.parse(file_path)
+    root = tree.getroot()
+
+    for debitormasse in root.findall('debitormasse'):
+        record = {}
+        record['isin'] = debitormasse.findtext('isin')
+        record['laan_gruppe'] = debitormasse.findtext('laan_gruppe')
+        restgaeldinterval = debitormasse.findtext('restgaeldinterval')
+        record['restgaeldinterval'] = int(restgaeldinterval) if restgaeldinterval is not None else None
+        D = debitormasse.find('D')
+        if D is not None:
+            for child in D:
+                record[child.tag] = float(child.text) if child.text is not None else None
+        all_data.append(record)
+
+    return pd.DataFrame(all_data)
+
+
+def parse_redemption_file_etree(file_path):
+    """The original load_xml_redemption() parse path: full DOM, repeated find() and one dict per term."""
+    all_data = []
+    root = ET.parse(file_path).getroot()
+    for ydelsesraekke in root.findall('ydelsesraekke'):
+        isin = ydelsesraekke.find('isin').text
+        for termin in ydelsesraekke.find('terminer').findall('termin'):
+            all_data.append({
+                'isin': isin,
+                'terminsdato': termin.find('terminsdato').text,
+                'afdrag_belob': float(termin.find('afdrag_belob').text),
+                'rente_belob': float(termin.find('rente_belob').text)
+            })
+    df = pd.DataFrame(all_data, columns=['isin', 'terminsdato', 'afdrag_belob', 'rente_belob'])
+    df['terminsdato'] = pd.to_datetime(df['terminsdato'])
+    return df
+
+
+def measure(func, *args, repeat=3):
+    """Returns (best wall time in seconds, peak traced memory in bytes, result)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def bench_debitor_parsers(file_paths):
+    rows = []
+    for file_path in file_paths:
+        etree_time, etree_peak, _ = measure(parse_debitor_file_etree, file_path)
+        stream_time, stream_peak, columns = measure(parse_debitor_file, file_path)
+        rows.append({
+            'file': file_path,
+            'rows': len(columns['isin']),
+            'etree_ms': etree_time * 1000,
+            'iterparse_ms': stream_time * 1000,
+            'etree_peak_mb': etree_peak / 1e6,
+            'iterparse_peak_mb': stream_peak / 1e6,
+        })
+    return pd.DataFrame(rows).set_index('file')
+
+
+def check_debitor_parsers(file_paths):
+    expected = pd.concat([parse_debitor_file_etree(path) for path in file_paths], ignore_index=True)
+    actual = parse_debitor_files(file_paths)
+    pd.testing.assert_frame_equal(actual, apply_schema(expected, 'debitor'))
+
+
+def bench_schema(file_paths, repeat=5):
+    """
+    Memory and groupby time of the untyped frame (object strings, float64
+    counts, int64 interval) vs. the same rows cast to the snapshot schema.
+    """
+    untyped = pd.concat([parse_debitor_file_etree(path) for path in file_paths], ignore_index=True)
+    compact = apply_schema(untyped, 'debitor')
+
+    def groupby_sums(df):
+        return df.groupby(['isin', 'laan_gruppe', 'restgaeldinterval'], observed=True)[
+            ['restgaeld_obl', 'restgaeld_obl_kontant', 'antal_obl_laan', 'antal_kontant_laan']].sum()
+
+    rows = []
+    for name, df in [('untyped', untyped), ('schema', compact)]:
+        groupby_time, _, _ = measure(groupby_sums, df, repeat=repeat)
+        cube_time, _, _ = measure(metrics_cube.build_cube, df, repeat=repeat)
+        rows.append({
+            'frame': name,
+            'memory_mb': df.memory_usage(deep=True).sum() / 1e6,
+            'groupby_ms': groupby_time * 1000,
+            'build_cube_ms': cube_time * 1000,
+        })
+    return pd.DataFrame(rows).set_index('frame')
+
+
+def bench_redemption_parsers(file_paths):
+    """
+    The DOM parser vs. the streaming reader, and the streaming reader writing
+    straight into a store partition. file_paths must be named like downloaded
+    files ('<date>_<issuer>.xml').
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as root:
+        for file_path in file_paths:
+            etree_time, etree_peak, df = measure(parse_redemption_file_etree, file_path)
+            stream_time, stream_peak, _ = measure(parse_redemption_file, file_path)
+            store_time, store_peak, _ = measure(
+                lambda path: store_files('redemption', [path], redemption_stream, root=root, force=True), file_path)
+            rows.append({
+                'file': file_path,
+                'rows': len(df),
+                'etree_ms': etree_time * 1000,
+                'iterparse_ms': stream_time * 1000,
+                'stream_to_store_ms': store_time * 1000,
+                'etree_peak_mb': etree_peak / 1e6,
+                'iterparse_peak_mb': stream_peak / 1e6,
+                'stream_to_store_peak_mb': store_peak / 1e6,
+            })
+    return pd.DataFrame(rows).set_index('file')
+
+
+def replicate_files(file_paths, copies, folder):
+    """
+    Copies every file copies times into folder as '<date>_<issuer><n>.xml', so
+    each copy is stored as its own issuer partition.
+    """
+    replicas = []
+    for n in range(copies):
+        for file_path in file_paths:
+            try:
+                published_date, issuer = split_file_name(file_path)
+            except ValueError:
+                published_date, issuer = '2024-01-01', os.path.splitext(os.path.basename(file_path))[0]
+            replica = os.path.join(folder, f"{published_date}_{issuer}{n}.xml")
+            shutil.copyfile(file_path, replica)
+            replicas.append(replica)
+    return replicas
+
+
+def bench_parallel_parse(file_paths, copies=20, workers=(1, 2, 4, 8)):
+    """
+    Wall time of parsing the files replicated copies times, sequentially and in
+    process pools of each worker count: parse_debitor_files() (columns sent back
+    and concatenated) and store_files() (workers write the partitions). Pool
+    start-up is included, as the app pays it on every refresh.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        replicas = replicate_files(file_paths, copies, folder)
+        for max_workers in workers:
+            start = time.perf_counter()
+            df = parse_debitor_files(replicas, max_workers=max_workers)
+            parse_time = time.perf_counter() - start
+            with tempfile.TemporaryDirectory() as root:
+                start = time.perf_counter()
+                store_files('debitor', replicas, parse_debitor_frames, root=root, max_workers=max_workers)
+                store_time = time.perf_counter() - start
+            rows.append({
+                'workers': max_workers,
+                'files': len(replicas),
+                'rows': len(df),
+                'parse_s': parse_time,
+                'store_s': store_time,
+                'parse_rows_per_s': len(df) / parse_time,
+            })
+    result = pd.DataFrame(rows).set_index('workers')
+    result['parse_speedup'] = result['parse_s'].iloc[0] / result['parse_s']
+    result['store_speedup'] = result['store_s'].iloc[0] / result['store_s']
+    return result
+
+
+COLD_START_COMMANDS = {
+    'cli.py --help': ['cli.py', '--help'],
+    'cli imports': ['-c', 'import cli, data_loader, refresh, metrics_cube, cashflows'],
+    'app imports': ['-c', 'import streamlit, plotly.express, streamlit_option_menu, data_loader, refresh, '
+                          'metrics_cube, cashflows, analytics'],
+}
+
+
+def bench_cold_start(repeat=5):
+    """
+    Best wall time of a fresh interpreter running each of COLD_START_COMMANDS:
+    the headless CLI against the modules the Streamlit app imports before it
+    can render anything (the server's own start-up comes on top).
+    """
+    rows = []
+    for name, args in COLD_START_COMMANDS.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)
+            best = min(best, time.perf_counter() - start)
+        rows.append({'command': name, 'seconds': best})
+    return pd.DataFrame(rows).set_index('command')
+
+
+APP_PAGES = ["Home", "Debtor Distribution", "Large Loans", "Trends", "Cashflow"]
+
+
+def page_paint(page, app='streamlit_app.py', sessions=3):
+    """
+    Renders one page of the app headless with Streamlit's AppTest, in this process.
+
+    Returns:
+    dict: first_run_s, the first session's script run including the app's
+    imports and data loading, and new_session_s, the best of further new
+    sessions opening the page on the now warm process.
+    """
+    import streamlit_option_menu
+    from streamlit.testing.v1 import AppTest
+
+    # The menu is a custom component, which AppTest cannot click
+    streamlit_option_menu.option_menu = lambda *args, **kwargs: page
+    times = []
+    for _ in range(sessions + 1):
+        at = AppTest.from_file(app, default_timeout=300)
+        start = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(f"{page}: {at.exception[0].value}")
+    return {'page': page, 'first_run_s': times[0], 'new_session_s': min(times[1:])}
+
+
+def bench_first_paint(pages=APP_PAGES, app='streamlit_app.py'):
+    """
+    Time to first paint of each page: a fresh interpreter opens the app on
+    that page against an already-built snapshot store, as a new server process
+    would, and the page is timed until its script run completes.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        debitor_folder, redemption_folder = prepare_suite_files(folder, 1)
+        with offline_environment(os.path.join(folder, 'env'), debitor_folder, redemption_folder):
+            refresh.refresh_all()
+        # The app's own refresher would poll the news API while the page is timed
+        env = dict(os.environ, DEBITOR_APP_REFRESHER='0')
+        result_path = os.path.join(folder, 'paint.json')
+        for page in pages:
+            subprocess.run([sys.executable, __file__, '--paint-page', page, '--paint-folder', folder, '--app', app,
+                            '--paint-output', result_path], check=True, stdout=subprocess.DEVNULL, env=env)
+            with open(result_path, encoding='utf-8') as file:
+                rows.append(json.load(file))
+    return pd.DataFrame(rows).set_index('page')
+
+
+def bench_table_render(isins=20, dates=360, repeat=5):
+    """
+    Redemption-style table (dates x ISINs, percentages with gaps): per-cell
+    formatting plus to_html vs. tables.html_table on all rows and on one page.
+    """
+    rng = np.random.default_rng(0)
+    values = rng.uniform(0, 5, (dates, isins))
+    values[rng.random((dates, isins)) < 0.2] = np.nan
+    df = pd.DataFrame(values, index=pd.date_range('2025-01-01', periods=dates, freq='MS').strftime('%Y-%m-%d'),
+                      columns=[f'DK{n:010d}' for n in range(isins)])
+
+    def to_html():
+        return df.map(lambda x: f"{x:,.4f}" if pd.notna(x) else "").to_html(classes='styled-table')
+
+    start, stop = tables.page_bounds(len(df), 1)
+    renderers = {
+        'map + to_html': to_html,
+        'html_table, all rows': lambda: tables.html_table(df, decimals=4, thousands=True),
+        'html_table, one page': lambda: tables.html_table(df.iloc[start:stop], decimals=4, thousands=True),
+    }
+    rows = []
+    for name, render in renderers.items():
+        seconds, _, html = measure(render, repeat=repeat)
+        rows.append({'renderer': name, 'ms': seconds * 1000, 'html_kb': len(html) / 1000})
+    return pd.DataFrame(rows).set_index('renderer')
+
+
+def bench_chart_downsampling(isins=10, terms=1200, repeat=3):
+    """
+    Build time and JSON size of the cumulative redemption line chart for long
+    schedules, on all points vs. after charts.downsample().
+    """
+    import plotly.express as px
+    import plotly.io as pio
+
+    dates = pd.date_range('2025-01-01', periods=terms, freq='W')
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'isin': np.repeat([f'DK{n:010d}' for n in range(isins)], terms),
+        'terminsdato': np.tile(dates, isins),
+        'cumulative_percentage': np.cumsum(rng.uniform(0, 1, (isins, terms)), axis=1).ravel() / terms * 100,
+    })
+
+    def build(frame):
+        fig = px.line(frame, x='terminsdato', y='cumulative_percentage', color='isin', markers=True, log_y=True)
+        return pio.to_json(fig)
+
+    rows = []
+    for name, prepare in {'all points': lambda: df,
+                          'downsampled': lambda: charts.downsample(df, 'terminsdato', 'cumulative_percentage', 'isin')}.items():
+        seconds, _, spec = measure(lambda: build(prepare()), repeat=repeat)
+        rows.append({'series': name, 'points': len(prepare()), 'build_ms': seconds * 1000, 'json_kb': len(spec) / 1000})
+    return pd.DataFrame(rows).set_index('series')
+
+
+def bench_isin_query(cube, terminated, table, counts=(10, 100, 500), repeat=3):
+    """
+    A portfolio report over N ISINs: one metrics_cube/cashflows call per ISIN
+    and metric vs. one IsinQuery.compare() call for the batch.
+    """
+    query = isin_query.IsinQuery(cube, terminated, table)
+    all_isins = list(query._isins)
+
+    def per_isin(isins):
+        rows = []
+        for isin in isins:
+            row = metrics_cube.isin_totals(cube, [isin]).iloc[0].to_dict()
+            row.update(metrics_cube.interval_distribution(cube, [isin]).iloc[0].to_dict())
+            row.update(metrics_cube.prepayment_pressure(cube, terminated, [isin]).iloc[:1].to_dict('records')[0]
+                       if isin in set(terminated['isin']) else {})
+            schedule = table.schedule(isin)
+            if schedule is not None:
+                row['maturity'] = schedule['terminsdato'][-1]
+            rows.append(row)
+        return pd.DataFrame(rows, index=isins)
+
+    results = []
+    for count in counts:
+        isins = all_isins[:count]
+        loop_time, _, _ = measure(per_isin, isins, repeat=repeat)
+        batch_time, _, _ = measure(query.compare, isins, repeat=repeat)
+        results.append({'isins': len(isins), 'per_isin_ms': loop_time * 1000, 'compare_ms': batch_time * 1000,
+                        'speedup': loop_time / batch_time})
+    return pd.DataFrame(results).set_index('isins')
+
+
+def replica_memory():
+    """This process's resident and proportional set size in MB (Linux /proc)."""
+    with open('/proc/self/smaps_rollup') as f:
+        sizes = {line.split(':')[0]: int(line.split()[1]) for line in f if line.split(':')[0] in ('Rss', 'Pss')}
+    return {'rss_mb': sizes['Rss'] / 1024, 'pss_mb': sizes['Pss'] / 1024}
+
+
+def replica_run():
+    """
+    One app replica of bench_replica_memory: loads the current snapshot the
+    way the app's SnapshotPublisher does, touches all of it, reports its
+    memory and stays alive until stdin closes.
+    """
+    import snapshots
+
+    debitor = snapshots.load_debitor(refresh.snapshot_partitions('debitor'))
+    redemption = snapshots.load_redemption(refresh.snapshot_partitions('redemption'))
+    query = isin_query.IsinQuery.from_handles(debitor, redemption)
+    query.compare(list(query._isins))
+    analytics.calculate_percentage(debitor.df, list(debitor.catalog.isins))
+    redemption.cashflows.frame(list(redemption.cashflows.isins))
+    print(json.dumps(replica_memory()), flush=True)
+    sys.stdin.read()
+
+
+def bench_replica_memory(replicas=(1, 2, 4), scale=10):
+    """
+    Memory of N app replicas on one host serving the same snapshot, each
+    loading it privately vs. mapping the frames in DEBITOR_SHARED_DIR. RSS
+    counts shared pages in every process that maps them; PSS splits them
+    between those processes, so total PSS is what the host actually spends.
+    """
+    rows = []
+    with tempfile.TemporaryDirectory() as folder:
+        debitor_folder, redemption_folder = prepare_suite_files(folder, scale)
+        with offline_environment(os.path.join(folder, 'env'), debitor_folder, redemption_folder):
+            refresh.refresh_all()
+        for shared in (False, True):
+            env = dict(os.environ, SNAPSHOT_DIR=os.path.join(folder, 'env', 'store'))
+            env.pop('DEBITOR_SHARED_DIR', None)
+            if shared:
+                env['DEBITOR_SHARED_DIR'] = os.path.join(folder, 'shared')
+            for count in replicas:
+                processes, memory = [], []
+                for _ in range(count):
+                    # One at a time, so the first replica writes the shared files and the others map them
+                    process = subprocess.Popen([sys.executable, __file__, '--replica'], env=env, text=True,
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+                    memory.append(json.loads(process.stdout.readline()))
+                    processes.append(process)
+                for process in processes:
+                    process.communicate('')
+                rows.append({'shared': shared, 'replicas': count,
+                             'rss_mb': np.mean([m['rss_mb'] for m in memory]),
+                             'pss_mb': np.mean([m['pss_mb'] for m in memory]),
+                             'total_pss_mb': sum(m['pss_mb'] for m in memory)})
+    return pd.DataFrame(rows).set_index(['shared', 'replicas'])
+
+
+def cache_hash_time(value, hash_funcs=None, repeat=5):
+    """Best time for st.cache_data to hash one argument, in seconds."""
+    from streamlit.runtime.caching.cache_type import CacheType
+    from streamlit.runtime.caching.hashing import update_hash
+
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        update_hash(value, hashlib.new('md5'), CacheType.DATA, hash_funcs=hash_funcs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_cache_hashing(df, calls_per_render=9):
+    """
+    Hashing cost of passing the raw frame vs. a SnapshotHandle to cached functions.
+    calls_per_render is the number of cached calls a warm Debtor Distribution rerun makes.
+    """
+    handle = SnapshotHandle('bench', df, metrics_cube.build_cube(df))
+    frame_ms = cache_hash_time(df) * 1000
+    handle_ms = cache_hash_time(handle, SNAPSHOT_HASH_FUNCS) * 1000
+    return pd.DataFrame([
+        {'argument': 'DataFrame', 'per_call_ms': frame_ms, 'per_render_ms': frame_ms * calls_per_render},
+        {'argument': 'SnapshotHandle', 'per_call_ms': handle_ms, 'per_render_ms': handle_ms * calls_per_render},
+    ]).set_index('argument')
+
+
+SUITE_SCALES = (1, 10, 100)
+SUITE_ISINS = 25
+SUITE_TERMS = 40
+
+
+def scale_xml(file_path, scaled_path, factor, record_tag):
+    """
+    Writes file_path with its <record_tag> elements repeated factor times. Copy
+    n renames every ISIN from DK00... to DK<n>..., so the ISIN count grows with
+    the rows as it would with more bonds.
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        text = file.read()
+    start = text.index(f"<{record_tag}>")
+    end = text.rindex(f"</{record_tag}>") + len(f"</{record_tag}>")
+    body = text[start:end]
+    with open(scaled_path, 'w', encoding='utf-8') as file:
+        file.write(text[:start])
+        for n in range(factor):
+            file.write(body.replace('<isin>DK00', f"<isin>DK{n:02d}") if n else body)
+            file.write('\n')
+        file.write(text[end:])
+
+
+def prepare_suite_files(folder, scale, data_folder='Data', synthetic=False):
+    """
+    Debtor and redemption files for one scale, named like the bundled files
+    so bundled_announcements() can serve them. By default the bundled debtor
+    files are copied scale times; with synthetic, synthetic_data generates
+    files with scale times each issuer's ISIN count instead.
+
+    Returns:
+    tuple: (debtor folder, redemption folder).
+    """
+    debitor_folder = os.path.join(folder, f"x{scale}", 'debitor')
+    redemption_folder = os.path.join(folder, f"x{scale}", 'redemption')
+    if synthetic:
+        synthetic_data.write_issuer_files(debitor_folder, redemption_folder, scale, terms=SUITE_TERMS)
+        return debitor_folder, redemption_folder
+    os.makedirs(debitor_folder, exist_ok=True)
+    os.makedirs(redemption_folder, exist_ok=True)
+    for seed, file_name in enumerate(BUNDLED_FILES.values()):
+        file_path = os.path.join(data_folder, file_name)
+        isins = parse_debitor_file(file_path)['isin'].categories
+        redemption_path = os.path.join(redemption_folder, file_name)
+        # There are no bundled redemption files to scale
+        synthetic_data.write_redemption_file(redemption_path, isins, SUITE_TERMS, style='rd', seed=seed)
+        scale_xml(file_path, os.path.join(debitor_folder, file_name), scale, 'debitormasse')
+        if scale != 1:
+            scale_xml(redemption_path, redemption_path + '.tmp', scale, 'ydelsesraekke')
+            os.replace(redemption_path + '.tmp', redemption_path)
+    return debitor_folder, redemption_folder
+
+
+@contextlib.contextmanager
+def offline_environment(folder, debitor_folder, redemption_folder):
+    """
+    Points data_loader and snapshot_store at a local NasdaqStub serving the
+    given files, with downloads, cache and store under folder.
+    """
+    saved = (data_loader.NEWS_API_URL, data_loader.CACHE_DIR, data_loader._download_cache, data_loader.DATASETS,
+             snapshot_store.STORE_DIR, refresh.STATE_FILE)
+    with NasdaqStub(bundled_announcements(debitor_folder, redemption_folder=redemption_folder)) as stub:
+        data_loader.NEWS_API_URL = stub.url
+        data_loader.CACHE_DIR = os.path.join(folder, 'cache')
+        data_loader._download_cache = None
+        data_loader.DATASETS = {dataset: (mapping, os.path.join(folder, 'downloads', dataset), parse_file)
+                                for dataset, (mapping, _, parse_file) in saved[3].items()}
+        snapshot_store.STORE_DIR = os.path.join(folder, 'store')
+        refresh.STATE_FILE = os.path.join(snapshot_store.STORE_DIR, 'refresh_state.json')
+        try:
+            yield stub
+        finally:
+            (data_loader.NEWS_API_URL, data_loader.CACHE_DIR, data_loader._download_cache, data_loader.DATASETS,
+             snapshot_store.STORE_DIR, refresh.STATE_FILE) = saved
+
+
+def cold_load(load, debitor_folder, redemption_folder):
+    """load() against an empty download cache and snapshot store."""
+    with tempfile.TemporaryDirectory() as folder:
+        with offline_environment(folder, debitor_folder, redemption_folder):
+            return load()
+
+
+def suite_stages(df, terminated, redemption, isins):
+    """
+    The analytics stages: name -> (function, args, rows processed).
+    isins is the selection passed to the per-ISIN functions.
+    """
+    cube = metrics_cube.build_cube(df)
+    table = cashflows.CashflowTable.from_frame(redemption)
+    portfolio = dict.fromkeys(isins, 1_000_000.0)
+    return {
+        'build_cube': (metrics_cube.build_cube, (df,), len(df)),
+        'calculate_percentage': (analytics.calculate_percentage, (df, isins), len(df)),
+        'compute_avg_loan_size': (analytics.compute_avg_loan_size, (df, isins), len(df)),
+        'calculate_interval_distribution': (analytics.calculate_interval_distribution, (df, isins), len(df)),
+        'calculate_avg_loan_size_per_laan_gruppe': (analytics.calculate_avg_loan_size_per_laan_gruppe, (df, isins),
+                                                    len(df)),
+        'cube.interval_distribution': (metrics_cube.interval_distribution, (cube, isins), len(cube)),
+        'cube.isin_totals': (metrics_cube.isin_totals, (cube, isins), len(cube)),
+        'cube.loan_shares': (metrics_cube.loan_shares, (cube, isins), len(cube)),
+        'prepayment_pressure': (metrics_cube.prepayment_pressure, (cube, terminated), len(terminated)),
+        'CashflowTable.from_frame': (cashflows.CashflowTable.from_frame, (redemption,), len(redemption)),
+        'CashflowTable.frame': (table.frame, (isins,), len(redemption)),
+        'CashflowTable.project': (table.project, (portfolio,), len(redemption)),
+    }
+
+
+def run_suite(scales=SUITE_SCALES, data_folder='Data', repeat=3, synthetic=False):
+    """
+    Times loading, parsing and every analytics function on the bundled debtor
+    files scaled by each factor (or synthetic files of that scale, see
+    prepare_suite_files), offline against a NasdaqStub. Large scales run each
+    stage once.
+
+    Peak memory is what tracemalloc sees during one extra run: numpy and
+    Python allocations, not Arrow's own buffers.
+
+    Returns:
+    list: Dicts with scale, stage, rows, wall_s, peak_mb and rows_per_s.
+    """
+    results = []
+
+    def record(scale, stage, func, args, rows=None, stage_repeat=repeat):
+        wall, peak, result = measure(func, *args, repeat=stage_repeat)
+        rows = len(result) if rows is None else rows
+        results.append({'scale': scale, 'stage': stage, 'rows': rows, 'wall_s': wall, 'peak_mb': peak / 1e6,
+                        'rows_per_s': rows / wall if wall else None})
+        print(f"x{scale} {stage}: {wall:.3f}s, {peak / 1e6:.1f} MB, {rows} rows")
+        return result
+
+    with tempfile.TemporaryDirectory() as folder:
+        for scale in scales:
+            stage_repeat = repeat if scale == 1 else 1
+            debitor_folder, redemption_folder = prepare_suite_files(folder, scale, data_folder, synthetic)
+            debitor_files = sorted(glob.glob(os.path.join(debitor_folder, '*.xml')))
+            redemption_files = sorted(glob.glob(os.path.join(redemption_folder, '*.xml')))
+
+            for stage, load in [('load_xml (cold)', data_loader.load_xml),
+                                ('load_xml_redemption (cold)', data_loader.load_xml_redemption)]:
+                record(scale, stage, cold_load, (load, debitor_folder, redemption_folder), stage_repeat=stage_repeat)
+            with offline_environment(os.path.join(folder, f"x{scale}", 'env'), debitor_folder, redemption_folder):
+                data_loader.load_xml()
+                data_loader.load_xml_redemption()
+                df = record(scale, 'load_xml (warm)', data_loader.load_xml, (), stage_repeat=stage_repeat)
+                redemption = record(scale, 'load_xml_redemption (warm)', data_loader.load_xml_redemption, (),
+                                    stage_repeat=stage_repeat)
+                terminated = snapshot_store.read_snapshot(snapshot_store.latest_partitions('terminated').values())
+            record(scale, 'parse_debitor_files', parse_debitor_files, (debitor_files,), stage_repeat=stage_repeat)
+            record(scale, 'parse_redemption_files', data_loader.parse_redemption_files, (redemption_files,),
+                   stage_repeat=stage_repeat)
+
+            isins = list(df['isin'].cat.categories[:SUITE_ISINS])
+            for stage, (func, args, rows) in suite_stages(df, terminated, redemption, isins).items():
+                record(scale, stage, func, args, rows=rows, stage_repeat=stage_repeat)
+            shutil.rmtree(os.path.join(folder, f"x{scale}"))
+    return results
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'results': results,
+        }, file, indent=1)
+
+
+def compare_results(baseline_path, path):
+    """
+    Wall time and peak memory of a run relative to a baseline run; ratios above
+    1 are slower or larger.
+    """
+    frames = []
+    for name, result_path in [('baseline', baseline_path), ('current', path)]:
+        with open(result_path, 'r', encoding='utf-8') as file:
+            frames.append(pd.DataFrame(json.load(file)['results']).set_index(['scale', 'stage'])
+                          [['wall_s', 'peak_mb']].add_prefix(f"{name}_"))
+    comparison = frames[0].join(frames[1], how='inner')
+    comparison['wall_ratio'] = comparison['current_wall_s'] / comparison['baseline_wall_s']
+    comparison['peak_ratio'] = comparison['current_peak_mb'] / comparison['baseline_peak_mb']
+    return comparison
+
+
+def main_benchmarks():
+    files = sorted(glob.glob('Data/*.xml'))
+    check_debitor_parsers(files)
+    print(bench_debitor_parsers(files).round(2).to_string())
+    print(bench_schema(files).round(2).to_string())
+    redemption_files = sorted(glob.glob('Data/Redemption/*_*.xml'))
+    if redemption_files:
+        print(bench_redemption_parsers(redemption_files).round(2).to_string())
+    print(bench_cache_hashing(parse_debitor_files(files)).round(3).to_string())
+    print(bench_table_render().round(2).to_string())
+    print(bench_chart_downsampling().round(2).to_string())
+    query = isin_query.IsinQuery.load()
+    if query.cube is not None and query.cashflows is not None:
+        print(bench_isin_query(query.cube, query.terminated, query.cashflows).round(2).to_string())
+    print(f"{os.cpu_count()} CPUs")
+    print(bench_parallel_parse(files).round(2).to_string())
+    print(bench_cold_start().round(3).to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Parser and analytics benchmarks.")
+    parser.add_argument('--suite', action='store_true',
+                        help="Run the load/parse/analytics suite on scaled copies of the bundled files")
+    parser.add_argument('--scales', type=int, nargs='+', default=list(SUITE_SCALES))
+    parser.add_argument('--synthetic', action='store_true',
+                        help="Run the suite on generated files (synthetic_data.py) instead of copies of Data/")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage at scale 1")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where the suite writes its JSON")
+    parser.add_argument('--compare', metavar='BASELINE', help="Compare the suite's results with an earlier JSON")
+    parser.add_argument('--first-paint', action='store_true', help="Time each page of the app headless")
+    parser.add_argument('--app', default='streamlit_app.py', help="App script --first-paint runs")
+    parser.add_argument('--paint-page', help=argparse.SUPPRESS)
+    parser.add_argument('--paint-folder', help=argparse.SUPPRESS)
+    parser.add_argument('--paint-output', help=argparse.SUPPRESS)
+    parser.add_argument('--replica-memory', action='store_true',
+                        help="Memory of several app replicas with and without DEBITOR_SHARED_DIR")
+    parser.add_argument('--replica', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.replica:
+        replica_run()
+    elif args.replica_memory:
+        print(bench_replica_memory().round(1).to_string())
+    elif args.paint_page:
+        # One page of bench_first_paint, in its own interpreter
+        with offline_environment(os.path.join(args.paint_folder, 'env'), os.path.join(args.paint_folder, 'x1', 'debitor'),
+                                 os.path.join(args.paint_folder, 'x1', 'redemption')):
+            result = page_paint(args.paint_page, args.app)
+        with open(args.paint_output, 'w', encoding='utf-8') as file:
+            json.dump(result, file)
+    elif args.first_paint:
+        print(bench_first_paint(app=args.app).round(3).to_string())
+    elif args.suite:
+        save_results(run_suite(args.scales, repeat=args.repeat, synthetic=args.synthetic), args.output)
+        print(f"Results written to {args.output}")
+        if args.compare:
+            print(compare_results(args.compare, args.output).round(3).to_string())
+    else:
+        main_benchmarks()
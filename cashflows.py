@@ -0,0 +1,187 @@
+"""
+Redemption schedules laid out for fast per-ISIN access.
+
+CashflowTable is built once per redemption snapshot. Rows are sorted by isin
+and terminsdato into flat numpy columns, and offsets[i]:offsets[i + 1] is the
+schedule of isins[i], so looking up an ISIN is a binary search plus a slice
+that shares memory with the table. Redemption percentages and cumulative
+curves are computed for every ISIN in the same pass.
+"""
+import numpy as np
+import pandas as pd
+
+COLUMNS = ['terminsdato', 'afdrag_belob', 'rente_belob', 'total_afdrag_belob', 'afdrag_percentage',
+           'cumulative_percentage']
+
+
+class CashflowTable:
+    """
+    Attributes:
+    isins (np.ndarray): Sorted ISINs.
+    offsets (np.ndarray): len(isins) + 1 row offsets into the columns.
+    columns (dict): Column name (see COLUMNS) -> numpy array, sorted by isin and terminsdato.
+    """
+
+    def __init__(self, isins, offsets, columns):
+        self.isins = isins
+        self.offsets = offsets
+        self.columns = columns
+
+    @classmethod
+    def from_frame(cls, df):
+        """
+        Builds the table from a redemption frame with isin, terminsdato,
+        afdrag_belob and rente_belob columns. Rows without an ISIN belong to
+        no schedule and are dropped.
+        """
+        # A missing ISIN has code -1, which would index the last category's rank
+        df = df[df['isin'].notna()]
+        # Categorical codes ranked by ISIN string, without sorting the strings row by row
+        isin = df['isin'].astype('category').cat.remove_unused_categories()
+        categories = isin.cat.categories.to_numpy(dtype=object)
+        category_order = np.argsort(categories, kind='stable')
+        rank = np.empty(len(categories), dtype=np.int64)
+        rank[category_order] = np.arange(len(categories))
+        isins = categories[category_order]
+        codes = rank[isin.cat.codes.to_numpy()]
+        dates = np.asarray(pd.to_datetime(df['terminsdato']), dtype='datetime64[ns]')
+        order = np.lexsort((dates, codes))
+        codes = codes[order]
+        counts = np.bincount(codes, minlength=len(isins))
+        offsets = np.zeros(len(isins) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+
+        afdrag = pd.Series(np.asarray(df['afdrag_belob'], dtype=np.float64)[order])
+        # Rows are already grouped, so transform/cumsum run without a merge or another sort
+        total_afdrag = afdrag.groupby(codes, sort=False).transform('sum')
+        afdrag_percentage = afdrag / total_afdrag * 100
+        cumulative_percentage = afdrag_percentage.groupby(codes, sort=False).cumsum()
+
+        columns = {
+            'terminsdato': dates[order],
+            'afdrag_belob': afdrag.to_numpy(),
+            'rente_belob': np.asarray(df['rente_belob'], dtype=np.float64)[order],
+            'total_afdrag_belob': total_afdrag.to_numpy(),
+            'afdrag_percentage': afdrag_percentage.to_numpy(),
+            'cumulative_percentage': cumulative_percentage.to_numpy(),
+        }
+        return cls(isins, offsets, columns)
+
+    def to_flat_frame(self):
+        """The table as one frame: a categorical isin (categories = isins) and every column."""
+        codes = np.repeat(np.arange(len(self.isins)), np.diff(self.offsets))
+        df = pd.DataFrame({'isin': pd.Categorical.from_codes(codes, categories=self.isins)})
+        for name, column in self.columns.items():
+            df[name] = column
+        return df
+
+    @classmethod
+    def from_flat_frame(cls, df):
+        """
+        The inverse of to_flat_frame(). The columns are the frame's arrays, not
+        copies, so a memory-mapped frame stays shared.
+        """
+        isins = df['isin'].cat.categories.to_numpy(dtype=object)
+        counts = np.bincount(df['isin'].cat.codes.to_numpy(), minlength=len(isins))
+        offsets = np.zeros(len(isins) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        columns = {name: df[name].to_numpy() for name in df.columns if name != 'isin'}
+        return cls(isins, offsets, columns)
+
+    def __len__(self):
+        return len(self.isins)
+
+    def __contains__(self, isin):
+        return self._position(isin) is not None
+
+    def _position(self, isin):
+        position = np.searchsorted(self.isins, isin)
+        if position < len(self.isins) and self.isins[position] == isin:
+            return position
+        return None
+
+    def schedule(self, isin):
+        """
+        One ISIN's schedule as views into the table's columns (no copy).
+
+        Returns:
+        dict: Column name -> numpy array, or None for an unknown ISIN.
+        """
+        position = self._position(isin)
+        if position is None:
+            return None
+        start, stop = self.offsets[position], self.offsets[position + 1]
+        return {name: column[start:stop] for name, column in self.columns.items()}
+
+    def _rows(self, isins):
+        """Row positions of the given ISINs' schedules, in isin order, and their ISIN positions."""
+        positions = sorted({position for position in map(self._position, dict.fromkeys(isins)) if position is not None})
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        counts = self.offsets[positions + 1] - starts
+        # arange over every selected segment without a Python loop
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return rows, positions, counts
+
+    def frame(self, isins):
+        """
+        The selected ISINs' schedules as a DataFrame, sorted by isin and terminsdato;
+        the same rows the redemption page used to filter from the full frame.
+        """
+        rows, positions, counts = self._rows(isins)
+        df = pd.DataFrame({'isin': np.repeat(self.isins[positions], counts)})
+        for name, column in self.columns.items():
+            df[name] = column[rows]
+        return df
+
+    def summary(self, isins):
+        """
+        Schedule totals of many ISINs at once, read off the segment boundaries.
+
+        Returns:
+        pd.DataFrame: Indexed by isin (sorted; unknown ISINs left out) with
+        first_terminsdato, maturity (the last terminsdato), terms, total_afdrag
+        and total_rente.
+        """
+        rows, positions, counts = self._rows(isins)
+        firsts = self.offsets[positions]
+        lasts = self.offsets[positions + 1] - 1
+        # Segment sums of the selected rows; every selected schedule has at least one row
+        segment_starts = np.cumsum(counts) - counts
+        rente = np.add.reduceat(self.columns['rente_belob'][rows], segment_starts) if len(rows) else np.empty(0)
+        return pd.DataFrame({
+            'first_terminsdato': self.columns['terminsdato'][firsts],
+            'maturity': self.columns['terminsdato'][lasts],
+            'terms': counts,
+            'total_afdrag': self.columns['total_afdrag_belob'][firsts],
+            'total_rente': rente,
+        }, index=pd.Index(self.isins[positions], name='isin'))
+
+    def project(self, portfolio):
+        """
+        Aggregate cashflows of a portfolio of ISINs held at a nominal amount.
+
+        An ISIN's redemptions add up to the amount outstanding, so a holding of
+        nominal N receives N / total_afdrag_belob of every payment.
+
+        Parameters:
+        portfolio (dict): ISIN -> nominal held; unknown ISINs are ignored.
+
+        Returns:
+        pd.DataFrame: Indexed by terminsdato with afdrag, rente, ydelse
+        (afdrag + rente) and outstanding nominal after each date.
+        """
+        rows, positions, counts = self._rows(portfolio)
+        nominal = np.asarray([portfolio[isin] for isin in self.isins[positions]], dtype=np.float64)
+        total_afdrag = self.columns['total_afdrag_belob'][self.offsets[positions]]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weights = np.where(total_afdrag != 0, nominal / total_afdrag, 0.0)
+        weights = np.repeat(weights, counts)
+
+        dates, inverse = np.unique(self.columns['terminsdato'][rows], return_inverse=True)
+        afdrag = np.bincount(inverse, weights=self.columns['afdrag_belob'][rows] * weights, minlength=len(dates))
+        rente = np.bincount(inverse, weights=self.columns['rente_belob'][rows] * weights, minlength=len(dates))
+        projection = pd.DataFrame({'afdrag': afdrag, 'rente': rente}, index=pd.DatetimeIndex(dates, name='terminsdato'))
+        projection['ydelse'] = projection['afdrag'] + projection['rente']
+        projection['outstanding'] = nominal.sum() - projection['afdrag'].cumsum()
+        return projection
@@ -0,0 +1,62 @@
+"""
+Downsampling of line chart series before they are sent to the browser.
+
+A line with more points than the chart is pixels wide only adds to the figure
+JSON every rerun ships. lttb_indices() picks the points that keep the line's
+shape (Largest-Triangle-Three-Buckets, Steinarsson 2013): the first and last
+points stay, and from each bucket in between it keeps the point forming the
+largest triangle with the point kept before it and the next bucket's mean.
+"""
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 250
+
+
+def lttb_indices(x, y, threshold=MAX_POINTS):
+    """
+    Parameters:
+    x (np.ndarray): Increasing x values (numbers or datetime64).
+    y (np.ndarray): The y values.
+    threshold (int): Points to keep.
+
+    Returns:
+    np.ndarray: Positions of the kept points, ascending; all positions when
+    there are no more than threshold points.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x)
+    x = x.astype('datetime64[ns]').astype(np.int64).astype(np.float64) if x.dtype.kind == 'M' else x.astype(np.float64)
+    y = np.asarray(y, dtype=np.float64)
+
+    every = (n - 2) / (threshold - 2)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        stop = int((bucket + 1) * every) + 1
+        next_stop = min(int((bucket + 2) * every) + 1, n)
+        mean_x, mean_y = x[stop:next_stop].mean(), y[stop:next_stop].mean()
+        # Twice the triangle area; the constant factor does not change the argmax
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[bucket + 1] = a
+    return kept
+
+
+def downsample(df, x, y, by, threshold=MAX_POINTS):
+    """
+    Downsamples each series of a long-format frame (one series per value of
+    by, sorted by x within it) to at most threshold points.
+
+    Returns:
+    pd.DataFrame: df itself when no series is longer than threshold, else the kept rows.
+    """
+    if df.empty or df.groupby(by, sort=False, observed=True).size().max() <= threshold:
+        return df
+    parts = [part.iloc[lttb_indices(part[x].to_numpy(), part[y].to_numpy(), threshold)]
+             for _, part in df.groupby(by, sort=False, observed=True)]
+    return pd.concat(parts)
@@ -0,0 +1,137 @@
+"""
+Headless export of the dashboard's tables, for scheduled jobs.
+
+Refreshes the snapshot store (fetch and parse, as refresh.py does), then
+writes the Summary table for every ISIN, the Large Loans top N, the
+prepayment pressure ranking and every ISIN's redemption curve:
+
+    python cli.py --out exports --format parquet
+    python cli.py --out exports --no-fetch --top-n 100
+    python cli.py --no-fetch --isins portfolio.txt --metrics totals intervals redemption
+
+Nothing here imports Streamlit or plotly, and pandas and the loaders are only
+imported once the arguments are parsed, so --help answers at once.
+"""
+import argparse
+import os
+import time
+
+EXPORTS = ['summary', 'large_loans', 'prepayment_pressure', 'redemption_curves', 'isin_report']
+
+
+def read_isins(value):
+    """ISINs from a file (one per line, or separated by commas) or from a comma-separated list."""
+    if os.path.exists(value):
+        with open(value, encoding='utf-8') as file:
+            value = file.read()
+    return [isin.strip().upper() for isin in value.replace('\n', ',').split(',') if isin.strip()]
+
+
+def load_snapshot():
+    """
+    Reads the current snapshot the way the app does (see snapshots.py).
+
+    Returns:
+    tuple: (debtor SnapshotHandle with cube and terminated, CashflowTable or None).
+    """
+    import refresh
+    import snapshots
+
+    debitor = snapshots.load_debitor(refresh.snapshot_partitions('debitor'))
+    redemption = snapshots.load_redemption(refresh.snapshot_partitions('redemption'))
+    return debitor, redemption.cashflows
+
+
+def build_exports(debitor, table, top_n=50, isins=None, metrics=None):
+    """
+    Parameters:
+    isins (list): ISINs of the isin_report (isin_query.IsinQuery.compare); no report when None.
+    metrics (list): The report's metrics; all of isin_query.METRICS when None.
+
+    Returns:
+    dict: Export name (see EXPORTS) -> DataFrame; names without data are left out.
+    """
+    import isin_query
+    import metrics_cube
+
+    exports = {}
+    if debitor.cube is not None:
+        exports['summary'] = metrics_cube.summary_table(debitor.cube)
+        exports['large_loans'] = metrics_cube.large_loans(debitor.cube, top_n)
+        if debitor.terminated is not None and not debitor.terminated.empty:
+            exports['prepayment_pressure'] = metrics_cube.prepayment_pressure(debitor.cube, debitor.terminated)
+    if table is not None:
+        exports['redemption_curves'] = table.frame(table.isins).set_index(['isin', 'terminsdato'])
+    if isins:
+        query = isin_query.IsinQuery(debitor.cube, debitor.terminated, table)
+        exports['isin_report'] = query.compare(isins, metrics)
+    return exports
+
+
+def write_exports(exports, out_dir, file_format='csv'):
+    """
+    Writes each export as <out_dir>/<name>.<csv|parquet>, under a temporary name
+    first so a reader never sees half a file.
+
+    Returns:
+    list: The written paths.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, df in exports.items():
+        path = os.path.join(out_dir, f"{name}.{file_format}")
+        tmp_path = path + '.tmp'
+        if file_format == 'parquet':
+            df.to_parquet(tmp_path)
+        else:
+            df.to_csv(tmp_path)
+        os.replace(tmp_path, path)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch, parse and export the dashboard's tables without Streamlit.")
+    parser.add_argument('--out', default='exports', help="Folder the tables are written to")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    parser.add_argument('--top-n', type=int, default=50, help="Rows of the large loans table")
+    parser.add_argument('--no-fetch', action='store_true', help="Export the stored snapshot without refreshing it")
+    parser.add_argument('--full', action='store_true', help="Re-download and re-parse every issuer")
+    parser.add_argument('--offline', action='store_true', help="Serve announcements from the download cache only")
+    parser.add_argument('--timings', action='store_true', help="Print how long each step took")
+    parser.add_argument('--isins', help="Also write isin_report for these ISINs: a file or a comma-separated list")
+    parser.add_argument('--metrics', nargs='+', help="Metrics of isin_report (see isin_query.METRICS); all by default")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    import data_loader
+    import instrumentation
+    import refresh
+    if args.offline:
+        data_loader.OFFLINE = True
+
+    with instrumentation.span('cli.total'):
+        if not args.no_fetch:
+            with instrumentation.span('cli.refresh'):
+                print(refresh.refresh_all(incremental=not args.full))
+        with instrumentation.span('cli.load_snapshot'):
+            debitor, table = load_snapshot()
+        with instrumentation.span('cli.analytics'):
+            isins = read_isins(args.isins) if args.isins else None
+            exports = build_exports(debitor, table, args.top_n, isins, args.metrics)
+        with instrumentation.span('cli.write'):
+            paths = write_exports(exports, args.out, args.format)
+
+    for path in paths:
+        print(f"Wrote {path}")
+    if args.timings:
+        spans, _ = instrumentation.snapshot()
+        for name in ['cli.refresh', 'cli.load_snapshot', 'cli.analytics', 'cli.write', 'cli.total']:
+            if name in spans:
+                print(f"{name}: {spans[name]['total']:.3f}s")
+        print(f"imports and export: {time.perf_counter() - start:.3f}s")
+    return paths
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,84 @@
 import requests
 import os
+import hashlib
+import json
+import shutil
 import xml.etree.ElementTree as ET
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
+import pyarrow as pa
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
 from datetime import datetime, timedelta
-import streamlit as st
+from requests.adapters import HTTPAdapter
+import snapshot_store
+from download_cache import CacheMiss, DownloadCache
 
-def get_news(free_text='', from_date=None, to_date=None, market='', company='', category=''):
-    url = "https://api.news.eu.nasdaq.com/news/query.action"
+# Overridable so the app can be pointed at a local stub (see nasdaq_stub.py)
+NEWS_API_URL = os.environ.get('NASDAQ_NEWS_URL', "https://api.news.eu.nasdaq.com/news/query.action")
+MARKET = "Main Market, Copenhagen"
+REQUEST_TIMEOUT = 30
+FETCH_WORKERS = 5
+
+# Download cache shared by every process started from this folder
+CACHE_DIR = os.environ.get('DOWNLOAD_CACHE_DIR', './Data/.cache')
+OFFLINE = os.environ.get('DEBITOR_OFFLINE', '') == '1'
+NEWS_FRESH_FOR = 15 * 60
+ATTACHMENT_FRESH_FOR = 24 * 60 * 60
+CACHE_MAX_BYTES = 500 * 1024 * 1024
+CACHE_MAX_AGE = 180 * 24 * 60 * 60
+
+# Processes issuer files are parsed in; 1 parses them one after another in this process
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', '1'))
+
+DEBITOR_MAPPING = {
+    "Jyske Realkredit A/S": "Data on debtor",
+    "Nordea Kredit Realkreditaktieselskab": "debtor",
+    "Nykredit Realkredit A/S": "Debtor distribution",
+    "DLR Kredit A/S": "Debitormassens sammensætning",
+    "Realkredit Danmark A/S": 'Breakdown of debtors',
+}
+
+REDEMPTION_MAPPING = {
+    "Jyske Realkredit A/S": "Cash Flows",
+    "Nordea Kredit Realkreditaktieselskab": "CK 94",
+    "Nykredit Realkredit A/S": "CK94",
+    "DLR Kredit A/S": "CK94",
+    "Realkredit Danmark A/S": 'Repayments',
+}
+
+MAPPING_SHORT = {
+    "Jyske Realkredit A/S": "Jyske",
+    "Nordea Kredit Realkreditaktieselskab": "Nordea",
+    "Nykredit Realkredit A/S": "Nykredit",
+    "DLR Kredit A/S": "DLR",
+    "Realkredit Danmark A/S": 'RD',
+}
+
+
+_download_cache = None
+
+def get_download_cache():
+    global _download_cache
+    if _download_cache is None:
+        _download_cache = DownloadCache(CACHE_DIR, max_bytes=CACHE_MAX_BYTES, max_age=CACHE_MAX_AGE)
+    return _download_cache
+
+
+def make_session(pool_size=FETCH_WORKERS):
+    """A keep-alive session whose connection pool matches the fetch concurrency."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_news(free_text='', from_date=None, to_date=None, market='', company='', category='', session=None,
+             cache=None, offline=False, fresh_for=NEWS_FRESH_FOR, limit=20):
+    url = NEWS_API_URL
     
     params = {
         'type': 'json',
@@ -21,11 +93,26 @@ def get_news(free_text='', from_date=None, to_date=None, market='', company='',
         'cnscategory': category,
         'fromDate': int(from_date.timestamp() * 1000) if from_date else '',
         'toDate': int(to_date.timestamp() * 1000) if to_date else '',
-        'limit': '20',
+        'limit': str(limit),
         'start': '0'
     }
 
-    response = requests.get(url, params=params)
+    if cache is not None:
+        # Searches are cached briefly so a restart or new worker skips the round-trip.
+        # The moving date window is left out of the key so repeated searches share an entry.
+        key = DownloadCache.cache_url(url, {k: v for k, v in params.items() if k not in ('fromDate', 'toDate')})
+        try:
+            entry = cache.get(url, params=params, key=key, session=session, offline=offline,
+                              fresh_for=fresh_for, timeout=REQUEST_TIMEOUT)
+        except CacheMiss:
+            print(f"Offline and no cached search for {company}")
+            return None
+        except requests.HTTPError as e:
+            print("Error: {}".format(e.response.status_code))
+            return None
+        return json.loads(cache.read(entry))
+
+    response = (session or requests).get(url, params=params, timeout=REQUEST_TIMEOUT)
 
     if response.status_code == 200:
         return response.json()
@@ -33,158 +120,627 @@ def get_news(free_text='', from_date=None, to_date=None, market='', company='',
         print("Error: {}".format(response.status_code))
         return None
 
-def download_xml(url, save_path):
-    response = requests.get(url)
-    with open(save_path, 'wb') as file:
-        file.write(response.content)
+def download_xml(url, save_path, session=None, cache=None, offline=False):
+    if cache is None:
+        response = (session or requests).get(url, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        with open(save_path, 'wb') as file:
+            file.write(response.content)
+        print(f"Downloaded XML: {save_path}")
+        return
+
+    entry = cache.get(url, session=session, offline=offline, fresh_for=ATTACHMENT_FRESH_FOR, timeout=REQUEST_TIMEOUT)
+    blob_path = cache.blob_path(entry['sha256'])
+    if os.path.exists(save_path) and os.path.getsize(save_path) == entry['size'] and _sha256(save_path) == entry['sha256']:
+        print(f"Cached XML: {save_path}")
+        return
+    tmp_path = save_path + '.tmp'
+    shutil.copyfile(blob_path, tmp_path)
+    os.replace(tmp_path, save_path)
     print(f"Downloaded XML: {save_path}")
 
-def load_xml():
-    data_folder = "./Data"
-    if not os.path.exists(data_folder):
-        os.makedirs(data_folder)
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-    mapping = {
-    "Jyske Realkredit A/S": "Data on debtor",
-    "Nordea Kredit Realkreditaktieselskab": "debtor",
-    "Nykredit Realkredit A/S": "Debtor distribution",
-    "DLR Kredit A/S": "Debitormassens sammensætning",
-    "Realkredit Danmark A/S": 'Breakdown of debtors',
-}
+def announcement_file(company, item, data_folder):
+    """
+    The XML attachment of a news item and where it is saved: '<published date>_<issuer short>.xml'.
+
+    Returns:
+    tuple: (attachment URL, save path), or None when the item has no XML attachment.
+    """
+    xml_attachment = next((att for att in item['attachment'] if att['mimetype'] in ['text/xml', 'application/octet-stream']), None)
+    if xml_attachment is None:
+        return None
+    published_date = str(pd.to_datetime(item['published']).strftime('%Y-%m-%d'))
+    file_name = f"{published_date}_{MAPPING_SHORT[company]}.xml"
+    return xml_attachment['attachmentUrl'], os.path.join(data_folder, file_name)
+
+def fetch_latest_file(company, free_text, data_folder, start_date, end_date, session=None, cache=None, offline=False,
+                      known_id=None, news_fresh_for=NEWS_FRESH_FOR):
+    """
+    Looks up the newest announcement for one issuer and downloads its XML attachment.
+
+    The download is skipped when the announcement's disclosureId equals
+    known_id and its file is already on disk.
+
+    Returns:
+    dict: 'disclosure_id', 'published', 'path' and 'changed' (False when the
+    download was skipped), or None when nothing was published.
+    """
+    news = get_news(
+        free_text=free_text,
+        from_date=start_date,
+        to_date=end_date,
+        company=company,
+        market=MARKET,
+        session=session,
+        cache=cache,
+        offline=offline,
+        fresh_for=news_fresh_for
+    )
 
-    mapping_short = {
-        "Jyske Realkredit A/S": "Jyske",
-        "Nordea Kredit Realkreditaktieselskab": "Nordea",
-        "Nykredit Realkredit A/S": "Nykredit",
-        "DLR Kredit A/S": "DLR",
-        "Realkredit Danmark A/S": 'RD',
+    if not (news and 'results' in news and 'item' in news['results'] and news['results']['item']):
+        return None
+
+    latest = news['results']['item'][0]
+    attachment = announcement_file(company, latest, data_folder)
+    if attachment is None:
+        print(f"No XML attachment for {company}")
+        return None
+
+    attachment_url, save_path = attachment
+    announcement = {
+        'disclosure_id': latest.get('disclosureId'),
+        'published': latest['published'],
+        'path': save_path,
+        'changed': True,
     }
+    if known_id is not None and announcement['disclosure_id'] == known_id and os.path.exists(save_path):
+        announcement['changed'] = False
+        return announcement
 
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=90)
+    download_xml(attachment_url, save_path, session=session, cache=cache, offline=offline)
+    return announcement
 
-    file_paths = {}
-
-    for key, value in mapping.items():
-        news = get_news(
-            free_text=value,
-            from_date=start_date,
-            to_date=end_date,
-            company=key,
-            market="Main Market, Copenhagen"
-        )
-
-        if news and 'results' in news and 'item' in news['results'] and news['results']['item']:
-            attachments = news['results']['item'][0]['attachment']
-                
-            # Find the XML attachment
-            xml_attachment = next((att for att in attachments if att['mimetype'] in ['text/xml', 'application/octet-stream']), None)
-
-            attachment_url = xml_attachment['attachmentUrl']
-            published_date = str(pd.to_datetime(news['results']['item'][0]['published']).strftime('%Y-%m-%d'))
-            file_name = f"{published_date}_{mapping_short[key]}.xml"
-            save_path = os.path.join(data_folder, file_name)
-            download_xml(attachment_url, save_path)
-            file_paths[key] = save_path
-
-    all_data = []
-
-    for company, file_path in file_paths.items():
-        try:
-            print(f"Parsing XML: {file_path}")
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-
-            for debitormasse in root.findall('debitormasse'):
-                record = {}
-                record['isin'] = debitormasse.findtext('isin')
-                record['laan_gruppe'] = debitormasse.findtext('laan_gruppe')
-                restgaeldinterval = debitormasse.findtext('restgaeldinterval')
-                record['restgaeldinterval'] = int(restgaeldinterval) if restgaeldinterval is not None else None
-                D = debitormasse.find('D')
-                if D is not None:
-                    for child in D:
-                        record[child.tag] = float(child.text) if child.text is not None else None
-                all_data.append(record)
-        except Exception as e:
-            print(f"Error loading file {file_path}: {str(e)}")
-
-    return pd.DataFrame(all_data)
-
-
-def load_xml_redemption():
-    data_folder = "./Data/Redemption"
+def fetch_announcements(mapping, data_folder, max_workers=FETCH_WORKERS, session=None, cache=None, offline=None,
+                        known=None, news_fresh_for=NEWS_FRESH_FOR):
+    """
+    Fetches the latest announcement and file of every issuer in mapping concurrently.
+
+    Searches and downloads share one pooled keep-alive session, and at most
+    max_workers requests are in flight at a time. Responses go through the
+    download cache (get_download_cache() unless one is passed); offline
+    serves from the cache only and defaults to the DEBITOR_OFFLINE setting.
+
+    Parameters:
+    known (dict): Optional company -> disclosureId already processed; those
+        issuers are not downloaded again unless they published something new.
+    news_fresh_for (int): Seconds a cached search is reused without asking the API.
+
+    Returns:
+    dict: Company -> fetch_latest_file() result, in mapping order.
+    """
     if not os.path.exists(data_folder):
         os.makedirs(data_folder)
 
-    mapping = {
-        "Jyske Realkredit A/S": "Cash Flows",
-        "Nordea Kredit Realkreditaktieselskab": "CK 94",
-        "Nykredit Realkredit A/S": "CK94",
-        "DLR Kredit A/S": "CK94",
-        "Realkredit Danmark A/S": 'Repayments',
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=90)
+    cache = get_download_cache() if cache is None else cache
+    offline = OFFLINE if offline is None else offline
+    known = known or {}
+    own_session = session is None
+    if own_session:
+        session = make_session(max_workers)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                company: executor.submit(fetch_latest_file, company, free_text, data_folder, start_date, end_date,
+                                         session, cache, offline, known.get(company), news_fresh_for)
+                for company, free_text in mapping.items()
+            }
+            announcements = {}
+            for company, future in futures.items():
+                try:
+                    announcement = future.result()
+                except Exception as e:
+                    print(f"Error fetching {company}: {str(e)}")
+                    continue
+                if announcement is not None:
+                    announcements[company] = announcement
+    finally:
+        if own_session:
+            session.close()
+
+    cache.evict()
+    return announcements
+
+
+def fetch_issuer_files(mapping, data_folder, max_workers=FETCH_WORKERS, session=None, cache=None, offline=None):
+    """
+    Fetches the latest file of every issuer in mapping concurrently.
+
+    Returns:
+    dict: Company -> downloaded file path, in mapping order.
+    """
+    announcements = fetch_announcements(mapping, data_folder, max_workers=max_workers, session=session,
+                                        cache=cache, offline=offline)
+    return {company: announcement['path'] for company, announcement in announcements.items()}
+
+DEBITOR_FIELDS = [
+    'restgaeld_obl',
+    'restgaeld_obl_kontant',
+    'restgaeld_kontant',
+    'kontant_rente',
+    'antal_obl_laan',
+    'antal_kontant_laan',
+    'fradrags_konto',
+    'fradrags_konto_laan',
+]
+
+TERMINATED_FIELDS = [
+    'antal_opsagte_laan',
+    'opsagt_beloeb',
+]
+
+
+class ColumnBuffer:
+    """
+    Preallocated numpy columns that rows are written into in place.
+
+    Capacity doubles when full, so a parse holds at most twice the final
+    column size instead of one Python dict per record.
+    """
+
+    def __init__(self, dtypes, capacity=1024):
+        self.size = 0
+        self.capacity = capacity
+        self.columns = {name: self._allocate(dtype, capacity) for name, dtype in dtypes.items()}
+
+    @staticmethod
+    def _allocate(dtype, capacity):
+        # Float columns start out as NaN so absent fields need no write
+        if np.dtype(dtype).kind == 'f':
+            return np.full(capacity, np.nan, dtype=dtype)
+        return np.zeros(capacity, dtype=dtype)
+
+    def append_row(self):
+        if self.size == self.capacity:
+            self.capacity *= 2
+            for name, column in self.columns.items():
+                grown = self._allocate(column.dtype, self.capacity)
+                grown[:self.size] = column[:self.size]
+                self.columns[name] = grown
+        row = self.size
+        self.size += 1
+        return row
+
+    def finish(self):
+        return {name: column[:self.size] for name, column in self.columns.items()}
+
+
+class StringCodes:
+    """Interns repeated strings (isin, laan_gruppe) as integer codes."""
+
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def categorical(self, codes):
+        """
+        codes as a pd.Categorical with sorted categories, the order
+        apply_schema() gives, so files with the same strings concatenate
+        without recoding. A None value becomes a missing value.
+        """
+        values = np.array([value for value in self.values if value is not None], dtype=object)
+        order = np.argsort(values, kind='stable')
+        rank = np.full(len(self.values), -1, dtype=np.int32)
+        rank[[code for code, value in enumerate(self.values) if value is not None]] = np.argsort(order)
+        return pd.Categorical.from_codes(rank[codes] if len(rank) else codes, categories=values[order])
+
+
+def parse_debitor_tables(file_path):
+    """
+    Streams one debitormasse file with iterparse and returns the columns of
+    its D (debtor) and I (terminated loans) blocks.
+
+    Each debitormasse element is written straight into column arrays typed
+    by snapshot_store.SCHEMAS and cleared from the tree, so memory does not
+    grow with the file's DOM.
+    Every debitormasse with a restgaeldinterval gives a debtor row; rows without
+    a D block (laan_gruppe C) keep NaN in the D columns. Only elements with an
+    I block give a terminated row.
+
+    Returns:
+    tuple: (debtor columns, terminated columns), each a dict of column name ->
+    numpy array, with isin and laan_gruppe as pd.Categorical.
+    """
+    schema = snapshot_store.SCHEMAS['debitor']
+    dtypes = {'isin': np.int32, 'laan_gruppe': np.int32, 'restgaeldinterval': schema['restgaeldinterval']}
+    dtypes.update({field: schema[field] for field in DEBITOR_FIELDS})
+    buffer = ColumnBuffer(dtypes)
+    # Parsed as float64 and narrowed by snapshot_store.apply_schema once the values are known
+    terminated_dtypes = {'isin': np.int32, 'laan_gruppe': np.int32, 'restgaeldinterval': schema['restgaeldinterval']}
+    terminated_dtypes.update({field: np.float64 for field in TERMINATED_FIELDS})
+    terminated = ColumnBuffer(terminated_dtypes, capacity=256)
+    isins = StringCodes()
+    groups = StringCodes()
+    fields = set(DEBITOR_FIELDS)
+    terminated_fields = set(TERMINATED_FIELDS)
+
+    context = ET.iterparse(file_path, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end' or elem.tag != 'debitormasse':
+            continue
+        restgaeldinterval = elem.findtext('restgaeldinterval')
+        if restgaeldinterval is None:
+            # Belongs to no interval, so the interval groupings would drop it anyway
+            root.clear()
+            continue
+        row = buffer.append_row()
+        columns = buffer.columns
+        columns['isin'][row] = isins.code(elem.findtext('isin'))
+        columns['laan_gruppe'][row] = groups.code(elem.findtext('laan_gruppe'))
+        columns['restgaeldinterval'][row] = int(restgaeldinterval)
+        D = elem.find('D')
+        if D is not None:
+            for child in D:
+                if child.tag in fields and child.text is not None:
+                    columns[child.tag][row] = float(child.text)
+        I = elem.find('I')
+        if I is not None:
+            terminated_row = terminated.append_row()
+            terminated_columns = terminated.columns
+            for key in ('isin', 'laan_gruppe', 'restgaeldinterval'):
+                terminated_columns[key][terminated_row] = columns[key][row]
+            for child in I:
+                if child.tag in terminated_fields and child.text is not None:
+                    terminated_columns[child.tag][terminated_row] = float(child.text)
+        # Drop the finished record so only one debitormasse is alive at a time
+        root.clear()
+
+    tables = (buffer.finish(), terminated.finish())
+    for columns in tables:
+        columns['isin'] = isins.categorical(columns['isin'])
+        columns['laan_gruppe'] = groups.categorical(columns['laan_gruppe'])
+    return tables
+
+
+def parse_debitor_file(file_path):
+    """
+    The debtor (D block) columns of one debitormasse file; see parse_debitor_tables.
+
+    Returns:
+    dict: Column name -> numpy array or pd.Categorical.
+    """
+    return parse_debitor_tables(file_path)[0]
+
+
+def map_files(func, file_paths, max_workers=None):
+    """
+    Calls func(file_path) for every file, in a pool of max_workers processes
+    when it is above 1 (default PARSE_WORKERS) and there is more than one file.
+
+    func must be picklable (a module-level function or a partial of one) and
+    its result is pickled back to this process, so it should be columns or
+    frames rather than per-record objects. Workers are spawned, not forked,
+    so they are safe to start from the app's refresher thread.
+
+    Yields:
+    tuple: (file path, result, exception), in file_paths order; exactly one of
+    result and exception is None.
+    """
+    file_paths = list(file_paths)
+    max_workers = PARSE_WORKERS if max_workers is None else max_workers
+    if max_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            try:
+                yield file_path, func(file_path), None
+            except Exception as e:
+                yield file_path, None, e
+        return
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths)),
+                             mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [(file_path, executor.submit(func, file_path)) for file_path in file_paths]
+        for file_path, future in futures:
+            try:
+                yield file_path, future.result(), None
+            except Exception as e:
+                yield file_path, None, e
+
+
+def concat_columns(parsed):
+    """
+    Concatenates the column dicts of several files. Categorical columns are
+    unioned on their categories instead of falling back to object strings.
+    """
+    columns = {}
+    for name, first in parsed[0].items():
+        values = [column[name] for column in parsed]
+        if isinstance(first, pd.Categorical):
+            columns[name] = union_categoricals(values, sort_categories=True)
+        else:
+            columns[name] = np.concatenate(values)
+    return columns
+
+
+def _print_parse_error(file_path, error):
+    if isinstance(error, ET.ParseError):
+        print(f"XML parsing error in file {file_path}: {str(error)}")
+    else:
+        print(f"Error loading file {file_path}: {str(error)}")
+
+
+def parse_debitor_files(file_paths, max_workers=None):
+    """
+    Parses debitormasse files into one frame, max_workers files at a time
+    (see map_files).
+    """
+    parsed = []
+    for file_path, columns, error in map_files(parse_debitor_file, file_paths, max_workers):
+        print(f"Parsing XML: {file_path}")
+        if error is not None:
+            _print_parse_error(file_path, error)
+        elif len(columns['isin']):
+            parsed.append(columns)
+
+    if not parsed:
+        return pd.DataFrame()
+    return debitor_frame(concat_columns(parsed))
+
+
+def debitor_frame(columns):
+    return snapshot_store.apply_schema(pd.DataFrame(columns), 'debitor')
+
+
+REDEMPTION_CHUNK_ROWS = 64 * 1024
+
+# Arrow schema of the streamed redemption chunks (snapshot_store adds issuer)
+REDEMPTION_ARROW_SCHEMA = pa.schema([
+    ('isin', pa.dictionary(pa.int32(), pa.string())),
+    ('terminsdato', pa.timestamp('ns')),
+    ('afdrag_belob', pa.float64()),
+    ('rente_belob', pa.float64()),
+])
+
+
+def iter_redemption_chunks(file_path, isins, chunk_rows=REDEMPTION_CHUNK_ROWS):
+    """
+    Streams one ydelsesraekke file with iterparse and yields its terms in column chunks.
+
+    Every termin is written into preallocated columns and cleared as soon as it
+    is read, and each ydelsesraekke is dropped from the tree once finished, so
+    memory is bounded by chunk_rows rather than the file size.
+
+    Parameters:
+    isins (StringCodes): Interns the ISINs; shared across calls to keep codes stable.
+    chunk_rows (int): Maximum rows per chunk.
+
+    Yields:
+    dict: isin (int32 codes into isins), terminsdato (int64 nanoseconds since
+    the epoch), afdrag_belob and rente_belob (float64).
+    """
+    dtypes = {'isin': np.int32, 'terminsdato': np.int32, 'afdrag_belob': np.float64, 'rente_belob': np.float64}
+    # Term dates repeat across ISINs, so they are interned too and converted once per distinct date
+    dates = StringCodes()
+    date_values = np.empty(0, dtype=np.int64)
+
+    def finish(buffer):
+        nonlocal date_values
+        if len(date_values) != len(dates.values):
+            date_values = pd.to_datetime(dates.values).values.view(np.int64)
+        chunk = buffer.finish()
+        chunk['terminsdato'] = date_values[chunk['terminsdato']]
+        return chunk
+
+    buffer = ColumnBuffer(dtypes, capacity=min(chunk_rows, 1024))
+    isin_code = -1
+    context = ET.iterparse(file_path, events=('start', 'end'))
+    _, root = next(context)
+    for event, elem in context:
+        if event != 'end':
+            continue
+        tag = elem.tag
+        if tag == 'termin':
+            row = buffer.append_row()
+            columns = buffer.columns
+            columns['isin'][row] = isin_code
+            columns['terminsdato'][row] = dates.code(elem.findtext('terminsdato'))
+            columns['afdrag_belob'][row] = float(elem.findtext('afdrag_belob'))
+            columns['rente_belob'][row] = float(elem.findtext('rente_belob'))
+            elem.clear()
+            if buffer.size == chunk_rows:
+                yield finish(buffer)
+                buffer = ColumnBuffer(dtypes, capacity=min(chunk_rows, 1024))
+        elif tag == 'isin':
+            isin_code = isins.code(elem.text)
+        elif tag == 'ydelsesraekke':
+            root.clear()
+    if buffer.size:
+        yield finish(buffer)
+
+
+def redemption_stream(file_path, chunk_rows=REDEMPTION_CHUNK_ROWS):
+    """
+    One redemption file as a snapshot_store.TableStream: Arrow tables are
+    produced while the file is parsed, so write_partition() writes each chunk
+    before the next one is read.
+    """
+    def tables():
+        isins = StringCodes()
+        for chunk in iter_redemption_chunks(file_path, isins, chunk_rows):
+            yield pa.table({
+                'isin': pa.DictionaryArray.from_arrays(pa.array(chunk['isin']), pa.array(isins.values, pa.string())),
+                'terminsdato': pa.array(chunk['terminsdato'].view('datetime64[ns]')),
+                'afdrag_belob': pa.array(chunk['afdrag_belob']),
+                'rente_belob': pa.array(chunk['rente_belob']),
+            }, schema=REDEMPTION_ARROW_SCHEMA)
+
+    return snapshot_store.TableStream(REDEMPTION_ARROW_SCHEMA, tables())
+
+
+def parse_redemption_columns(file_path):
+    """
+    Parses one redemption file into columns; see iter_redemption_chunks.
+
+    Returns:
+    dict: isin (pd.Categorical), terminsdato (datetime64[ns]), afdrag_belob and
+    rente_belob (float64 numpy arrays).
+    """
+    isins = StringCodes()
+    chunks = list(iter_redemption_chunks(file_path, isins))
+    columns = {
+        name: np.concatenate([chunk[name] for chunk in chunks]) if chunks else np.empty(0, dtype)
+        for name, dtype in [('isin', np.int32), ('terminsdato', np.int64), ('afdrag_belob', np.float64),
+                            ('rente_belob', np.float64)]
+    }
+    return {
+        'isin': isins.categorical(columns['isin']),
+        'terminsdato': columns['terminsdato'].view('datetime64[ns]'),
+        'afdrag_belob': columns['afdrag_belob'],
+        'rente_belob': columns['rente_belob'],
     }
 
-    mapping_short = {
-        "Jyske Realkredit A/S": "Jyske",
-        "Nordea Kredit Realkreditaktieselskab": "Nordea",
-        "Nykredit Realkredit A/S": "Nykredit",
-        "DLR Kredit A/S": "DLR",
-        "Realkredit Danmark A/S": 'RD',
+
+def parse_redemption_file(file_path):
+    """
+    Returns:
+    pd.DataFrame: One redemption file's terms; see parse_redemption_columns.
+    """
+    return pd.DataFrame(parse_redemption_columns(file_path))
+
+
+def parse_redemption_files(file_paths, max_workers=None):
+    """
+    Parses redemption files into one frame, max_workers files at a time
+    (see map_files).
+    """
+    parsed = []
+    for file_path, columns, error in map_files(parse_redemption_columns, file_paths, max_workers):
+        print(f"Parsing XML: {file_path}")
+        if error is not None:
+            _print_parse_error(file_path, error)
+        elif len(columns['isin']):
+            parsed.append(columns)
+
+    if not parsed:
+        return pd.DataFrame()
+    return snapshot_store.apply_schema(pd.DataFrame(concat_columns(parsed)), 'redemption')
+
+
+def split_file_name(file_path):
+    """'2024-06-03_Nykredit.xml' -> ('2024-06-03', 'Nykredit')"""
+    published_date, issuer = os.path.splitext(os.path.basename(file_path))[0].split('_', 1)
+    return published_date, issuer
+
+
+def store_file(dataset, parse_file, file_path, root=None, force=False):
+    """
+    Makes sure one downloaded issuer file has its snapshot partitions; see store_files.
+
+    Returns:
+    str: Path of the dataset's partition.
+    """
+    published_date, issuer = split_file_name(file_path)
+    path = snapshot_store.partition_path(dataset, issuer, published_date, root)
+    source_sha256 = _sha256(file_path)
+    stored = [snapshot_store.partition_source_hash(snapshot_store.partition_path(table, issuer, published_date, root))
+              for table in DATASET_TABLES.get(dataset, [dataset])]
+    if force or any(source_hash != source_sha256 for source_hash in stored):
+        print(f"Parsing XML: {file_path}")
+        frames = parse_file(file_path)
+        if not isinstance(frames, dict):
+            frames = {dataset: frames}
+        # The main table goes last, so its hash only matches once every table is written
+        for table in sorted(frames, key=lambda table: table == dataset):
+            snapshot_store.write_partition(frames[table], table, issuer, published_date,
+                                           source_sha256=source_sha256, root=root)
+    return path
+
+
+def store_files(dataset, file_paths, parse_file, root=None, force=False, max_workers=None):
+    """
+    Makes sure every downloaded issuer file has a snapshot partition.
+
+    A file is only parsed when one of its (issuer, publication date)
+    partitions is missing or was built from different XML content, or when
+    force is set. parse_file returns a frame or TableStream, or a dict of
+    dataset -> frame for the tables in DATASET_TABLES[dataset]; each is
+    written as its own partition.
+
+    With max_workers above 1 (default PARSE_WORKERS) files are parsed and
+    written in worker processes, which only send back the partition path;
+    parse_file must then be picklable.
+
+    Returns:
+    dict: File path -> partition path, in file_paths order; files that failed
+    to parse are left out.
+    """
+    partitions = {}
+    store = partial(store_file, dataset, parse_file, root=root, force=force)
+    for file_path, path, error in map_files(store, file_paths, max_workers):
+        if error is not None:
+            _print_parse_error(file_path, error)
+        else:
+            partitions[file_path] = path
+    return partitions
+
+
+def parse_debitor_frames(file_path):
+    """Both tables of one debitormasse file, parsed in a single pass."""
+    debitor, terminated = parse_debitor_tables(file_path)
+    return {
+        'debitor': debitor_frame(debitor),
+        'terminated': snapshot_store.apply_schema(pd.DataFrame(terminated), 'terminated'),
     }
 
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=90)
 
-    file_paths = {}
-
-    for key, value in mapping.items():
-        news = get_news(
-            free_text=value,
-            from_date=start_date,
-            to_date=end_date,
-            company=key,
-            market="Main Market, Copenhagen"
-        )
-
-        if news and 'results' in news and 'item' in news['results'] and news['results']['item']:
-            attachments = news['results']['item'][0]['attachment']
-            # Find the XML attachment
-            xml_attachment = next((att for att in attachments if att['mimetype'] in ['text/xml', 'application/octet-stream']), None)
-            attachment_url = xml_attachment['attachmentUrl']
-            
-            published_date = str(pd.to_datetime(news['results']['item'][0]['published']).strftime('%Y-%m-%d'))
-            file_name = f"{published_date}_{mapping_short[key]}.xml"
-            save_path = os.path.join(data_folder, file_name)
-            download_xml(attachment_url, save_path)
-            file_paths[key] = save_path
-
-    all_data = []
-
-    for company, file_path in file_paths.items():
-        try:
-            print(f"Parsing XML: {file_path}")
-
-            # Attempt to parse the XML file
-            tree = ET.parse(file_path)
-            root = tree.getroot()
-
-            # Loop through each ydelsesraekke element
-            for ydelsesraekke in root.findall('ydelsesraekke'):
-                isin = ydelsesraekke.find('isin').text
-
-                # Loop through each termin element within terminer
-                for termin in ydelsesraekke.find('terminer').findall('termin'):
-                    record = {
-                        'isin': isin,
-                        'terminsdato': termin.find('terminsdato').text,
-                        'afdrag_belob': float(termin.find('afdrag_belob').text),
-                        'rente_belob': float(termin.find('rente_belob').text)
-                    }
-                    all_data.append(record)
-        except ET.ParseError as e:
-            print(f"XML parsing error in file {file_path}: {str(e)}")
-        except Exception as e:
-            print(f"Error loading file {file_path}: {str(e)}")
-    
-    return pd.DataFrame(all_data)
+# Dataset name -> (issuer search mapping, download folder, parser). A parser returns
+# a frame or a snapshot_store.TableStream, or a dict of dataset -> frame to store
+# extra tables from the same file
+DATASETS = {
+    'debitor': (DEBITOR_MAPPING, "./Data", parse_debitor_frames),
+    'redemption': (REDEMPTION_MAPPING, "./Data/Redemption", redemption_stream),
+}
+
+# Tables stored alongside each dataset's partitions
+DATASET_TABLES = {
+    'debitor': ['debitor', 'terminated'],
+    'redemption': ['redemption'],
+}
+
+
+def fetch_partitions(dataset, session=None):
+    mapping, data_folder, parse_file = DATASETS[dataset]
+    file_paths = fetch_issuer_files(mapping, data_folder, session=session)
+    return list(store_files(dataset, file_paths.values(), parse_file).values())
+
+
+def fetch_debitor_partitions(session=None):
+    return fetch_partitions('debitor', session)
+
+
+def fetch_redemption_partitions(session=None):
+    return fetch_partitions('redemption', session)
+
+
+def load_xml(session=None):
+    return snapshot_store.read_snapshot(fetch_debitor_partitions(session))
+
+
+def load_xml_redemption(session=None):
+    return snapshot_store.read_snapshot(fetch_redemption_partitions(session))
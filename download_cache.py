@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+
+
+def _remove(path):
+    # Another worker sharing the cache may have removed it first
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a URL has never been downloaded."""
+
+
+class DownloadCache:
+    """
+    Content-addressed on-disk cache for downloaded announcements.
+
+    Layout under root:
+        objects/<sha256>   the downloaded bytes, stored once per distinct content
+        entries/<sha1>.json one entry per URL (or key): sha256, ETag, Last-Modified, timestamps
+
+    Every file is written to a temporary name and renamed into place, so several
+    Streamlit workers can share one cache directory without locking. An entry
+    younger than fresh_for seconds is served without touching the network; an
+    older one is revalidated with If-None-Match / If-Modified-Since.
+    """
+
+    def __init__(self, root, fresh_for=0, max_bytes=None, max_age=None):
+        self.root = root
+        self.fresh_for = fresh_for
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'entries'), exist_ok=True)
+
+    @staticmethod
+    def cache_url(url, params=None):
+        """The canonical URL (query string included) an entry is keyed by."""
+        return requests.Request('GET', url, params=params).prepare().url
+
+    def _entry_path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.root, 'entries', f"{name}.json")
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, 'objects', digest)
+
+    def _write_atomic(self, path, data):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def lookup(self, key):
+        try:
+            with open(self._entry_path(key)) as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(self.blob_path(entry['sha256'])):
+            return None
+        return entry
+
+    def _save_entry(self, key, entry):
+        self._write_atomic(self._entry_path(key), json.dumps(entry).encode('utf-8'))
+
+    def _store(self, key, url, content, headers):
+        digest = hashlib.sha256(content).hexdigest()
+        if not os.path.exists(self.blob_path(digest)):
+            self._write_atomic(self.blob_path(digest), content)
+        now = time.time()
+        entry = {
+            'url': url,
+            'sha256': digest,
+            'size': len(content),
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified'),
+            'fetched_at': now,
+            'last_used': now,
+        }
+        self._save_entry(key, entry)
+        return entry
+
+    def get(self, url, params=None, key=None, session=None, offline=False, fresh_for=None, timeout=30):
+        """
+        Returns the cache entry for url, downloading or revalidating it as needed.
+
+        key defaults to the full request URL; pass a stable key when the query
+        carries volatile parameters such as a moving date window. In offline
+        mode only the cache is consulted and CacheMiss is raised for unknown
+        keys. HTTP errors propagate as requests.HTTPError.
+        """
+        url = self.cache_url(url, params)
+        key = url if key is None else key
+        fresh_for = self.fresh_for if fresh_for is None else fresh_for
+        entry = self.lookup(key)
+
+        if offline:
+            if entry is None:
+                raise CacheMiss(key)
+            return self._touch(key, entry)
+
+        if entry is not None and time.time() - entry['fetched_at'] < fresh_for:
+            return self._touch(key, entry)
+
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        response = (session or requests).get(url, headers=headers, timeout=timeout)
+        if response.status_code == 304 and entry is not None:
+            entry['fetched_at'] = time.time()
+            return self._touch(key, entry)
+        response.raise_for_status()
+        return self._store(key, url, response.content, response.headers)
+
+    def _touch(self, key, entry):
+        entry['last_used'] = time.time()
+        self._save_entry(key, entry)
+        return entry
+
+    def read(self, entry):
+        with open(self.blob_path(entry['sha256']), 'rb') as file:
+            return file.read()
+
+    def evict(self, max_bytes=None, max_age=None):
+        """
+        Drops entries unused for max_age seconds, then least recently used
+        entries until the stored objects fit in max_bytes. Objects no longer
+        referenced by any entry are deleted.
+
+        Returns:
+        int: Number of entries removed.
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+
+        with self._lock:
+            entries_dir = os.path.join(self.root, 'entries')
+            entries = []
+            for name in os.listdir(entries_dir):
+                path = os.path.join(entries_dir, name)
+                try:
+                    with open(path) as file:
+                        entries.append((path, json.load(file)))
+                except (OSError, ValueError):
+                    continue
+
+            now = time.time()
+            entries.sort(key=lambda item: item[1]['last_used'])
+            keep = []
+            removed = 0
+            for path, entry in entries:
+                if max_age is not None and now - entry['last_used'] > max_age:
+                    _remove(path)
+                    removed += 1
+                else:
+                    keep.append((path, entry))
+
+            if max_bytes is not None:
+                sizes = {entry['sha256']: entry['size'] for _, entry in keep}
+                total = sum(sizes.values())
+                while keep and total > max_bytes:
+                    path, entry = keep.pop(0)
+                    _remove(path)
+                    removed += 1
+                    if not any(other['sha256'] == entry['sha256'] for _, other in keep):
+                        total -= sizes.pop(entry['sha256'])
+
+            referenced = {entry['sha256'] for _, entry in keep}
+            objects_dir = os.path.join(self.root, 'objects')
+            for name in os.listdir(objects_dir):
+                if name not in referenced and not name.startswith('.tmp-'):
+                    _remove(os.path.join(objects_dir, name))
+
+        return removed
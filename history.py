@@ -0,0 +1,232 @@
+"""
+Debtor distributions across publication dates.
+
+Every issuer file ever parsed stays in the snapshot store as its own
+<issuer>/<published date> partition; nothing there is overwritten by a newer
+publication. This module condenses those partitions into one small history
+table with a row per (isin, published, restgaeldinterval), stored sorted by
+isin and date in history/debitor.parquet so an ISIN's series is a pushed-down
+read of a few row groups. Partitions are summarised once; later updates only
+add the partitions that are new or were rebuilt from different XML.
+"""
+import contextlib
+import glob
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import data_loader
+import snapshot_store
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are not serialized
+    fcntl = None
+
+HISTORY_KEYS = ['isin', 'published', 'restgaeldinterval']
+PARTITIONS_KEY = b'partitions'
+BACKFILL_DAYS = 3 * 365
+
+
+def history_path(root=None):
+    return os.path.join(root or snapshot_store.STORE_DIR, 'history', 'debitor.parquet')
+
+
+def _partition_key(path):
+    """'<root>/debitor/Nykredit/2024-06-03.parquet' -> 'Nykredit/2024-06-03'"""
+    issuer = os.path.basename(os.path.dirname(path))
+    return f"{issuer}/{os.path.splitext(os.path.basename(path))[0]}"
+
+
+def summarize_partition(path):
+    """
+    Restgaeld and loan counts per (isin, restgaeldinterval) of one debtor partition.
+
+    Returns:
+    pd.DataFrame: Columns isin, published, restgaeldinterval, issuer, restgaeld, antal_laan, partition.
+    """
+    df = snapshot_store.read_snapshot([path], columns=['isin', 'restgaeldinterval', 'restgaeld_obl',
+                                                       'restgaeld_obl_kontant', 'antal_obl_laan',
+                                                       'antal_kontant_laan'], categorical=False)
+    df['restgaeld'] = df['restgaeld_obl'] + df['restgaeld_obl_kontant']
+    df['antal_laan'] = df['antal_obl_laan'] + df['antal_kontant_laan']
+    summary = df.groupby(['isin', 'restgaeldinterval'])[['restgaeld', 'antal_laan']].sum().reset_index()
+
+    key = _partition_key(path)
+    issuer, published_date = key.split('/')
+    summary.insert(1, 'published', pd.Timestamp(published_date).as_unit('ns'))
+    summary['issuer'] = issuer
+    summary['partition'] = key
+    return summary
+
+
+def read_history(isins=None, root=None):
+    """
+    Reads the history table, optionally only the rows of some ISINs.
+
+    Returns:
+    pd.DataFrame: Sorted by isin, published and restgaeldinterval.
+    """
+    path = history_path(root)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=HISTORY_KEYS + ['issuer', 'restgaeld', 'antal_laan', 'partition'])
+    filters = [('isin', 'in', list(isins))] if isins is not None else None
+    df = pq.read_table(path, filters=filters, memory_map=True).to_pandas()
+    for column in ['isin', 'issuer', 'partition']:
+        df[column] = df[column].astype(object)
+    df['published'] = df['published'].astype('datetime64[ns]')
+    return df
+
+
+@contextlib.contextmanager
+def _history_lock(root=None):
+    """
+    Holds an exclusive lock on history/debitor.lock, so a CLI refresh and the
+    app's refresher update the history table one after the other instead of
+    each writing its own read of it.
+    """
+    lock_path = os.path.join(os.path.dirname(history_path(root)), 'debitor.lock')
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _summarized_partitions(root=None):
+    try:
+        metadata = pq.read_schema(history_path(root), memory_map=True).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return {}
+    return json.loads(metadata.get(PARTITIONS_KEY, b'{}'))
+
+
+def update_history(root=None):
+    """
+    Adds every debtor partition not yet in the history table.
+
+    A partition rebuilt from different XML (same issuer and date) replaces
+    its earlier rows. Concurrent updates (e.g. refresh.py next to the app)
+    wait for each other, so neither loses the other's partitions.
+
+    Returns:
+    list: Keys ('<issuer>/<date>') of the partitions that were added.
+    """
+    with _history_lock(root):
+        return _update_history(root)
+
+
+def _update_history(root=None):
+    summarized = _summarized_partitions(root)
+    partitions = sorted(glob.glob(os.path.join(root or snapshot_store.STORE_DIR, 'debitor', '*', '*.parquet')))
+    current = {_partition_key(path): (path, snapshot_store.partition_source_hash(path)) for path in partitions}
+    added = [key for key, (_, source_hash) in current.items() if summarized.get(key) != source_hash]
+    if not added:
+        return []
+
+    history = read_history(root=root)
+    history = history[~history['partition'].isin(added)]
+    frames = [history] if len(history) else []
+    frames += [summarize_partition(current[key][0]) for key in added]
+    history = pd.concat(frames, ignore_index=True).sort_values(HISTORY_KEYS, kind='stable')
+    for column in ['isin', 'issuer', 'partition']:
+        history[column] = history[column].astype('category')
+
+    summarized.update({key: current[key][1] for key in added})
+    table = pa.Table.from_pandas(history, preserve_index=False)
+    table = table.replace_schema_metadata({**(table.schema.metadata or {}),
+                                           PARTITIONS_KEY: json.dumps(summarized, sort_keys=True).encode('utf-8')})
+    path = history_path(root)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.parquet')
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, row_group_size=snapshot_store.ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    print(f"History updated: {', '.join(added)}")
+    return added
+
+
+def interval_share_history(history, isins, intervals=(7,), last_n=None):
+    """
+    Share of each ISIN's restgaeld held in the given restgaeldintervals, per publication.
+
+    Parameters:
+    history (pd.DataFrame): read_history() rows.
+    isins (list): ISINs to include.
+    intervals (iterable): restgaeldinterval values to add up; 7 is +50m.
+    last_n (int): Keep only each ISIN's last_n publications.
+
+    Returns:
+    pd.DataFrame: Columns isin, published, share (percent) and restgaeld, sorted by isin and published.
+    """
+    history = history[history['isin'].isin(list(isins))]
+    in_intervals = history['restgaeld'].where(history['restgaeldinterval'].isin(list(intervals)), 0)
+    grouped = history.assign(in_intervals=in_intervals).groupby(['isin', 'published'])
+    series = grouped[['restgaeld', 'in_intervals']].sum().reset_index()
+    series['share'] = (series['in_intervals'] / series['restgaeld'] * 100).where(series['restgaeld'] != 0, 0)
+    if last_n is not None:
+        series = series.groupby('isin').tail(last_n)
+    return series[['isin', 'published', 'share', 'restgaeld']].reset_index(drop=True)
+
+
+def backfill(days=BACKFILL_DAYS, limit=100, session=None, cache=None, offline=None):
+    """
+    Downloads every debtor file published in the last days, not just the newest
+    one per issuer, and adds them to the snapshot store and the history table.
+
+    Returns:
+    list: Keys of the partitions added to the history table.
+    """
+    mapping, data_folder, parse_file = data_loader.DATASETS['debitor']
+    os.makedirs(data_folder, exist_ok=True)
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=days)
+    cache = data_loader.get_download_cache() if cache is None else cache
+    offline = data_loader.OFFLINE if offline is None else offline
+    own_session = session is None
+    if own_session:
+        session = data_loader.make_session()
+
+    def fetch_issuer(company, free_text):
+        news = data_loader.get_news(free_text=free_text, from_date=start_date, to_date=end_date, company=company,
+                                    market=data_loader.MARKET, session=session, cache=cache, offline=offline,
+                                    limit=limit)
+        file_paths = []
+        for item in ((news or {}).get('results') or {}).get('item') or []:
+            attachment = data_loader.announcement_file(company, item, data_folder)
+            if attachment is None or attachment[1] in file_paths:
+                continue
+            try:
+                data_loader.download_xml(attachment[0], attachment[1], session=session, cache=cache, offline=offline)
+            except Exception as e:
+                print(f"Error fetching {attachment[1]}: {str(e)}")
+                continue
+            file_paths.append(attachment[1])
+        return file_paths
+
+    try:
+        with ThreadPoolExecutor(max_workers=data_loader.FETCH_WORKERS) as executor:
+            futures = [executor.submit(fetch_issuer, company, free_text) for company, free_text in mapping.items()]
+            file_paths = [path for future in futures for path in future.result()]
+    finally:
+        if own_session:
+            session.close()
+
+    data_loader.store_files('debitor', file_paths, parse_file)
+    return update_history()
+
+
+if __name__ == "__main__":
+    print(backfill())
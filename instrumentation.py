@@ -0,0 +1,193 @@
+"""
+Timing spans and cache counters for the app and the refresh jobs.
+
+Wrap a block in span() or a function in timed() and every call is added to
+process-wide totals (count, total and max seconds per span name). The spans
+of one Streamlit rerun are also collected by start_run()/finish_run(), which
+the debug sidebar panel shows. cached() wraps a st.cache_data-style decorator
+and counts hits and misses per function.
+
+Results can be exported as JSON lines (TRACE_LOG, one object per span) and as a
+Prometheus text file (METRICS_FILE) for a node-exporter textfile collector.
+Nothing here imports Streamlit, so the CLI and refresh jobs can use it too.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+TRACE_LOG = os.environ.get('DEBITOR_TRACE_LOG')
+METRICS_FILE = os.environ.get('DEBITOR_METRICS_FILE')
+DEBUG_PANEL = os.environ.get('DEBITOR_DEBUG', '') == '1'
+
+_lock = threading.Lock()
+_spans = defaultdict(lambda: {'count': 0, 'total': 0.0, 'max': 0.0})
+_cache = defaultdict(lambda: {'hit': 0, 'miss': 0})
+# Spans of the rerun running on this thread; Streamlit runs each session's script on its own thread
+_run = threading.local()
+
+
+def _record(name, start, seconds, labels):
+    with _lock:
+        stats = _spans[name]
+        stats['count'] += 1
+        stats['total'] += seconds
+        stats['max'] = max(stats['max'], seconds)
+    events = getattr(_run, 'events', None)
+    if events is not None:
+        events.append({'name': name, 'start': start, 'seconds': seconds, 'depth': _run.depth, **labels})
+    if TRACE_LOG:
+        line = json.dumps({'ts': time.time(), 'span': name, 'seconds': round(seconds, 6), 'pid': os.getpid(), **labels})
+        with _lock, open(TRACE_LOG, 'a', encoding='utf-8') as file:
+            file.write(line + '\n')
+
+
+@contextmanager
+def span(name, **labels):
+    """
+    Times the block. labels are extra fields for the run view and the trace
+    log; the block can add more to the dict the span yields.
+
+    Spans opened inside another span on the same thread are recorded with a
+    greater depth, so the run view reads as a tree.
+    """
+    depth = getattr(_run, 'depth', 0)
+    _run.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        _run.depth = depth
+        _record(name, start, time.perf_counter() - start, labels)
+
+
+def timed(name=None):
+    """Decorator form of span(); the span name defaults to the function name."""
+    def decorate(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def count_cache(name, result):
+    """Counts one cache lookup of name; result is 'hit' or 'miss'."""
+    with _lock:
+        _cache[name][result] += 1
+
+
+def cached(cache, name=None):
+    """
+    Wraps a caching decorator (e.g. st.cache_data(...)) so every call is timed
+    as a span, hashing and lookup included, and counted as a hit or a miss.
+
+    The function body only runs on a miss, so a call that does not reach it
+    was served from the cache.
+    """
+    def decorate(func):
+        span_name = name or func.__name__
+        misses = threading.local()
+
+        @functools.wraps(func)
+        def compute(*args, **kwargs):
+            misses.missed = True
+            return func(*args, **kwargs)
+
+        cached_func = cache(compute)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            misses.missed = False
+            with span(span_name) as labels:
+                result = cached_func(*args, **kwargs)
+                labels['cache'] = 'miss' if misses.missed else 'hit'
+            count_cache(span_name, labels['cache'])
+            return result
+
+        wrapper.clear = getattr(cached_func, 'clear', None)
+        return wrapper
+    return decorate
+
+
+def start_run():
+    """Starts collecting this thread's spans, e.g. at the top of a Streamlit rerun."""
+    _run.events = []
+    _run.depth = 0
+
+
+def finish_run():
+    """
+    Stops collecting and writes METRICS_FILE when it is set.
+
+    Returns:
+    list: The run's spans as dicts with name, start, seconds and depth, in the order they started.
+    """
+    events = sorted(getattr(_run, 'events', None) or [], key=lambda event: event['start'])
+    _run.events = None
+    if METRICS_FILE:
+        write_prometheus(METRICS_FILE)
+    return events
+
+
+def snapshot():
+    """
+    Returns:
+    tuple: (span name -> {'count', 'total', 'max'}, cache name -> {'hit', 'miss'}), copied.
+    """
+    with _lock:
+        return ({name: dict(stats) for name, stats in _spans.items()},
+                {name: dict(counts) for name, counts in _cache.items()})
+
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _cache.clear()
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text():
+    """The totals in the Prometheus text exposition format."""
+    spans, cache = snapshot()
+    lines = [
+        '# HELP debitor_span_seconds Time spent in instrumented spans.',
+        '# TYPE debitor_span_seconds summary',
+    ]
+    for name, stats in sorted(spans.items()):
+        lines.append(f'debitor_span_seconds_sum{{span="{_label(name)}"}} {stats["total"]:.6f}')
+        lines.append(f'debitor_span_seconds_count{{span="{_label(name)}"}} {stats["count"]}')
+    lines += [
+        '# HELP debitor_span_seconds_max Longest single span.',
+        '# TYPE debitor_span_seconds_max gauge',
+    ]
+    lines += [f'debitor_span_seconds_max{{span="{_label(name)}"}} {stats["max"]:.6f}'
+              for name, stats in sorted(spans.items())]
+    lines += [
+        '# HELP debitor_cache_requests_total Cached function calls by result.',
+        '# TYPE debitor_cache_requests_total counter',
+    ]
+    for name, counts in sorted(cache.items()):
+        for result in ('hit', 'miss'):
+            lines.append(f'debitor_cache_requests_total{{function="{_label(name)}",result="{result}"}} {counts[result]}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path):
+    """Writes prometheus_text() to path in one atomic replace."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(prometheus_text())
+    os.replace(tmp_path, path)
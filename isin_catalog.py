@@ -0,0 +1,128 @@
+"""
+A catalog of a snapshot's ISINs for the ISIN pickers.
+
+IsinCatalog is built once per snapshot, next to the metrics cube and the
+CashflowTable. It holds one entry per ISIN (issuer, total restgæld, maturity),
+sorted by ISIN so a prefix is a binary search, plus each issuer's positions
+and a ranking by restgæld. search() filters and ranks on the server, so a
+picker only gets the few dozen ISINs that match instead of every ISIN of
+every issuer.
+"""
+import re
+import numpy as np
+import pandas as pd
+
+SEARCH_LIMIT = 50
+
+
+class IsinCatalog:
+    """
+    Attributes:
+    isins (np.ndarray): Sorted ISINs.
+    issuer (np.ndarray): Issuer of each ISIN.
+    restgaeld (np.ndarray): Total restgæld per ISIN; NaN when the snapshot has none.
+    maturity (np.ndarray): Last payment date per ISIN (datetime64); NaT when the snapshot has none.
+    issuers (list): The issuers, sorted.
+    """
+
+    def __init__(self, isins, issuer, restgaeld, maturity):
+        self.isins = isins
+        self.issuer = issuer
+        self.restgaeld = restgaeld
+        self.maturity = maturity
+        self.issuers = sorted(set(issuer))
+        self._issuer_positions = {name: np.flatnonzero(issuer == name) for name in self.issuers}
+        # rank[position] orders ISINs by restgæld, largest first, then by ISIN
+        order = np.lexsort((np.arange(len(isins)), -np.nan_to_num(restgaeld, nan=-np.inf)))
+        self._rank = np.empty(len(isins), dtype=np.int64)
+        self._rank[order] = np.arange(len(isins))
+
+    @classmethod
+    def _from_groups(cls, grouped):
+        # A categorical index would sort by category code, not by ISIN
+        grouped = grouped.set_axis(grouped.index.astype(str)).sort_index()
+        return cls(grouped.index.to_numpy(dtype=object), grouped['issuer'].to_numpy(dtype=object),
+                   grouped['restgaeld'].to_numpy(dtype=np.float64),
+                   grouped['maturity'].to_numpy(dtype='datetime64[ns]'))
+
+    @classmethod
+    def from_debitor(cls, df):
+        """
+        Catalog of a debtor snapshot: restgæld is restgaeld_obl + restgaeld_obl_kontant,
+        the total the metrics cube and the Summary table use; maturity is unknown.
+        """
+        df = df[['isin', 'issuer']].assign(restgaeld=df['restgaeld_obl'] + df['restgaeld_obl_kontant'])
+        grouped = df.groupby('isin', observed=True).agg(issuer=('issuer', 'first'), restgaeld=('restgaeld', 'sum'))
+        grouped['maturity'] = pd.NaT
+        return cls._from_groups(grouped)
+
+    @classmethod
+    def from_redemption(cls, df):
+        """
+        Catalog of a redemption snapshot: restgæld is the sum of the remaining
+        afdrag_belob and maturity the last terminsdato.
+        """
+        grouped = df.groupby('isin', observed=True).agg(issuer=('issuer', 'first'), restgaeld=('afdrag_belob', 'sum'),
+                                                        maturity=('terminsdato', 'max'))
+        return cls._from_groups(grouped)
+
+    @classmethod
+    def from_history(cls, history):
+        """Catalog of the publication history: restgæld as of each ISIN's latest publication."""
+        latest = history[history['published'] == history.groupby('isin', observed=True)['published'].transform('max')]
+        grouped = latest.groupby('isin', observed=True).agg(issuer=('issuer', 'first'), restgaeld=('restgaeld', 'sum'))
+        grouped['maturity'] = pd.NaT
+        return cls._from_groups(grouped)
+
+    def __len__(self):
+        return len(self.isins)
+
+    def __contains__(self, isin):
+        position = np.searchsorted(self.isins, isin)
+        return position < len(self.isins) and self.isins[position] == isin
+
+    def _prefix_positions(self, prefix):
+        start = np.searchsorted(self.isins, prefix, side='left')
+        # Every string starting with prefix sorts before prefix + the largest code point
+        stop = np.searchsorted(self.isins, prefix + '\U0010ffff', side='left')
+        return np.arange(start, stop)
+
+    def search(self, query='', issuers=None, maturity_years=None, limit=SEARCH_LIMIT):
+        """
+        Finds ISINs by prefix, issuer and maturity, largest restgæld first.
+
+        Parameters:
+        query (str): ISIN prefixes separated by spaces, commas or semicolons
+        (case-insensitive), e.g. 'DK00095' or a column of ISINs pasted from Excel.
+        An empty query matches every ISIN.
+        issuers (list): Keep only these issuers; None or empty keeps all.
+        maturity_years (tuple): (first, last) year the last payment falls in;
+        ISINs without a maturity are left out when it is given.
+        limit (int): Most ISINs to return; raised to the number of prefixes
+        so a pasted list is returned whole.
+
+        Returns:
+        tuple: (list of ISINs, number of ISINs that matched before the limit).
+        """
+        prefixes = [token for token in re.split(r'[\s,;]+', query.upper()) if token]
+        if prefixes:
+            positions = np.unique(np.concatenate([self._prefix_positions(prefix) for prefix in prefixes]))
+        else:
+            positions = np.arange(len(self.isins))
+        if issuers:
+            positions = np.intersect1d(positions, np.concatenate([self._issuer_positions.get(name, np.empty(0, np.int64))
+                                                                   for name in issuers]))
+        if maturity_years is not None:
+            years = self.maturity[positions].astype('datetime64[Y]').astype(np.int64) + 1970
+            known = ~np.isnat(self.maturity[positions])
+            positions = positions[known & (years >= maturity_years[0]) & (years <= maturity_years[1])]
+        ranked = positions[np.argsort(self._rank[positions], kind='stable')]
+        return self.isins[ranked[:max(limit, len(prefixes))]].tolist(), len(ranked)
+
+    def maturity_years(self):
+        """(first, last) maturity year in the catalog, or None when no maturity is known."""
+        known = self.maturity[~np.isnat(self.maturity)]
+        if not len(known):
+            return None
+        years = known.astype('datetime64[Y]').astype(np.int64) + 1970
+        return int(years.min()), int(years.max())
@@ -0,0 +1,134 @@
+"""
+Batched per-ISIN metrics over a snapshot, for notebooks, the CLI and reports.
+
+IsinQuery answers "these metrics for these ISINs" in one call: the ISINs are
+looked up once in ISIN-sorted indexes (the metrics cube's rows and the
+CashflowTable's schedules), and every metric is computed over that one
+slice with the same metrics_cube/cashflows functions the app uses. Nothing
+here imports Streamlit:
+
+    import isin_query
+    query = isin_query.IsinQuery.load()
+    report = query.compare(isins, ['totals', 'intervals', 'redemption'])
+"""
+import numpy as np
+import pandas as pd
+import metrics_cube
+
+# Metric groups compare() can return; each adds one or more columns per ISIN
+METRICS = ['totals', 'shares', 'intervals', 'avg_loan_size', 'prepayment', 'redemption']
+DEBITOR_METRICS = {'totals', 'shares', 'intervals', 'avg_loan_size', 'prepayment'}
+
+
+class IsinQuery:
+    """
+    Attributes:
+    cube (pd.DataFrame): The debtor metrics cube, sorted by isin; None without debtor data.
+    terminated (pd.DataFrame): The terminated loans; None or empty when not loaded.
+    cashflows (cashflows.CashflowTable): The redemption schedules; None without redemption data.
+    """
+
+    def __init__(self, cube=None, terminated=None, cashflows=None):
+        self.cube = cube
+        self.terminated = terminated
+        self.cashflows = cashflows
+        if cube is not None:
+            # Row offsets of every ISIN in the sorted cube: ISIN i owns rows offsets[i]:offsets[i + 1]
+            cube_isins = cube.index.get_level_values('isin').to_numpy(dtype=object)
+            starts = np.flatnonzero(np.r_[True, cube_isins[1:] != cube_isins[:-1]])[:len(cube_isins)]
+            self._isins = cube_isins[starts]
+            self._offsets = np.append(starts, len(cube_isins))
+
+    @classmethod
+    def from_handles(cls, debitor=None, redemption=None):
+        """Builds a query from loaded SnapshotHandles (as the app and cli.load_snapshot() hold them)."""
+        return cls(debitor.cube if debitor is not None else None,
+                   debitor.terminated if debitor is not None else None,
+                   redemption.cashflows if redemption is not None else None)
+
+    @classmethod
+    def load(cls):
+        """Reads the current snapshot from the store with the loaders the app uses (see snapshots.py)."""
+        import refresh
+        import snapshots
+
+        return cls.from_handles(snapshots.load_debitor(refresh.snapshot_partitions('debitor')),
+                                snapshots.load_redemption(refresh.snapshot_partitions('redemption')))
+
+    def cube_rows(self, isins):
+        """
+        The cube rows of the given ISINs, found by binary search in the sorted
+        ISIN index; unknown ISINs are skipped.
+
+        Returns:
+        pd.DataFrame: A slice of the cube, sorted by isin.
+        """
+        isins = np.asarray(list(dict.fromkeys(isins)), dtype=object)
+        positions = np.searchsorted(self._isins, isins)
+        known = positions < len(self._isins)
+        known[known] = self._isins[positions[known]] == isins[known]
+        positions = np.sort(positions[known])
+        starts = self._offsets[positions]
+        counts = self._offsets[positions + 1] - starts
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+        return self.cube.iloc[rows]
+
+    def _debitor_metrics(self, isins, metrics):
+        sliced = self.cube_rows(isins)
+        frames = []
+        if 'totals' in metrics or 'shares' in metrics:
+            totals = metrics_cube.isin_totals(sliced)
+            if 'totals' in metrics:
+                sums = sliced[['restgaeld', 'antal_laan']].groupby(level='isin').sum()
+                frames.append(totals[['restgaeld_obl', 'restgaeld_obl_kontant']].join(sums))
+            if 'shares' in metrics:
+                frames.append(totals[['share_obl', 'share_kontant', 'share_a', 'share_b']])
+        if 'intervals' in metrics:
+            distribution = metrics_cube.interval_distribution(sliced).drop(columns='total')
+            distribution = distribution.reindex(columns=list(metrics_cube.INTERVAL_LABELS), fill_value=0)
+            frames.append(distribution.rename(columns=metrics_cube.INTERVAL_LABELS))
+        if 'avg_loan_size' in metrics:
+            sums = sliced[['restgaeld', 'antal_laan', 'restgaeld_obl', 'antal_obl_laan', 'restgaeld_obl_kontant',
+                           'antal_kontant_laan']].groupby(level='isin').sum()
+            with np.errstate(divide='ignore', invalid='ignore'):
+                frames.append(pd.DataFrame({
+                    'avg_loan_size': sums['restgaeld'] / sums['antal_laan'],
+                    'avg_obl_loan_size': sums['restgaeld_obl'] / sums['antal_obl_laan'],
+                    'avg_kontant_loan_size': sums['restgaeld_obl_kontant'] / sums['antal_kontant_laan'],
+                }).replace([np.inf, -np.inf], np.nan))
+        if 'prepayment' in metrics and self.terminated is not None and not self.terminated.empty:
+            pressure = metrics_cube.prepayment_pressure(sliced, self.terminated, isins)
+            # ISINs without terminations have none, rather than unknown, pressure
+            isin_index = sliced.index.get_level_values('isin').unique()
+            frames.append(pressure[['antal_opsagte_laan', 'opsagt_beloeb', 'pressure']].reindex(isin_index, fill_value=0))
+        return frames
+
+    def compare(self, isins, metrics=None):
+        """
+        The requested metrics for a batch of ISINs, side by side.
+
+        Parameters:
+        isins (list): ISINs, in the order the rows should come back.
+        metrics (list): Names from METRICS; all of them when None. Debtor
+        metrics are left out without debtor data, 'redemption' without
+        redemption schedules, and 'prepayment' without terminated loans.
+
+        Returns:
+        pd.DataFrame: Indexed by isin in the given order, one column per value;
+        ISINs a dataset does not cover have NaN in its columns.
+        """
+        metrics = METRICS if metrics is None else list(metrics)
+        unknown = [metric for metric in metrics if metric not in METRICS]
+        if unknown:
+            raise ValueError(f"Unknown metrics {unknown}; choose from {METRICS}")
+
+        isins = list(dict.fromkeys(isins))
+        frames = []
+        if self.cube is not None and DEBITOR_METRICS.intersection(metrics):
+            frames += self._debitor_metrics(isins, set(metrics))
+        if 'redemption' in metrics and self.cashflows is not None:
+            frames.append(self.cashflows.summary(isins))
+        report = pd.concat(frames, axis=1) if frames else pd.DataFrame()
+        report = report.reindex(isins)
+        report.index.name = 'isin'
+        return report
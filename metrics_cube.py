@@ -0,0 +1,207 @@
+"""
+Market-wide metrics cube, built once per debtor snapshot.
+
+The cube holds one row per (isin, laan_gruppe, restgaeldinterval) with the
+summed amounts and loan counts plus derived shares and averages. Everything
+the Large Loans page and the Summary tab show is a lookup or a slice of it,
+apart from the prepayment pressure, which also reads the terminated table.
+"""
+import contextlib
+import glob
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import snapshot_store
+
+CUBE_KEYS = ['isin', 'laan_gruppe', 'restgaeldinterval']
+INTERVAL_LABELS = {1: "0-200k", 2: "200k-500k", 3: "500k-1m", 4: "1-3m", 5: "3-10m", 6: "10-50m", 7: "+50m"}
+SUM_COLUMNS = ['restgaeld_obl', 'restgaeld_obl_kontant', 'antal_obl_laan', 'antal_kontant_laan']
+
+
+def build_cube(df):
+    """
+    Aggregates a debtor frame into the cube.
+
+    Returns:
+    pd.DataFrame: Indexed by (isin, laan_gruppe, restgaeldinterval), sorted.
+    """
+    cube = df.groupby(CUBE_KEYS, observed=True)[SUM_COLUMNS].sum()
+    cube['rows'] = df.groupby(CUBE_KEYS, observed=True).size()
+    cube.index = cube.index.set_levels(
+        [level.astype(object) if level.dtype == 'category' else level for level in cube.index.levels]
+    )
+    cube = cube.sort_index()
+
+    cube['restgaeld'] = cube['restgaeld_obl'] + cube['restgaeld_obl_kontant']
+    cube['antal_laan'] = cube['antal_obl_laan'] + cube['antal_kontant_laan']
+    isin_total = cube['restgaeld'].groupby(level='isin').transform('sum')
+    cube['share_of_isin'] = (cube['restgaeld'] / isin_total * 100).where(isin_total != 0, 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cube['avg_loan_size'] = cube['restgaeld'] / cube['antal_laan']
+        cube['avg_obl_loan_size'] = cube['restgaeld_obl'] / cube['antal_obl_laan']
+        cube['avg_kontant_loan_size'] = cube['restgaeld_obl_kontant'] / cube['antal_kontant_laan']
+    cube.replace([np.inf, -np.inf], np.nan, inplace=True)
+    return cube
+
+
+def cube_path(version, root=None):
+    return os.path.join(root or snapshot_store.STORE_DIR, 'cube', f"{version}.parquet")
+
+
+def load_cube(partitions, df=None, root=None):
+    """
+    Returns the cube for a snapshot, building and persisting it on first use.
+
+    The cube is stored next to the snapshot partitions as cube/<version>.parquet.
+    Cubes of older snapshots are removed once a new one has been written.
+
+    Parameters:
+    partitions (list): Partition paths making up the snapshot.
+    df (pd.DataFrame): The snapshot's debtor frame; read from partitions if omitted.
+    """
+    version = snapshot_store.snapshot_version(partitions)
+    path = cube_path(version, root)
+    if os.path.exists(path):
+        try:
+            return pq.read_table(path, memory_map=True).to_pandas()
+        except FileNotFoundError:
+            # Removed by a process that just wrote a newer cube; build this one again
+            pass
+
+    if df is None:
+        df = snapshot_store.read_snapshot(partitions)
+    cube = build_cube(df)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A temp file of its own, as other processes may be building the same cube
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.parquet')
+    os.close(fd)
+    try:
+        pq.write_table(pa.Table.from_pandas(cube), tmp_path)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    for old_path in glob.glob(os.path.join(os.path.dirname(path), '*.parquet')):
+        if old_path != path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old_path)
+    return cube
+
+
+def _isin_slice(cube, isins):
+    if isins is None:
+        return cube
+    isins = [isin for isin in dict.fromkeys(isins) if isin in cube.index.levels[0]]
+    return cube.loc[isins]
+
+
+def interval_distribution(cube, isins=None):
+    """
+    Percentage of each ISIN's restgaeld per restgaeldinterval plus its total;
+    the same table as analytics.calculate_interval_distribution.
+    """
+    sliced = _isin_slice(cube, isins)
+    by_interval = sliced['restgaeld'].groupby(level=['isin', 'restgaeldinterval']).sum()
+    isin_total = by_interval.groupby(level='isin').transform('sum')
+    percentage = (by_interval / isin_total * 100).where(isin_total != 0, 0)
+    distribution = percentage.unstack('restgaeldinterval').fillna(0)
+    distribution['total'] = by_interval.groupby(level='isin').sum()
+    return distribution
+
+
+def isin_totals(cube, isins=None):
+    """
+    Per-ISIN totals and the obl/cash and private (A)/commercial (B) shares.
+
+    Returns:
+    pd.DataFrame: Indexed by isin with restgaeld_obl, restgaeld_obl_kontant,
+    share_obl, share_kontant, share_a and share_b (fractions, 0 when undefined).
+    """
+    sliced = _isin_slice(cube, isins)
+    totals = sliced[['restgaeld_obl', 'restgaeld_obl_kontant']].groupby(level='isin').sum()
+    restgaeld = totals['restgaeld_obl'] + totals['restgaeld_obl_kontant']
+    totals['share_obl'] = (totals['restgaeld_obl'] / restgaeld).where(restgaeld != 0, 0)
+    totals['share_kontant'] = (totals['restgaeld_obl_kontant'] / restgaeld).where(restgaeld != 0, 0)
+
+    by_group = sliced['restgaeld'].groupby(level=['isin', 'laan_gruppe']).sum().unstack('laan_gruppe')
+    group_a = by_group['A'] if 'A' in by_group else 0
+    group_b = by_group['B'] if 'B' in by_group else 0
+    group_a = pd.Series(group_a, index=totals.index).fillna(0)
+    group_b = pd.Series(group_b, index=totals.index).fillna(0)
+    loans = group_a + group_b
+    totals['share_a'] = (group_a / loans).where(loans != 0, 0)
+    totals['share_b'] = (group_b / loans).where(loans != 0, 0)
+    return totals
+
+
+def loan_shares(cube, isins):
+    """The Private/Commercial/Obl/Cash percentage table of the Summary tab, in isins order."""
+    totals = isin_totals(cube, isins)
+    shares_df = pd.DataFrame({
+        'Private': totals['share_a'] * 100,
+        'Commercial': totals['share_b'] * 100,
+        'Obl (%)': totals['share_obl'] * 100,
+        'Cash (%)': totals['share_kontant'] * 100,
+    })
+    return shares_df.reindex(list(dict.fromkeys(isins)), fill_value=0)
+
+
+def summary_table(cube, isins=None):
+    """
+    The Summary tab's table: each ISIN's interval distribution, with the
+    intervals labelled as in INTERVAL_LABELS, next to its loan_shares().
+
+    Parameters:
+    isins (list): ISINs in display order; every ISIN in the cube when None.
+    """
+    if isins is None:
+        isins = list(cube.index.get_level_values('isin').unique())
+    distribution = interval_distribution(cube, isins).rename(columns=INTERVAL_LABELS)
+    summary = distribution.merge(loan_shares(cube, isins), left_index=True, right_index=True)
+    summary.columns = summary.columns.map(str)
+    return summary
+
+
+def large_loans(cube, top_n=50):
+    """
+    The ISINs with the largest share of restgaeld in loans over 10m (the
+    10-50m and +50m intervals), as on the Large Loans page.
+
+    Returns:
+    pd.DataFrame: Indexed by isin with a column per interval label, total and
+    'Over 10m', highest 'Over 10m' first.
+    """
+    distribution = interval_distribution(cube).rename(columns=INTERVAL_LABELS)
+    distribution = distribution.reindex(columns=list(INTERVAL_LABELS.values()) + ['total'], fill_value=0)
+    distribution.columns.name = None
+    distribution['Over 10m'] = distribution['10-50m'] + distribution['+50m']
+    return distribution.sort_values('Over 10m', ascending=False).head(top_n)
+
+
+def prepayment_pressure(cube, terminated, isins=None):
+    """
+    Terminated loans per ISIN (the I blocks) against the ISIN's remaining debt.
+
+    Parameters:
+    cube (pd.DataFrame): build_cube() of the snapshot.
+    terminated (pd.DataFrame): The snapshot's terminated table.
+    isins (list): Optional ISINs to restrict to; all ISINs with terminations otherwise.
+
+    Returns:
+    pd.DataFrame: Indexed by isin with antal_opsagte_laan, opsagt_beloeb,
+    restgaeld and pressure (opsagt_beloeb as a percentage of restgaeld),
+    sorted by pressure, highest first.
+    """
+    if isins is not None:
+        terminated = terminated[terminated['isin'].isin(list(isins))]
+    totals = terminated.groupby('isin', observed=True)[['antal_opsagte_laan', 'opsagt_beloeb']].sum()
+    totals.index = totals.index.astype(object)
+    restgaeld = cube['restgaeld'].groupby(level='isin').sum()
+    totals['restgaeld'] = restgaeld.reindex(totals.index).fillna(0)
+    totals['pressure'] = (totals['opsagt_beloeb'] / totals['restgaeld'] * 100).where(totals['restgaeld'] != 0, np.nan)
+    return totals.sort_values(['pressure', 'opsagt_beloeb'], ascending=False)
@@ -0,0 +1,213 @@
+"""
+Local stand-in for the Nasdaq news API, serving announcements from files on disk.
+
+Start it and point the loaders at it:
+
+    python nasdaq_stub.py --port 8765
+    NASDAQ_NEWS_URL=http://127.0.0.1:8765/news/query.action streamlit run streamlit_app.py
+
+or use NasdaqStub as a context manager and set data_loader.NEWS_API_URL to stub.url.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from data_loader import DEBITOR_MAPPING, REDEMPTION_MAPPING
+
+# Bundled sample file for each issuer in ./Data
+BUNDLED_FILES = {
+    "Jyske Realkredit A/S": "jyk.xml",
+    "Nordea Kredit Realkreditaktieselskab": "nda.xml",
+    "Nykredit Realkredit A/S": "nyk.xml",
+    "DLR Kredit A/S": "dlr.xml",
+    "Realkredit Danmark A/S": "rd.xml",
+}
+
+
+def bundled_announcements(data_folder='Data', published='2024-06-03 08:00:00', redemption_folder=None):
+    """
+    Builds stub announcements for the bundled debtor files.
+
+    Redemption announcements are added for every '<short>.xml' found in
+    redemption_folder, using the same short names as BUNDLED_FILES.
+
+    Returns:
+    dict: (company, free_text) -> list of announcements, newest first.
+    """
+    announcements = {}
+    for index, (company, file_name) in enumerate(BUNDLED_FILES.items()):
+        announcements[(company, DEBITOR_MAPPING[company])] = [{
+            'disclosureId': 1000 + index,
+            'published': published,
+            'path': os.path.join(data_folder, file_name),
+        }]
+        if redemption_folder:
+            path = os.path.join(redemption_folder, file_name)
+            if os.path.exists(path):
+                announcements[(company, REDEMPTION_MAPPING[company])] = [{
+                    'disclosureId': 2000 + index,
+                    'published': published,
+                    'path': path,
+                }]
+    return announcements
+
+
+class NasdaqStub:
+    """
+    Threaded HTTP server answering /news/query.action and serving attachments.
+
+    announcements maps (company, freeText) to a list of dicts with
+    'disclosureId', 'published' and 'path'; the first entry is the newest.
+    latency adds a fixed delay to every response to mimic a remote round-trip.
+    Attachments carry ETag and Last-Modified and answer conditional requests
+    with 304. Every request path is recorded in self.requests.
+    """
+
+    def __init__(self, announcements, host='127.0.0.1', port=0, latency=0.0):
+        self.announcements = announcements
+        self.latency = latency
+        self.requests = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def url(self):
+        return f"{self.base_url}/news/query.action"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _items(self, company, free_text):
+        items = []
+        for announcement in self.announcements.get((company, free_text), []):
+            file_name = os.path.basename(announcement['path'])
+            items.append({
+                'disclosureId': announcement['disclosureId'],
+                'published': announcement['published'],
+                'company': company,
+                'headline': free_text,
+                'attachment': [{
+                    'fileName': file_name,
+                    'mimetype': 'text/xml',
+                    'attachmentUrl': f"{self.base_url}/files/{announcement['disclosureId']}/{file_name}",
+                }],
+            })
+        return items
+
+    def _attachment(self, disclosure_id):
+        for announcements in self.announcements.values():
+            for announcement in announcements:
+                if str(announcement['disclosureId']) == disclosure_id:
+                    return announcement
+        return None
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type, headers=None):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _not_modified(self, etag, mtime):
+                if_none_match = self.headers.get('If-None-Match')
+                if if_none_match is not None:
+                    return if_none_match == etag
+                if_modified_since = self.headers.get('If-Modified-Since')
+                if if_modified_since is not None:
+                    try:
+                        return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+                    except (TypeError, ValueError):
+                        return False
+                return False
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests.append(self.path)
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+                parsed = urlparse(self.path)
+                if parsed.path == '/news/query.action':
+                    query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                    items = stub._items(query.get('company', ''), query.get('freeText', ''))
+                    body = json.dumps({'results': {'item': items}}).encode('utf-8')
+                    self._send(200, body, 'application/json')
+                    return
+
+                parts = parsed.path.strip('/').split('/')
+                if len(parts) == 3 and parts[0] == 'files':
+                    announcement = stub._attachment(parts[1])
+                    if announcement is not None:
+                        with open(announcement['path'], 'rb') as file:
+                            body = file.read()
+                        mtime = int(os.path.getmtime(announcement['path']))
+                        headers = {
+                            'ETag': '"{}"'.format(hashlib.sha1(body).hexdigest()),
+                            'Last-Modified': formatdate(mtime, usegmt=True),
+                        }
+                        if self._not_modified(headers['ETag'], mtime):
+                            self._send(304, b'', 'text/xml', headers)
+                        else:
+                            self._send(200, body, 'text/xml', headers)
+                        return
+
+                self._send(404, b'not found', 'text/plain')
+
+            do_HEAD = do_GET
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the bundled XML files through a local Nasdaq news API stub.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--data', default='Data', help="Folder with the bundled debtor files")
+    parser.add_argument('--redemption', default=None, help="Folder with redemption files named like the debtor files")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    stub = NasdaqStub(bundled_announcements(args.data, redemption_folder=args.redemption),
+                      host=args.host, port=args.port, latency=args.latency)
+    print(f"Nasdaq stub listening on {stub.url}")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,221 @@
+"""
+Incremental snapshot refresh.
+
+The last announcement seen for every issuer is kept in a small state file
+next to the snapshot store. A refresh asks the news API for each issuer's
+newest announcement and only downloads and parses the issuers whose
+disclosureId changed; the other issuers keep their existing partitions. The
+new partitions are merged into the snapshot by rewriting the state file in
+one atomic replace, so readers see either the previous snapshot or the new
+one, never a mix.
+
+Run it once, or on a schedule, outside the app:
+
+    python refresh.py --once
+    python refresh.py --interval 900
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+import data_loader
+import history
+import instrumentation
+import snapshot_store
+
+STATE_FILE = os.path.join(snapshot_store.STORE_DIR, 'refresh_state.json')
+REFRESH_INTERVAL = 15 * 60
+# The app runs its own BackgroundRefresher unless this is off (a refresh.py worker does it instead)
+APP_REFRESHER = os.environ.get('DEBITOR_APP_REFRESHER', '1') != '0'
+
+# Serialises refreshes within a process; the state file itself is replaced atomically
+_refresh_lock = threading.Lock()
+
+
+def load_state(path=None):
+    """
+    Returns:
+    dict: Dataset -> company -> {'disclosure_id', 'published', 'file', 'partition'}.
+    """
+    try:
+        with open(path or STATE_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_state(state, path=None):
+    path = path or STATE_FILE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(state, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def snapshot_partitions(dataset, state=None):
+    """Partition paths of the current snapshot of a dataset, in issuer mapping order."""
+    state = load_state() if state is None else state
+    issuers = state.get(dataset, {})
+    mapping = data_loader.DATASETS[dataset][0]
+    companies = [company for company in mapping if company in issuers]
+    companies += [company for company in issuers if company not in mapping]
+    return [issuers[company]['partition'] for company in companies if os.path.exists(issuers[company]['partition'])]
+
+
+def state_token(dataset, state=None):
+    """
+    A short fingerprint of a dataset's entries in the state file. It changes
+    whenever a refresh merges a new issuer file, and is cheap enough to check
+    on every app rerun.
+    """
+    state = load_state() if state is None else state
+    encoded = json.dumps(state.get(dataset, {}), sort_keys=True).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:16]
+
+
+def refresh_dataset(dataset, incremental=True, session=None, cache=None, offline=None, state_path=None,
+                    news_fresh_for=0):
+    """
+    Brings one dataset's snapshot up to date.
+
+    Parameters:
+    dataset (str): 'debitor' or 'redemption' (see data_loader.DATASETS).
+    incremental (bool): Only download and parse issuers with a new announcement;
+        False re-downloads and re-parses every issuer.
+    news_fresh_for (int): Seconds a cached search may be reused; 0 always asks the API.
+
+    Returns:
+    tuple: (partition paths of the refreshed snapshot, list of companies that changed).
+    """
+    mapping, data_folder, parse_file = data_loader.DATASETS[dataset]
+    with _refresh_lock, instrumentation.span('refresh_dataset', dataset=dataset):
+        state = load_state(state_path)
+        issuers = state.get(dataset, {})
+        known = {}
+        if incremental:
+            # A partition from an older schema counts as missing and is rebuilt
+            known = {company: entry['disclosure_id'] for company, entry in issuers.items()
+                     if snapshot_store.partition_source_hash(entry['partition']) is not None}
+
+        announcements = data_loader.fetch_announcements(mapping, data_folder, session=session, cache=cache,
+                                                        offline=offline, known=known, news_fresh_for=news_fresh_for)
+        changed = {company: announcement for company, announcement in announcements.items()
+                   if announcement['changed'] or company not in known}
+        partitions = data_loader.store_files(dataset, [announcement['path'] for announcement in changed.values()],
+                                             parse_file, force=not incremental)
+
+        merged = []
+        issuers = dict(issuers)
+        for company, announcement in changed.items():
+            partition = partitions.get(announcement['path'])
+            if partition is None:
+                # Keep serving the issuer's previous partition
+                continue
+            issuers[company] = {
+                'disclosure_id': announcement['disclosure_id'],
+                'published': announcement['published'],
+                'file': announcement['path'],
+                'partition': partition,
+            }
+            merged.append(company)
+
+        if merged or dataset not in state:
+            state = load_state(state_path)
+            state[dataset] = issuers
+            save_state(state, state_path)
+        if merged:
+            print(f"Refreshed {dataset}: {', '.join(merged)}")
+            if dataset == 'debitor':
+                history.update_history()
+        return snapshot_partitions(dataset, state), merged
+
+
+def refresh_all(incremental=True, session=None, state_path=None, news_fresh_for=0):
+    """
+    Refreshes every dataset over one pooled session.
+
+    Returns:
+    dict: Dataset -> list of companies that changed.
+    """
+    own_session = session is None
+    if own_session:
+        session = data_loader.make_session()
+    try:
+        return {
+            dataset: refresh_dataset(dataset, incremental=incremental, session=session, state_path=state_path,
+                                     news_fresh_for=news_fresh_for)[1]
+            for dataset in data_loader.DATASETS
+        }
+    finally:
+        if own_session:
+            session.close()
+
+
+class BackgroundRefresher(threading.Thread):
+    """
+    Daemon thread running refresh_all() every interval seconds, starting right away.
+
+    The app keeps serving the snapshot it has loaded while a refresh runs and
+    picks up the new one through state_token() once the state file changes.
+    A failed refresh is logged and retried on the next tick.
+
+    on_refresh(changed) is called on this thread once at start, with None, and
+    after every refresh with refresh_all()'s result, e.g. to load the new
+    snapshot before any session asks for it (see snapshots.SnapshotPublisher).
+    """
+
+    def __init__(self, interval=REFRESH_INTERVAL, state_path=None, on_refresh=None):
+        super().__init__(name='snapshot-refresher', daemon=True)
+        self.interval = interval
+        self.state_path = state_path
+        self.on_refresh = on_refresh
+        self.last_refresh = None
+        self.last_error = None
+        self._stopped = threading.Event()
+
+    def _notify(self, changed):
+        if self.on_refresh is None:
+            return
+        try:
+            self.on_refresh(changed)
+        except Exception as e:
+            print(f"Publishing the refreshed snapshot failed: {str(e)}")
+
+    def run(self):
+        # What the store already holds is served while the first refresh runs
+        self._notify(None)
+        while not self._stopped.is_set():
+            try:
+                changed = refresh_all(state_path=self.state_path)
+                self.last_refresh = time.time()
+                self.last_error = None
+                self._notify(changed)
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Background refresh failed: {str(e)}")
+            self._stopped.wait(self.interval)
+
+    def stop(self):
+        self._stopped.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the snapshot store with newly published issuer files.")
+    parser.add_argument('--once', action='store_true', help="Refresh once and exit")
+    parser.add_argument('--full', action='store_true', help="Re-download and re-parse every issuer")
+    parser.add_argument('--interval', type=int, default=REFRESH_INTERVAL, help="Seconds between refreshes")
+    args = parser.parse_args()
+
+    if args.once or args.full:
+        print(refresh_all(incremental=not args.full))
+    else:
+        refresher = BackgroundRefresher(interval=args.interval)
+        refresher.start()
+        try:
+            while refresher.is_alive():
+                refresher.join(1)
+        except KeyboardInterrupt:
+            refresher.stop()
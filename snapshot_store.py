@@ -0,0 +1,354 @@
+import contextlib
+import glob
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+STORE_DIR = os.environ.get('SNAPSHOT_DIR', './Data/store')
+# Set (e.g. to /dev/shm/debitor) to share loaded frames between the app processes on a host
+SHARED_DIR = os.environ.get('DEBITOR_SHARED_DIR')
+
+# Small row groups so an isin filter can skip most of a partition
+ROW_GROUP_SIZE = 1024
+CATEGORICAL_COLUMNS = ['issuer', 'isin', 'laan_gruppe']
+SOURCE_HASH_KEY = b'source_sha256'
+SCHEMA_VERSION_KEY = b'schema_version'
+
+# Column dtypes of each dataset. Loan counts fit float32 exactly and keep NaN
+# for the laan_gruppe C rows, which have no D block; kroner amounts exceed
+# float32's 2**24 exact-integer range and stay float64. Bump SCHEMA_VERSION
+# whenever SCHEMAS changes so stored partitions are rebuilt.
+SCHEMA_VERSION = 4
+SCHEMAS = {
+    'debitor': {
+        'issuer': 'category',
+        'isin': 'category',
+        'laan_gruppe': 'category',
+        'restgaeldinterval': 'int8',
+        'restgaeld_obl': 'float64',
+        'restgaeld_obl_kontant': 'float64',
+        'restgaeld_kontant': 'float64',
+        'kontant_rente': 'float64',
+        'antal_obl_laan': 'float32',
+        'antal_kontant_laan': 'float32',
+        'fradrags_konto': 'float64',
+        'fradrags_konto_laan': 'float32',
+    },
+    # The I (terminated loans) blocks of the debtor files
+    'terminated': {
+        'issuer': 'category',
+        'isin': 'category',
+        'laan_gruppe': 'category',
+        'restgaeldinterval': 'int8',
+        'antal_opsagte_laan': 'int32',
+        'opsagt_beloeb': 'int64',
+    },
+    'redemption': {
+        'issuer': 'category',
+        'isin': 'category',
+        'terminsdato': 'datetime64[ns]',
+        'afdrag_belob': 'float64',
+        'rente_belob': 'float64',
+    },
+}
+
+
+def partition_path(dataset, issuer, published_date, root=None):
+    """Path of the snapshot for one issuer file: <root>/<dataset>/<issuer>/<date>.parquet"""
+    return os.path.join(root or STORE_DIR, dataset, issuer, f"{published_date}.parquet")
+
+
+def apply_schema(df, dataset):
+    """
+    Casts df's columns to SCHEMAS[dataset].
+
+    A narrowing cast (float32, int8) is only applied when it round-trips
+    every value; otherwise the column keeps its wider dtype.
+    """
+    df = df.copy(deep=False)
+    for column, dtype in SCHEMAS[dataset].items():
+        if column not in df.columns or df[column].dtype == dtype:
+            continue
+        if dtype == 'category':
+            df[column] = df[column].astype('category')
+        elif dtype.startswith('datetime64'):
+            df[column] = pd.to_datetime(df[column]).astype(dtype)
+        else:
+            values = df[column].to_numpy()
+            with np.errstate(invalid='ignore'):
+                narrowed = values.astype(dtype)
+            if np.array_equal(narrowed.astype(values.dtype), values, equal_nan=values.dtype.kind == 'f'):
+                df[column] = narrowed
+    return df
+
+
+def partition_source_hash(path):
+    """
+    The sha256 of the XML a partition was parsed from, or None when it does not
+    exist or was written with an older SCHEMA_VERSION.
+    """
+    try:
+        metadata = pq.read_schema(path, memory_map=True).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if metadata.get(SCHEMA_VERSION_KEY) != str(SCHEMA_VERSION).encode('ascii'):
+        return None
+    value = metadata.get(SOURCE_HASH_KEY)
+    return value.decode('ascii') if value is not None else None
+
+
+def snapshot_version(partitions):
+    """
+    Identifies a snapshot by its partitions and the XML they were parsed from,
+    so the version only changes when an issuer publishes a new file.
+    """
+    digest = hashlib.sha1(f"schema:{SCHEMA_VERSION}\n".encode('utf-8'))
+    for path in sorted(partitions):
+        digest.update(f"{os.path.normpath(path)}:{partition_source_hash(path)}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class SnapshotHandle:
+    """
+    A loaded snapshot plus the version it was built from.
+
+    Cached functions take the handle instead of the raw frames and hash it by
+    version alone (see SNAPSHOT_HASH_FUNCS), so a cache lookup costs the same
+    however large the frames are.
+
+    Attributes:
+    version (str): snapshot_version() of the partitions.
+    df (pd.DataFrame): The snapshot's rows.
+    cube (pd.DataFrame): The debtor metrics cube, when one was built.
+    terminated (pd.DataFrame): The debtor files' terminated loans (I blocks), when loaded.
+    cashflows (cashflows.CashflowTable): The redemption schedules, when built.
+    catalog (isin_catalog.IsinCatalog): The snapshot's ISINs for the pickers, when built.
+    """
+
+    def __init__(self, version, df, cube=None, terminated=None, cashflows=None, catalog=None):
+        self.version = version
+        self.df = df
+        self.cube = cube
+        self.terminated = terminated
+        self.cashflows = cashflows
+        self.catalog = catalog
+
+    def __repr__(self):
+        return f"SnapshotHandle(version={self.version!r}, rows={len(self.df)})"
+
+
+SNAPSHOT_HASH_FUNCS = {SnapshotHandle: lambda handle: handle.version}
+
+
+# A partition produced while its file is parsed: an Arrow schema and an iterator of tables with that schema
+TableStream = namedtuple('TableStream', ['schema', 'tables'])
+
+
+def _partition_metadata(schema, source_sha256):
+    metadata = dict(schema.metadata or {})
+    metadata[SCHEMA_VERSION_KEY] = str(SCHEMA_VERSION).encode('ascii')
+    if source_sha256 is not None:
+        metadata[SOURCE_HASH_KEY] = source_sha256.encode('ascii')
+    return metadata
+
+
+def _issuer_column(issuer, length):
+    return pa.DictionaryArray.from_arrays(pa.array(np.zeros(length, dtype=np.int32)), pa.array([issuer]))
+
+
+def _write_stream(stream, path, issuer, source_sha256):
+    """Writes every table of a TableStream as it arrives, so only one chunk is held at a time."""
+    schema = stream.schema.append(pa.field('issuer', pa.dictionary(pa.int32(), pa.string())))
+    schema = schema.with_metadata(_partition_metadata(schema, source_sha256))
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.parquet')
+    os.close(fd)
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for table in stream.tables:
+                table = table.append_column('issuer', _issuer_column(issuer, len(table)))
+                writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def write_partition(df, dataset, issuer, published_date, source_sha256=None, root=None):
+    """
+    Writes one parsed issuer file as a Parquet partition.
+
+    df may also be a TableStream, whose tables are written in the order the
+    parser yields them rather than sorted by isin; they should already match
+    the dataset's schema.
+
+    Columns are cast to the dataset's schema (see SCHEMAS), string columns
+    are stored dictionary-encoded and rows are sorted by isin, so row-group
+    statistics let read_snapshot() skip unrelated ISINs. The file
+    is written under a temporary name and renamed, so readers never see a
+    partial partition.
+
+    Returns:
+    str: Path of the written partition.
+    """
+    path = partition_path(dataset, issuer, published_date, root)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if isinstance(df, TableStream):
+        _write_stream(df, path, issuer, source_sha256)
+        return path
+
+    df = apply_schema(df.assign(issuer=issuer), dataset)
+    df = df.sort_values('isin', kind='stable')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata(_partition_metadata(table.schema, source_sha256))
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.parquet')
+    os.close(fd)
+    try:
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+def table_partition(path, dataset):
+    """The partition of another table parsed from the same file: <root>/<dataset>/<issuer>/<date>.parquet"""
+    issuer_dir = os.path.dirname(path)
+    root = os.path.dirname(os.path.dirname(issuer_dir))
+    return os.path.join(root, dataset, os.path.basename(issuer_dir), os.path.basename(path))
+
+
+def latest_partitions(dataset, root=None):
+    """
+    Finds the newest partition of every issuer in a dataset.
+
+    Returns:
+    dict: Issuer -> partition path.
+    """
+    latest = {}
+    for path in sorted(glob.glob(os.path.join(root or STORE_DIR, dataset, '*', '*.parquet'))):
+        latest[os.path.basename(os.path.dirname(path))] = path
+    return latest
+
+
+def read_partitions(paths, isins=None, columns=None):
+    """
+    Reads partitions through memory maps into one Arrow table.
+
+    isins is pushed down as a filter, so only the row groups whose isin
+    statistics can match are decoded.
+    """
+    filters = [('isin', 'in', list(isins))] if isins is not None else None
+    tables = [pq.read_table(path, columns=columns, filters=filters, memory_map=True) for path in paths]
+    if not tables:
+        return None
+    return pa.concat_tables(tables, promote=True)
+
+
+def read_snapshot(paths, isins=None, columns=None, categorical=True):
+    """
+    Reads partitions as a DataFrame.
+
+    Parameters:
+    paths (iterable): Partition paths, e.g. latest_partitions(dataset).values().
+    isins (iterable): Optional ISINs to restrict the read to.
+    columns (list): Optional subset of columns.
+    categorical (bool): Keep issuer/isin/laan_gruppe as pandas categoricals;
+        False returns plain object strings.
+
+    Returns:
+    pd.DataFrame: The concatenated partitions.
+    """
+    table = read_partitions(paths, isins=isins, columns=columns)
+    if table is None:
+        return pd.DataFrame()
+    df = table.to_pandas()
+    if not categorical:
+        for column in CATEGORICAL_COLUMNS:
+            if column in df.columns:
+                df[column] = df[column].astype(object)
+    return df
+
+
+# Schema metadata key listing the index columns of a shared frame
+SHARED_INDEX_KEY = b'index_columns'
+# Versions of each shared frame kept on disk: the new one and the one before it
+SHARED_VERSIONS = 2
+
+
+def _arrow_column(series):
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes = series.cat.codes.to_numpy()
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                              pa.array(series.cat.categories.to_numpy(dtype=object)))
+    # Built from the numpy values, so NaN stays a float instead of becoming a
+    # null, which to_pandas() would have to copy to fill in
+    return pa.array(series.to_numpy())
+
+
+def shared_path(name, version, root=None):
+    return os.path.join(root or SHARED_DIR, f"{name}-{version}.arrow")
+
+
+def shared_frame(name, version, read, root=None):
+    """
+    A frame kept once per host: the first process to ask calls read() and
+    writes the result as an uncompressed Arrow IPC file under SHARED_DIR;
+    every process then memory-maps that file. Numeric, datetime and
+    categorical-code columns are views of the mapping rather than copies,
+    so the OS keeps one copy of them in the page cache however many app
+    processes use the frame. The views are read-only.
+
+    Once a new file is written, all but the SHARED_VERSIONS newest versions
+    of name are removed; processes still mapping them keep them until they
+    let go.
+
+    Parameters:
+    name (str): What the frame is, e.g. 'debitor'.
+    version (str): snapshot_version() of the partitions it was read from.
+    read (callable): Returns the frame, when no process has written it yet.
+
+    Returns:
+    pd.DataFrame: The frame, with its index restored.
+    """
+    path = shared_path(name, version, root)
+    if not os.path.exists(path):
+        df = read()
+        index_columns = [column for column in df.index.names if column is not None]
+        flat = df.reset_index() if index_columns else df
+        table = pa.table({str(column): _arrow_column(flat[column]) for column in flat.columns})
+        table = table.replace_schema_metadata({SHARED_INDEX_KEY: ','.join(index_columns).encode('utf-8')})
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        # Keep the previous version too: another process may be just about to map it.
+        # A file another process prunes at the same time is left to that process
+        with contextlib.suppress(FileNotFoundError):
+            paths = sorted(glob.glob(os.path.join(os.path.dirname(path), f"{name}-*.arrow")), key=os.path.getmtime)
+            for old_path in paths[:-SHARED_VERSIONS]:
+                if old_path != path:
+                    os.remove(old_path)
+
+    try:
+        table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    except FileNotFoundError:
+        # Pruned by a process publishing two newer versions in between
+        return read()
+    index_columns = (table.schema.metadata or {}).get(SHARED_INDEX_KEY, b'').decode('utf-8')
+    # One block per column keeps pandas from consolidating (copying) the mapped columns
+    df = table.to_pandas(split_blocks=True)
+    if index_columns:
+        # set_index() without inplace copies every remaining column
+        df.set_index(index_columns.split(','), inplace=True)
+    return df
@@ -0,0 +1,146 @@
+"""
+Loading and publishing the snapshot the app serves.
+
+refresh.py builds the next snapshot in the store (new partitions, then one
+atomic replace of the state file, which is the pointer to the current
+partitions). SnapshotPublisher is the in-memory side. It loads the snapshot
+the state file points at into a SnapshotHandle and publishes it by swapping
+one reference. Every session reads the published handle on its next rerun.
+The background refresher calls update() after each refresh, so the load
+happens on its thread rather than in a user's request:
+
+    publisher = SnapshotPublisher()
+    refresher = refresh.BackgroundRefresher(on_refresh=publisher.update)
+
+A session only loads a snapshot itself when this process has none published
+yet and the store has one, which is a read of local Parquet files. It never
+waits for the news API or a download. When the state file changes under a
+running process (e.g. a refresh.py worker in another process), the next
+current() call starts the load on a background thread and keeps serving the
+old handle until it is done.
+"""
+import os
+import threading
+from collections import namedtuple
+import cashflows
+import instrumentation
+import isin_catalog
+import metrics_cube
+import refresh
+import snapshot_store
+
+
+def _frame(name, version, read):
+    # With DEBITOR_SHARED_DIR set, every app process on the host maps the same copy
+    if snapshot_store.SHARED_DIR:
+        return snapshot_store.shared_frame(name, version, read)
+    return read()
+
+
+def load_debitor(partitions):
+    """The debtor snapshot of the given partitions, with its cube, terminated loans and ISIN catalog."""
+    version = snapshot_store.snapshot_version(partitions)
+    with instrumentation.span('read_snapshot', dataset='debitor'):
+        df = _frame('debitor', version, lambda: snapshot_store.read_snapshot(partitions))
+    # The metrics cube is only rebuilt when an issuer publishes a new file
+    with instrumentation.span('load_cube'):
+        cube = _frame('cube', version, lambda: metrics_cube.load_cube(partitions, df)) if not df.empty else None
+    # The terminated loans were parsed from the same files as the debtor partitions
+    terminated_partitions = [snapshot_store.table_partition(path, 'terminated') for path in partitions]
+    with instrumentation.span('read_snapshot', dataset='terminated'):
+        terminated = _frame('terminated', version, lambda: snapshot_store.read_snapshot(
+            [path for path in terminated_partitions if os.path.exists(path)]))
+    with instrumentation.span('IsinCatalog', dataset='debitor'):
+        catalog = isin_catalog.IsinCatalog.from_debitor(df) if not df.empty else None
+    return snapshot_store.SnapshotHandle(version, df, cube, terminated, catalog=catalog)
+
+
+def load_redemption(partitions):
+    """The redemption snapshot of the given partitions, with its CashflowTable and ISIN catalog."""
+    version = snapshot_store.snapshot_version(partitions)
+    with instrumentation.span('read_snapshot', dataset='redemption'):
+        df = _frame('redemption', version, lambda: snapshot_store.read_snapshot(partitions))
+    # Redemption percentages and cumulative curves are computed once per snapshot
+    with instrumentation.span('CashflowTable.from_frame'):
+        cashflow_table = None
+        if not df.empty:
+            flat = _frame('cashflows', version, lambda: cashflows.CashflowTable.from_frame(df).to_flat_frame())
+            cashflow_table = cashflows.CashflowTable.from_flat_frame(flat)
+    with instrumentation.span('IsinCatalog', dataset='redemption'):
+        catalog = isin_catalog.IsinCatalog.from_redemption(df) if not df.empty else None
+    return snapshot_store.SnapshotHandle(version, df, cashflows=cashflow_table, catalog=catalog)
+
+
+LOADERS = {'debitor': load_debitor, 'redemption': load_redemption}
+
+# A published snapshot: the state_token() it was loaded for and the handle
+Published = namedtuple('Published', ['token', 'handle'])
+
+
+class SnapshotPublisher:
+    """
+    The latest loaded snapshot of every dataset, shared by all sessions of a
+    server process.
+    """
+
+    def __init__(self, state_path=None):
+        self.state_path = state_path
+        self._published = {}
+        self._loading = set()
+        self._lock = threading.Lock()
+
+    def _load(self, dataset, state):
+        token = refresh.state_token(dataset, state)
+        published = self._published.get(dataset)
+        if published is not None and published.token == token:
+            return published
+        with instrumentation.span('publish_snapshot', dataset=dataset):
+            handle = LOADERS[dataset](refresh.snapshot_partitions(dataset, state))
+        # Readers see the old or the new entry, each a complete snapshot
+        self._published[dataset] = Published(token, handle)
+        return self._published[dataset]
+
+    def update(self, changed=None):
+        """
+        Loads and publishes every dataset whose state file entries changed
+        since it was last published. The refresher calls it after each refresh.
+        """
+        state = refresh.load_state(self.state_path)
+        for dataset in LOADERS:
+            if dataset in state:
+                with self._lock:
+                    self._load(dataset, state)
+
+    def _load_in_background(self, dataset):
+        def run():
+            try:
+                with self._lock:
+                    self._load(dataset, refresh.load_state(self.state_path))
+            except Exception as e:
+                print(f"Loading the new {dataset} snapshot failed: {str(e)}")
+            finally:
+                self._loading.discard(dataset)
+
+        if dataset not in self._loading:
+            self._loading.add(dataset)
+            threading.Thread(target=run, name=f'publish-{dataset}', daemon=True).start()
+
+    def current(self, dataset):
+        """
+        The snapshot sessions should show now.
+
+        Returns:
+        SnapshotHandle: The published snapshot, or None while the store has
+        none yet (the first refresh is still running).
+        """
+        published = self._published.get(dataset)
+        state = refresh.load_state(self.state_path)
+        if dataset not in state:
+            return published.handle if published else None
+        if published is None:
+            # First use in this process: load what the store already has
+            with self._lock:
+                return self._load(dataset, state).handle
+        if published.token != refresh.state_token(dataset, state):
+            self._load_in_background(dataset)
+        return published.handle
@@ -1,8 +1,17 @@
+import os
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from streamlit_option_menu import option_menu
-from data_loader import load_xml, load_xml_redemption
+import analytics
+import charts
+import history
+import instrumentation
+import isin_catalog
+import metrics_cube
+import refresh
+import snapshot_store
+import snapshots
+import tables
 #from data_loader_sql import get_recent_cashflow_data, get_recent_debtor_data, fetch_and_process_xml
 
 st.set_page_config(layout="wide", page_title='Danish Bonds Data')
@@ -11,248 +20,286 @@ st.set_page_config(layout="wide", page_title='Danish Bonds Data')
 with open('styles.css') as f:
     st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
 
-
-@st.cache_data
-def load_files():
-    #fetch_and_process_xml()
-    return load_xml(), load_xml_redemption()
-
-@st.cache_data
-def calculate_percentage(df, selected_isins):
-    percentage_dfs = []
-    for isin in selected_isins:
-        filtered_df = df[(df['isin'] == isin) & (df['laan_gruppe'] != 'C')].copy()
-        total_restgaeld_obl = filtered_df['restgaeld_obl'].sum()
-        total_restgaeld_kontant = filtered_df['restgaeld_obl_kontant'].sum()
-        filtered_df['percentage'] = (filtered_df['restgaeld_obl'] / total_restgaeld_obl) * 100
-        filtered_df['percentage_obl_kontant'] = (filtered_df['restgaeld_obl_kontant'] / total_restgaeld_kontant) * 100
-        filtered_df['isin'] = isin
-        percentage_dfs.append(filtered_df)
-    return pd.concat(percentage_dfs)
-
-@st.cache_data
-def compute_avg_loan_size(df, selected_isins):
-    loan_size_dfs = []
-    for isin in selected_isins:
-        filtered_df = df[df['isin'] == isin].copy()
-        filtered_df['Avg_obl_loan'] = filtered_df['restgaeld_obl'] / filtered_df['antal_obl_laan']
-        filtered_df['Avg_cash_loan'] = filtered_df['restgaeld_obl_kontant'] / filtered_df['antal_kontant_laan']
-        filtered_df['isin'] = isin
-        loan_size_dfs.append(filtered_df)
-    return pd.concat(loan_size_dfs)
-
-@st.cache_data
-def calculate_restgaeld_shares(df, isin):
-    filtered_df = df[df['isin'] == isin].copy()
-    total_restgaeld_obl = filtered_df['restgaeld_obl'].sum()
-    total_restgaeld_obl_kontant = filtered_df['restgaeld_obl_kontant'].sum()
-    total_restgaeld = total_restgaeld_obl + total_restgaeld_obl_kontant
-    share_restgaeld_obl = total_restgaeld_obl / total_restgaeld if total_restgaeld != 0 else 0
-    share_restgaeld_obl_kontant = total_restgaeld_obl_kontant / total_restgaeld if total_restgaeld != 0 else 0
-    return share_restgaeld_obl, share_restgaeld_obl_kontant
-
-@st.cache_data
-def calculate_loan_shares(df, isin):
-    filtered_df = df[(df['isin'] == isin) & df['laan_gruppe'].isin(['A', 'B'])].copy()
-    total_loans_A = filtered_df[filtered_df['laan_gruppe'] == 'A'][['restgaeld_obl', 'restgaeld_obl_kontant']].sum().sum()
-    total_loans_B = filtered_df[filtered_df['laan_gruppe'] == 'B'][['restgaeld_obl', 'restgaeld_obl_kontant']].sum().sum()
-    total_loans = total_loans_A + total_loans_B
-    share_A = total_loans_A / total_loans if total_loans != 0 else 0
-    share_B = total_loans_B / total_loans if total_loans != 0 else 0
-    return share_A, share_B
-
-@st.cache_data
-def calculate_interval_distribution(df, selected_isins):
-    interval_dfs = []
-    for isin in selected_isins:
-        filtered_df = df[df['isin'] == isin].copy()
-        interval_data = filtered_df.groupby('restgaeldinterval').agg(
-            total_restgaeld_obl=('restgaeld_obl', 'sum'),
-            total_restgaeld_obl_kontant=('restgaeld_obl_kontant', 'sum')
-        ).reset_index()
-        interval_data['total_restgaeld'] = interval_data['total_restgaeld_obl'] + interval_data['total_restgaeld_obl_kontant']
-        total_restgaeld = interval_data['total_restgaeld'].sum()
-        interval_data['percentage'] = (interval_data['total_restgaeld'] / total_restgaeld) * 100 if total_restgaeld != 0 else 0
-        interval_data['isin'] = isin
-        interval_dfs.append(interval_data)
-    all_intervals_df = pd.concat(interval_dfs)
-    pivoted_intervals_df = all_intervals_df.pivot(index='isin', columns='restgaeldinterval', values='percentage').fillna(0)
-    pivoted_intervals_df['total'] = all_intervals_df.groupby('isin')['total_restgaeld'].sum()
-    return pivoted_intervals_df
-
-@st.cache_data
-def gather_loan_shares(df, selected_isins):
-    shares_data = []
-    for isin in selected_isins:
-        share_a, share_b = calculate_loan_shares(df, isin)
-        share_obl, share_kontant = calculate_restgaeld_shares(df, isin)
-        shares_data.append({
-            'isin': isin, 
-            'Private': share_a*100, 
-            'Commercial': share_b*100, 
-            'Obl (%)': share_obl*100, 
-            'Cash (%)': share_kontant*100
-        })
-    shares_df = pd.DataFrame(shares_data)
-    return shares_df.set_index('isin')
-
-@st.cache_data
-def calculate_avg_loan_size_per_laan_gruppe(df, selected_isins):
-    loan_size_dfs = []
-    for isin in selected_isins:
-        df_filtered = df[(df['laan_gruppe'] != 'C') & (df['isin'] == isin)].copy()
-        aggregated_data = df_filtered.groupby(['laan_gruppe', 'restgaeldinterval']).agg(
-            total_restgaeld_obl=('restgaeld_obl', 'sum'),
-            total_restgaeld_obl_kontant=('restgaeld_obl_kontant', 'sum'),
-            total_antal_obl_laan=('antal_obl_laan', 'sum'),
-            total_antal_kontant_laan=('antal_kontant_laan', 'sum')
-        ).reset_index()
-        aggregated_data['total_loan_amount'] = aggregated_data['total_restgaeld_obl'] + aggregated_data['total_restgaeld_obl_kontant']
-        aggregated_data['total_loan_count'] = aggregated_data['total_antal_obl_laan'] + aggregated_data['total_antal_kontant_laan']
-        aggregated_data['avg_loan_size'] = aggregated_data['total_loan_amount'] / aggregated_data['total_loan_count']
-        aggregated_data['avg_obl_loan_size'] = aggregated_data['total_restgaeld_obl'] / aggregated_data['total_antal_obl_laan']
-        aggregated_data['avg_kontant_loan_size'] = aggregated_data['total_restgaeld_obl_kontant'] / aggregated_data['total_antal_kontant_laan']
-        aggregated_data.replace([float('inf'), -float('inf')], pd.NA, inplace=True)
-        aggregated_data['isin'] = isin
-        loan_size_dfs.append(aggregated_data)
-    return pd.concat(loan_size_dfs)
-
-@st.cache_data
-def calculate_afdrag_percentage(df):
+# Analytics results are keyed by snapshot version, not by hashing the frames,
+# and the cache is bounded so old snapshots' results age out. Every call is
+# timed and counted as a hit or miss (see instrumentation.cached)
+CACHE_TTL = 60 * 60
+CACHE_MAX_ENTRIES = 256
+analytics_cache = instrumentation.cached(st.cache_data(ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                                                       hash_funcs=snapshot_store.SNAPSHOT_HASH_FUNCS))
+
+# Figures are keyed the same way, by snapshot version plus the ISINs, dates and
+# chart (the builder function) shown. st.cache_resource hands every session the
+# same figure instead of unpickling a copy; st.plotly_chart only reads it
+FIGURE_CACHE_MAX_ENTRIES = 64
+figure_cache = instrumentation.cached(st.cache_resource(ttl=CACHE_TTL, max_entries=FIGURE_CACHE_MAX_ENTRIES,
+                                                        hash_funcs=snapshot_store.SNAPSHOT_HASH_FUNCS))
+
+
+@st.cache_resource
+def snapshot_publisher():
+    # One per server process: sessions read the snapshot it has published
+    return snapshots.SnapshotPublisher()
+
+
+@st.cache_resource
+def start_refresher():
+    # One refresher per server process; it keeps the snapshot store current and
+    # loads each new snapshot on its own thread, so sessions never wait for it.
+    # Turned off with DEBITOR_APP_REFRESHER=0 when `python refresh.py` runs as
+    # a separate worker; new snapshots are then loaded when the state file changes
+    if not refresh.APP_REFRESHER:
+        return None
+    refresher = refresh.BackgroundRefresher(on_refresh=snapshot_publisher().update)
+    refresher.start()
+    return refresher
+
+
+def plotly_express():
+    # Imported with the first chart instead of at start-up, so Home and the
+    # data loading never wait for plotly
+    with instrumentation.span('import plotly'):
+        import plotly.express as px
+    return px
+
+
+def load_dataset(dataset):
+    """
+    The published snapshot of one dataset, loaded when a page first needs it.
+    A refresh swaps in the new snapshot, which sessions get on their next rerun.
     """
-    Calculates the percentage and cumulative percentage of 'afdrag_belob' for each ISIN relative to the total 'afdrag_belob' for that ISIN.
+    with st.spinner('Loading data...'):
+        data = snapshot_publisher().current(dataset)
+    if data is None:
+        # Empty store: the refresher is downloading and parsing the first snapshot
+        st.info("The data is being downloaded and parsed for the first time. This takes a minute or two.")
+        st.button("Check again")
+        st.stop()
+    return data
 
-    Parameters:
-    df (pd.DataFrame): The input DataFrame containing columns 'isin', 'afdrag_belob', and 'terminsdato'.
+def history_token():
+    path = history.history_path()
+    return os.path.getmtime(path) if os.path.exists(path) else None
 
-    Returns:
-    pd.DataFrame: The DataFrame with additional 'afdrag_percentage' and 'cumulative_percentage' columns.
-    """
-    # Step 1: Calculate the total afdrag_belob for each ISIN
-    total_afdrag_per_isin = df.groupby('isin')['afdrag_belob'].sum().reset_index()
-    total_afdrag_per_isin.rename(columns={'afdrag_belob': 'total_afdrag_belob'}, inplace=True)
 
-    # Step 2: Merge this total back into the original DataFrame
-    df = pd.merge(df, total_afdrag_per_isin, on='isin')
+@instrumentation.cached(st.cache_data)
+def load_history(token):
+    # token (the history file's mtime) only keys the cache
+    df = history.read_history()
+    catalog = isin_catalog.IsinCatalog.from_history(df) if not df.empty else None
+    return snapshot_store.SnapshotHandle(str(token), df, catalog=catalog)
+
+@analytics_cache
+def calculate_percentage(data, selected_isins):
+    return analytics.calculate_percentage(data.df, selected_isins)
+
+@analytics_cache
+def compute_avg_loan_size(data, selected_isins):
+    return analytics.compute_avg_loan_size(data.df, selected_isins)
+
+@analytics_cache
+def calculate_isin_totals(data, isin):
+    return metrics_cube.isin_totals(data.cube, [isin]).loc[isin]
 
-    # Step 3: Calculate the percentage
-    df['afdrag_percentage'] = (df['afdrag_belob'] / df['total_afdrag_belob']) * 100
+@analytics_cache
+def calculate_summary_table(data, selected_isins):
+    return metrics_cube.summary_table(data.cube, selected_isins)
 
-    # Step 4: Sort the DataFrame by ISIN and date to ensure proper cumulative calculation
-    df.sort_values(by=['isin', 'terminsdato'], inplace=True)
+@analytics_cache
+def calculate_large_loans(data, top_n):
+    return metrics_cube.large_loans(data.cube, top_n)
 
-    # Step 5: Calculate the cumulative percentage for each ISIN
-    df['cumulative_percentage'] = df.groupby('isin')['afdrag_percentage'].cumsum()
+@analytics_cache
+def calculate_prepayment_pressure(data):
+    return metrics_cube.prepayment_pressure(data.cube, data.terminated)
 
-    return df
+@analytics_cache
+def calculate_avg_loan_size_per_laan_gruppe(data, selected_isins):
+    return analytics.calculate_avg_loan_size_per_laan_gruppe(data.df, selected_isins)
+
+@analytics_cache
+def interval_share_history(data, selected_isins, intervals, last_n):
+    return history.interval_share_history(data.df, selected_isins, intervals, last_n)
+
+
+def isin_selector(data, default_isins, label="Select ISINs:", key='isins'):
+    """
+    ISIN multiselect fed from the snapshot's IsinCatalog. A search box, an
+    issuer filter and, when maturities are known, a maturity range narrow the
+    options on the server, so the widget is sent the selected ISINs plus the
+    largest matches rather than every ISIN in the snapshot.
+
+    Returns:
+    list: The selected ISINs.
+    """
+    catalog = data.catalog
+    if catalog is None:
+        return []
+    # The options change with every search, which recreates the widget, so the
+    # selection is kept in session state and passed back in as its default
+    selected_key = f'{key}_selected'
+    selected = [isin for isin in st.session_state.get(selected_key, default_isins) if isin in catalog]
+
+    years = catalog.maturity_years()
+    columns = st.columns(3 if years and years[0] < years[1] else 2)
+    with columns[0]:
+        query = st.text_input("Search ISINs:", key=f'{key}_query',
+                              placeholder="ISIN prefix, e.g. DK00095, or pasted ISINs")
+    with columns[1]:
+        issuers = st.multiselect("Issuers:", catalog.issuers, key=f'{key}_issuers')
+    maturity = None
+    if len(columns) == 3:
+        with columns[2]:
+            maturity = st.slider("Maturity:", years[0], years[1], years, key=f'{key}_maturity')
+        # The full range also keeps ISINs without a known maturity
+        maturity = None if maturity == years else maturity
+
+    with instrumentation.span('IsinCatalog.search'):
+        candidates, matches = catalog.search(query, issuers, maturity)
+    if (query or issuers or maturity) and st.button(f"Add all {len(candidates)} shown matches", key=f'{key}_add'):
+        selected += [isin for isin in candidates if isin not in selected]
+    options = selected + [isin for isin in candidates if isin not in selected]
+    selected = st.multiselect(label, options=options, default=selected)
+    if matches > len(candidates):
+        st.caption(f"Showing the {len(candidates)} largest of {matches} matching ISINs by restgæld; "
+                   "search or filter to narrow them down.")
+    st.session_state[selected_key] = selected
+    return selected
+
+
+def display_table(df, name, **number_format):
+    """
+    Shows df as a styled table, tables.PAGE_ROWS rows at a time; longer tables
+    get a page picker and only the page in view is rendered.
+    number_format is passed on to tables.html_table().
+    """
+    start, stop = 0, len(df)
+    if len(df) > tables.PAGE_ROWS:
+        pages = -(-len(df) // tables.PAGE_ROWS)
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f'{name}_page')
+        start, stop = tables.page_bounds(len(df), page)
+    with instrumentation.span(f'html_table.{name}', rows=stop - start):
+        html = tables.html_table(df.iloc[start:stop], **number_format)
+    st.markdown(html, unsafe_allow_html=True)
+    if stop - start < len(df):
+        st.caption(f"Rows {start + 1}-{stop} of {len(df)}")
 
 
 # Main function
 def main():
+    instrumentation.start_run()
     
     with st.sidebar:
         selected = option_menu(
             "Main Menu",
-            ["Home", "Debtor Distribution", "Large Loans", "Cashflow"],
-            icons=['house', 'graph-up', 'list-ol', 'bar-chart'],
+            ["Home", "Debtor Distribution", "Large Loans", "Trends", "Cashflow"],
+            icons=['house', 'graph-up', 'list-ol', 'clock-history', 'bar-chart'],
             menu_icon="cast",
             default_index=1,
         )
     
-    with st.spinner('Loading data...'):
-        if 'data_loaded' not in st.session_state:
-            st.session_state.df, st.session_state.df_r = load_files()
-            st.session_state.data_loaded = True
-        
-        df = st.session_state.df
-        df_r = st.session_state.df_r
-    
+    start_refresher()
+
+    # Each page loads only the dataset it shows
     if selected == "Home":
         display_home()
     elif selected == "Debtor Distribution":
-        display_debitor_analysis(df)
+        display_debitor_analysis(load_dataset('debitor'))
     elif selected == "Large Loans":
-        display_large_loans(df)
+        display_large_loans(load_dataset('debitor'))
+    elif selected == "Trends":
+        display_trends(load_history(history_token()))
     elif selected == "Cashflow":
-        display_redemption(df_r)
+        display_redemption(load_dataset('redemption'))
+
+    events = instrumentation.finish_run()
+    if instrumentation.DEBUG_PANEL:
+        display_debug_panel(events)
+
+def display_debug_panel(events):
+    # Shown with DEBITOR_DEBUG=1; the process totals also go to DEBITOR_METRICS_FILE
+    spans, cache = instrumentation.snapshot()
+    with st.sidebar.expander("Debug: timings"):
+        st.caption("This rerun")
+        run_df = pd.DataFrame([{'span': '\u2003' * event['depth'] + event['name'],
+                                'cache': event.get('cache', ''),
+                                'ms': round(event['seconds'] * 1000, 2)} for event in events])
+        st.dataframe(run_df, hide_index=True, use_container_width=True)
+        st.caption("Cache (since start)")
+        cache_df = pd.DataFrame.from_dict(cache, orient='index', columns=['hit', 'miss'])
+        st.dataframe(cache_df, use_container_width=True)
+        st.caption("Spans (since start)")
+        spans_df = pd.DataFrame.from_dict(spans, orient='index')
+        if not spans_df.empty:
+            spans_df['mean_ms'] = spans_df['total'] / spans_df['count'] * 1000
+            spans_df['max_ms'] = spans_df['max'] * 1000
+            st.dataframe(spans_df[['count', 'mean_ms', 'max_ms']].round(2).sort_values('mean_ms', ascending=False),
+                         use_container_width=True)
+        st.download_button("Download Prometheus metrics", instrumentation.prometheus_text(),
+                           file_name='debitor_metrics.prom', mime='text/plain')
 
 # Display functions
+@instrumentation.timed()
 def display_home():
     st.title("Danish Bonds Data")
     st.write("Welcome to the Danish Bonds Data dashboard.")
     st.write("Use the sidebar to navigate through different datasets.")
     st.info("This dashboard provides insights into Danish bonds, including debtor distribution and large loans analysis.")
 
-def display_debitor_analysis(df):
+@instrumentation.timed()
+def display_debitor_analysis(data):
     st.title("Debtor Distribution")
-    isin_options = df['isin'].unique()
     default_isins = ['DK0009540981', 'DK0009409922', 'DK0006359286', 'DK0004626918', 'DK0002058346', 'DK0009541013', 'DK0009409419', 'DK0006359369', 'DK0004627056', 'DK0002058429']
-    default_isins = [isin for isin in default_isins if isin in isin_options]
-    selected_isins = st.multiselect("Select ISINs:", options=isin_options, default=default_isins)
+    selected_isins = isin_selector(data, default_isins, key='debtor_isins')
     
     if not selected_isins:
         st.warning("Please select at least one ISIN to view analysis.")
         return
     
-    interval_distribution_df = calculate_interval_distribution(df, selected_isins)
-    
-    interval_mapping = {
-    1: "0-200k",
-    2: "200k-500k",
-    3: "500k-1m",
-    4: "1-3m",
-    5: "3-10m",
-    6: "10-50m",
-    7: "+50m",
-    }
-    
-    # Dynamically rename the columns based on the mapping
-    interval_distribution_df = interval_distribution_df.rename(columns=interval_mapping)
-    #interval_distribution_df.columns = ["0-200k", '200k-500k', '500k-1m', '1-3m', '3-10m', '10-50m', '+50m', 'total']
-    loan_shares_df = gather_loan_shares(df, selected_isins)
-    merged_df = interval_distribution_df.merge(loan_shares_df, left_index=True, right_index=True)
-    merged_df.columns = merged_df.columns.map(str)
-    
-    tab1, tab2, tab3 = st.tabs(["Distribution", "Loan Sizes", "Summary"])
+    # st.tabs would run every tab's code on each rerun; only the chosen view is computed
+    view = st.radio("View", ["Distribution", "Loan Sizes", "Summary"], horizontal=True,
+                    label_visibility='collapsed', key='debtor_view')
     
-    with tab1:
-        display_distribution(df, selected_isins)
-    
-    with tab2:
-        display_loan_sizes(df, selected_isins)
-    
-    with tab3:
-        display_summary(merged_df)
-
-def display_distribution(df, selected_isins):
+    if view == "Distribution":
+        display_distribution(data, selected_isins)
+    elif view == "Loan Sizes":
+        display_loan_sizes(data, selected_isins)
+    else:
+        display_summary(calculate_summary_table(data, selected_isins))
+
+@instrumentation.timed()
+def display_distribution(data, selected_isins):
     st.header("Debtor Distribution")
     
     with st.spinner('Calculating distribution...'):
-        percentage_df = calculate_percentage(df, selected_isins)
+        percentage_df = calculate_percentage(data, selected_isins)
     
-    fig_obl = px.bar(percentage_df, x='restgaeldinterval', y='percentage', color='isin', barmode='group',
-                     title='Percentage Distribution of Obl',
-                     labels={'restgaeldinterval': 'Loan Interval', 'percentage': 'Percentage'},
-                     hover_data=['isin', 'laan_gruppe'])
+    px = plotly_express()
+    with instrumentation.span('figure.obl_distribution'):
+        fig_obl = px.bar(percentage_df, x='restgaeldinterval', y='percentage', color='isin', barmode='group',
+                         title='Percentage Distribution of Obl',
+                         labels={'restgaeldinterval': 'Loan Interval', 'percentage': 'Percentage'},
+                         hover_data=['isin', 'laan_gruppe'])
     st.plotly_chart(fig_obl, use_container_width=True)
     
-    fig_cash = px.bar(percentage_df, x='restgaeldinterval', y='percentage_obl_kontant', color='isin', barmode='group',
-                      title='Percentage Distribution of Cash Loans',
-                      labels={'restgaeldinterval': 'Loan Interval', 'percentage_obl_kontant': 'Percentage'},
-                      hover_data=['isin', 'laan_gruppe'])
+    with instrumentation.span('figure.cash_distribution'):
+        fig_cash = px.bar(percentage_df, x='restgaeldinterval', y='percentage_obl_kontant', color='isin', barmode='group',
+                          title='Percentage Distribution of Cash Loans',
+                          labels={'restgaeldinterval': 'Loan Interval', 'percentage_obl_kontant': 'Percentage'},
+                          hover_data=['isin', 'laan_gruppe'])
     st.plotly_chart(fig_cash, use_container_width=True)
 
     selected_isin = st.selectbox("Breakdown of selected ISIN:", selected_isins, key='debtor')
 
     if selected_isin:
-        percentage_df = calculate_percentage(df, [selected_isin])
-        pivoted_df = percentage_df.pivot_table(index=['isin', 'restgaeldinterval'], columns='laan_gruppe', values='percentage', aggfunc='sum', margins=True, margins_name="Total")
-        pivoted_df_kontant = percentage_df.pivot_table(index=['isin', 'restgaeldinterval'], columns='laan_gruppe', values='percentage_obl_kontant', aggfunc='sum', margins=True, margins_name="Total")
-
-        rest_obl = df[(df['isin'] == selected_isin)]['restgaeld_obl'].sum()
-        rest_kontant = df[(df['isin'] == selected_isin)]['restgaeld_obl_kontant'].sum()
-        share_obl, share_kontant = calculate_restgaeld_shares(df, selected_isin)
-        share_a, share_b = calculate_loan_shares(df, selected_isin)
+        percentage_df = calculate_percentage(data, [selected_isin])
+        pivoted_df = percentage_df.pivot_table(index=['isin', 'restgaeldinterval'], columns='laan_gruppe', values='percentage', aggfunc='sum', margins=True, margins_name="Total", observed=True)
+        pivoted_df_kontant = percentage_df.pivot_table(index=['isin', 'restgaeldinterval'], columns='laan_gruppe', values='percentage_obl_kontant', aggfunc='sum', margins=True, margins_name="Total", observed=True)
+
+        totals = calculate_isin_totals(data, selected_isin)
+        rest_obl, rest_kontant = totals['restgaeld_obl'], totals['restgaeld_obl_kontant']
+        share_obl, share_kontant = totals['share_obl'], totals['share_kontant']
+        share_a, share_b = totals['share_a'], totals['share_b']
         
         st.markdown(f"""
         <div class='info-box'>
@@ -273,7 +320,7 @@ def display_distribution(df, selected_isins):
             p_df = pivoted_df.loc[selected_isin].fillna(0)
             p_df.columns.name = 'LoanInterval'
             p_df.index.name = None
-            st.markdown(p_df.to_html(classes='styled-table'), unsafe_allow_html=True)
+            display_table(p_df, 'pivot_obl', decimals=tables.TO_HTML_DECIMALS, trim_zeros=True)
         with col2:
             st.markdown(f"""
         <div class='info-box'>
@@ -284,31 +331,35 @@ def display_distribution(df, selected_isins):
             p_df = pivoted_df_kontant.loc[selected_isin].fillna(0)
             p_df.columns.name = 'LoanInterval'
             p_df.index.name = None
-            st.markdown(p_df.to_html(classes='styled-table'), unsafe_allow_html=True)
+            display_table(p_df, 'pivot_kontant', decimals=tables.TO_HTML_DECIMALS, trim_zeros=True)
 
-def display_loan_sizes(df, selected_isins):
+@instrumentation.timed()
+def display_loan_sizes(data, selected_isins):
     st.header("Average Loan Sizes")
     
     with st.spinner('Calculating average loan sizes...'):
-        loan_size_df_combined = compute_avg_loan_size(df, selected_isins)
+        loan_size_df_combined = compute_avg_loan_size(data, selected_isins)
     
-    fig_loan_size = px.bar(loan_size_df_combined.melt(id_vars=['isin', 'restgaeldinterval'], value_vars=['Avg_obl_loan', 'Avg_cash_loan']), 
-                           x='restgaeldinterval', y='value', color='isin', facet_col='variable', barmode='group',
-                           title='Average Loan Sizes Across Restgæld Interval for Obl and Cash loans',
-                           labels={'restgaeldinterval': 'Restgæld Interval', 'value': 'Average Loan Size'},
-                           hover_data=['isin'])
+    px = plotly_express()
+    with instrumentation.span('figure.avg_loan_size'):
+        fig_loan_size = px.bar(loan_size_df_combined.melt(id_vars=['isin', 'restgaeldinterval'], value_vars=['Avg_obl_loan', 'Avg_cash_loan']), 
+                               x='restgaeldinterval', y='value', color='isin', facet_col='variable', barmode='group',
+                               title='Average Loan Sizes Across Restgæld Interval for Obl and Cash loans',
+                               labels={'restgaeldinterval': 'Restgæld Interval', 'value': 'Average Loan Size'},
+                               hover_data=['isin'])
     st.plotly_chart(fig_loan_size, use_container_width=True)
     
-    loan_size_df_gruppe_combined = calculate_avg_loan_size_per_laan_gruppe(df, selected_isins)
-    fig_loan_size = px.bar(
-        loan_size_df_gruppe_combined.melt(id_vars=['isin', 'restgaeldinterval', 'laan_gruppe'], value_vars=['avg_loan_size']),
-        x='restgaeldinterval',
-        y='value',
-        color='isin',
-        facet_col='laan_gruppe',
-        barmode='group',
-        title='Average Loan Sizes Across Restgaeldinterval for Privat and Other Loans'
-    )
+    loan_size_df_gruppe_combined = calculate_avg_loan_size_per_laan_gruppe(data, selected_isins)
+    with instrumentation.span('figure.avg_loan_size_gruppe'):
+        fig_loan_size = px.bar(
+            loan_size_df_gruppe_combined.melt(id_vars=['isin', 'restgaeldinterval', 'laan_gruppe'], value_vars=['avg_loan_size']),
+            x='restgaeldinterval',
+            y='value',
+            color='isin',
+            facet_col='laan_gruppe',
+            barmode='group',
+            title='Average Loan Sizes Across Restgaeldinterval for Privat and Other Loans'
+        )
 
     st.plotly_chart(fig_loan_size, use_container_width=True)
     
@@ -320,13 +371,13 @@ def display_loan_sizes(df, selected_isins):
 <strong>ISIN:</strong> {subset_isin}
 </div>
 """, unsafe_allow_html=True)
-        loan_size_df = compute_avg_loan_size(df, [subset_isin])
-        df_l = loan_size_df.pivot_table(index='restgaeldinterval', columns='laan_gruppe', values=['Avg_obl_loan', 'Avg_cash_loan'], aggfunc='mean').fillna(0)
-        df_l = df_l.map(lambda x: f"{x:,.0f}")
+        loan_size_df = compute_avg_loan_size(data, [subset_isin])
+        df_l = loan_size_df.pivot_table(index='restgaeldinterval', columns='laan_gruppe', values=['Avg_obl_loan', 'Avg_cash_loan'], aggfunc='mean', observed=True).fillna(0)
         df_l.index.name = None
         df_l.columns.name = None
-        st.markdown(df_l.to_html(classes='styled-table'), unsafe_allow_html=True)
+        display_table(df_l, 'avg_loan_size', decimals=0, thousands=True)
 
+@instrumentation.timed()
 def display_summary(merged_df):
     st.header("Summary Statistics")
     
@@ -352,29 +403,16 @@ def display_summary(merged_df):
         mime='text/csv',
     )
 
-def display_large_loans(df):
-    st.title("Large Loans Analysis")
-    
-    with st.spinner('Analyzing large loans...'):
-        isin_options = df['isin'].unique()
-        total_int_distribution = calculate_interval_distribution(df, isin_options)
-        total_int_distribution.columns = ["0-200k", '200k-500k', '500k-1m', '1-3m', '3-10m', '10-50m', '+50m', 'total']
-        
-        # Combine '10-50m' and '+50m' into a single threshold column
-        total_int_distribution['Over 10m'] = total_int_distribution['10-50m'] + total_int_distribution['+50m']
-        
-        # Sort by the new combined column and select the top 50
-        top_50_isins = total_int_distribution.sort_values('Over 10m', ascending=False).head(50)
-        
-        st.subheader("Top 50 ISINs with the Highest Combined Percentage in 'Over 10m'")
-        st.dataframe(top_50_isins, use_container_width=True)
-        
-        # Custom colorscale for the stacked bar chart
-        custom_colors = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692']
-        
-        # Stacked Bar Chart: Loan Distribution Across Buckets by ISIN
-        fig_stacked = px.bar(
-            top_50_isins.reset_index(),
+@figure_cache
+def large_loans_stacked_figure(data, top_n):
+    top_isins = calculate_large_loans(data, top_n)
+    # Custom colorscale for the stacked bar chart
+    custom_colors = ['#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A', '#19D3F3', '#FF6692']
+    px = plotly_express()
+    # Stacked Bar Chart: Loan Distribution Across Buckets by ISIN
+    with instrumentation.span('figure.large_loans_stacked'):
+        fig = px.bar(
+            top_isins.reset_index(),
             x='isin',
             y=["0-200k", "200k-500k", "500k-1m", "1-3m", "3-10m", "10-50m", "+50m"],
             title='Loan Distribution Across Buckets by ISIN',
@@ -383,24 +421,166 @@ def display_large_loans(df):
             barmode='stack',
             color_discrete_sequence=custom_colors
         )
-        fig_stacked.update_layout(xaxis_tickangle=-45)
-        st.plotly_chart(fig_stacked, use_container_width=True)
-        
-        # Bar Chart: Combined Percentage of Loans Over 10m by ISIN
-        fig_combined = px.bar(
-            top_50_isins.reset_index(),
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+@figure_cache
+def large_loans_over_10m_figure(data, top_n):
+    top_isins = calculate_large_loans(data, top_n)
+    px = plotly_express()
+    # Bar Chart: Combined Percentage of Loans Over 10m by ISIN
+    with instrumentation.span('figure.large_loans_over_10m'):
+        fig = px.bar(
+            top_isins.reset_index(),
             x='isin',
             y='Over 10m',
             title='Combined Percentage of Loans Over 10m by ISIN',
             labels={'isin': 'ISIN', 'Over 10m': 'Combined Percentage of Loans Over 10m'},
             hover_data=['isin']
         )
-        fig_combined.update_layout(xaxis_tickangle=-45)
-        st.plotly_chart(fig_combined, use_container_width=True)
+    fig.update_layout(xaxis_tickangle=-45)
+    return fig
+
+@instrumentation.timed()
+def display_large_loans(data):
+    st.title("Large Loans Analysis")
+    
+    with st.spinner('Analyzing large loans...'):
+        # The top 50 by the combined '10-50m' and '+50m' share
+        top_50_isins = calculate_large_loans(data, 50)
+        
+        st.subheader("Top 50 ISINs with the Highest Combined Percentage in 'Over 10m'")
+        st.dataframe(top_50_isins, use_container_width=True)
+        
+        st.plotly_chart(large_loans_stacked_figure(data, 50), use_container_width=True)
+        st.plotly_chart(large_loans_over_10m_figure(data, 50), use_container_width=True)
+
+    display_prepayment_pressure(data)
+
+
+@instrumentation.timed()
+def display_prepayment_pressure(data):
+    if data.terminated is None or data.terminated.empty:
+        return
+
+    st.subheader("Top 50 ISINs by Terminated Loans (Prepayment Pressure)")
+    pressure_df = calculate_prepayment_pressure(data)
+    top_50_pressure = pressure_df[pressure_df['opsagt_beloeb'] > 0].head(50)
+    if top_50_pressure.empty:
+        st.info("No terminated loans in the current publications.")
+        return
+
+    st.dataframe(top_50_pressure.rename(columns={
+        'antal_opsagte_laan': 'Terminated Loans',
+        'opsagt_beloeb': 'Terminated Amount',
+        'restgaeld': 'Restgæld',
+        'pressure': 'Terminated (%)',
+    }), use_container_width=True)
+
+    px = plotly_express()
+    with instrumentation.span('figure.prepayment_pressure'):
+        fig_pressure = px.bar(
+            top_50_pressure.reset_index(),
+            x='isin',
+            y='pressure',
+            title='Terminated Amount as Percentage of Restgæld by ISIN',
+            labels={'isin': 'ISIN', 'pressure': 'Terminated (%)'},
+            hover_data=['opsagt_beloeb', 'antal_opsagte_laan']
+        )
+    fig_pressure.update_layout(xaxis_tickangle=-45)
+    st.plotly_chart(fig_pressure, use_container_width=True)
 
 
-def display_redemption(df):
+@instrumentation.timed()
+def display_trends(data):
+    st.title("Trends")
+    df = data.df
+    if df.empty:
+        st.info("No publication history yet. Run `python history.py` to backfill older issuer files.")
+        return
+
+    interval_mapping = metrics_cube.INTERVAL_LABELS
+    default_isins = ['DK0009540981', 'DK0009409922', 'DK0006359286', 'DK0004626918', 'DK0002058346']
+    selected_isins = isin_selector(data, default_isins, key='trend_isins')
+    intervals = st.multiselect("Loan intervals:", options=list(interval_mapping), default=[7],
+                               format_func=interval_mapping.get, key='trend_intervals')
+    publications = df['published'].nunique()
+    last_n = st.number_input("Last N publications:", min_value=1, max_value=max(publications, 1),
+                             value=min(12, max(publications, 1)))
+
+    if not selected_isins or not intervals:
+        st.warning("Please select at least one ISIN and one interval.")
+        return
+
+    trend_df = interval_share_history(data, selected_isins, intervals, last_n)
+    label = ', '.join(interval_mapping[interval] for interval in intervals)
+    px = plotly_express()
+    with instrumentation.span('figure.trend'):
+        fig_trend = px.line(trend_df, x='published', y='share', color='isin', markers=True,
+                            title=f"Share of Restgæld in {label} per Publication",
+                            labels={'published': 'Published', 'share': 'Percentage'})
+    st.plotly_chart(fig_trend, use_container_width=True)
+
+    table = trend_df.pivot(index='published', columns='isin', values='share')
+    table.index = table.index.strftime('%Y-%m-%d')
+    table.index.name = None
+    table.columns.name = None
+    display_table(table, 'trend', suffix='%')
+
+
+@figure_cache
+def cumulative_redemption_figure(data, selected_isins, start_date, end_date):
+    filtered_df = data.cashflows.frame(selected_isins)
+    # Filter by date range; the dates are midnights, so this keeps whole days
+    dates = filtered_df['terminsdato']
+    date_filtered_df = filtered_df[(dates >= pd.Timestamp(start_date)) &
+                                   (dates < pd.Timestamp(end_date) + pd.Timedelta(days=1))]
+    # Long schedules are thinned to charts.MAX_POINTS points per ISIN before plotting
+    with instrumentation.span('downsample.cumulative_redemption', rows=len(date_filtered_df)):
+        date_filtered_df = charts.downsample(date_filtered_df, 'terminsdato', 'cumulative_percentage', 'isin')
+
+    px = plotly_express()
+    # Create plot
+    with instrumentation.span('figure.cumulative_redemption'):
+        fig = px.line(
+            date_filtered_df,
+            x='terminsdato',
+            y='cumulative_percentage',
+            color='isin',
+            title='Cumulative Redemption Percentage Over Time',
+            labels={
+                'terminsdato': 'Date',
+                'cumulative_percentage': 'Cumulative Percentage (%)',
+                'isin': 'ISIN'
+            },
+            markers=True,
+            log_y=True
+        )
+
+    # Customize plot
+    fig.update_layout(
+        hovermode='x unified',
+        xaxis_title="Date",
+        yaxis_title="Cumulative Percentage (log scale)",
+        legend_title="ISIN",
+        showlegend=True
+    )
+
+    # Add hover template
+    fig.update_traces(
+        hovertemplate="<br>".join([
+            "Date: %{x}",
+            "Percentage: %{y:.2f}%",
+            "<extra></extra>"
+        ])
+    )
+    return fig
+
+
+@instrumentation.timed()
+def display_redemption(data):
     st.header("Cash Flows")
+    df = data.df
     
     # Input validation
     if df.empty:
@@ -415,33 +595,19 @@ def display_redemption(df):
 
     # Clean and prepare data
     try:
-        # Convert date column if not already datetime
-        df['terminsdato'] = pd.to_datetime(df['terminsdato'])
-        
-        # Sort by date to ensure correct cumulative calculation
-        df = df.sort_values(['isin', 'terminsdato'])
-        
-        # Calculate percentages
-        new_df = calculate_afdrag_percentage(df)
-        
-        # Get unique ISINs for selection
-        all_isins = new_df['isin'].unique()
+        table = data.cashflows
+
+        # ISIN selection; the first two defaults the snapshot has
         default_isins = ['DK0006357660', 'DK0009542094', 'DK0002058189', 'DK0002058262']
-        default_isins = [isin for isin in default_isins if isin in all_isins]
-        
-        # ISIN selection
-        selected_isins = st.multiselect(
-            "Select ISINs:", 
-            options=all_isins,
-            default=default_isins[:2] if len(default_isins) >= 2 else default_isins
-        )
+        default_isins = [isin for isin in default_isins if isin in data.catalog][:2]
+        selected_isins = isin_selector(data, default_isins, key='redemption_isins')
 
         if not selected_isins:
             st.warning("Please select at least one ISIN to view the data.")
             return
 
-        # Filter data for selected ISINs
-        filtered_df = new_df[new_df['isin'].isin(selected_isins)].copy()
+        # Slice the selected ISINs' schedules out of the precomputed table
+        filtered_df = table.frame(selected_isins)
 
         # Add download button
         st.download_button(
@@ -457,14 +623,14 @@ def display_redemption(df):
             index='terminsdato', 
             columns='isin', 
             values='afdrag_percentage'
-        ).fillna('')
+        )
         
         pivoted_df.index = pivoted_df.index.strftime('%Y-%m-%d')
         pivoted_df.columns.name = None
         pivoted_df.index.name = "Date"
         
-        # Display the table with formatting
-        st.markdown(pivoted_df.to_html(classes='styled-table'), unsafe_allow_html=True)
+        # Display the table with formatting; dates an ISIN has no payment on stay blank
+        display_table(pivoted_df, 'redemption_percentages', decimals=tables.TO_HTML_DECIMALS, trim_zeros=True)
 
         # Create cumulative plot
         st.subheader("Cumulative Redemption Plot")
@@ -479,51 +645,12 @@ def display_redemption(df):
         with col2:
             end_date = st.date_input("End date", date_max, min_value=date_min, max_value=date_max)
 
-        # Filter by date range
-        date_filtered_df = filtered_df[
-            (filtered_df['terminsdato'].dt.date >= start_date) &
-            (filtered_df['terminsdato'].dt.date <= end_date)
-        ]
-
-        # Create plot
-        fig = px.line(
-            date_filtered_df,
-            x='terminsdato',
-            y='cumulative_percentage',
-            color='isin',
-            title='Cumulative Redemption Percentage Over Time',
-            labels={
-                'terminsdato': 'Date',
-                'cumulative_percentage': 'Cumulative Percentage (%)',
-                'isin': 'ISIN'
-            },
-            markers=True,
-            log_y=True
-        )
-
-        # Customize plot
-        fig.update_layout(
-            hovermode='x unified',
-            xaxis_title="Date",
-            yaxis_title="Cumulative Percentage (log scale)",
-            legend_title="ISIN",
-            showlegend=True
-        )
-
-        # Add hover template
-        fig.update_traces(
-            hovertemplate="<br>".join([
-                "Date: %{x}",
-                "Percentage: %{y:.2f}%",
-                "<extra></extra>"
-            ])
-        )
-
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(cumulative_redemption_figure(data, selected_isins, start_date, end_date),
+                        use_container_width=True)
 
         # Display summary statistics
         st.subheader("Summary Statistics")
-        summary_df = filtered_df.groupby('isin').agg({
+        summary_df = filtered_df.groupby('isin', observed=True).agg({
             'afdrag_belob': ['sum', 'mean', 'std'],
             'cumulative_percentage': 'max'
         }).round(2)
@@ -531,9 +658,45 @@ def display_redemption(df):
         summary_df.columns = ['Total Redemption', 'Average Redemption', 'Std Dev', 'Final Cumulative %']
         st.dataframe(summary_df)
 
+        display_portfolio_projection(table, selected_isins)
+
     except Exception as e:
         st.error(f"An error occurred while processing the data: {str(e)}")
         st.write("Please check the data format and try again.")
     
+@instrumentation.timed()
+def display_portfolio_projection(table, selected_isins):
+    st.subheader("Portfolio Cashflow Projection")
+    st.write("Nominal held per ISIN:")
+    cols = st.columns(min(len(selected_isins), 4))
+    portfolio = {}
+    for i, isin in enumerate(selected_isins):
+        with cols[i % len(cols)]:
+            portfolio[isin] = st.number_input(isin, min_value=0.0, value=1_000_000.0, step=100_000.0,
+                                              key=f'nominal_{isin}')
+
+    projection = table.project(portfolio)
+    if projection.empty:
+        return
+
+    px = plotly_express()
+    with instrumentation.span('figure.portfolio_projection'):
+        fig = px.bar(
+            projection.reset_index(),
+            x='terminsdato',
+            y=['afdrag', 'rente'],
+            title='Projected Portfolio Cashflows',
+            labels={'terminsdato': 'Date', 'value': 'Amount', 'variable': 'Cashflow'},
+            barmode='stack'
+        )
+    st.plotly_chart(fig, use_container_width=True)
+
+    st.download_button(
+        label="Download projection as CSV",
+        data=projection.to_csv(),
+        file_name='portfolio_projection.csv',
+        mime='text/csv'
+    )
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,331 @@
+"""
+Synthetic debitormasse and ydelsesraekke files for scale testing.
+
+The bundled files in Data/ hold about 10k debtor rows. The generator writes
+files in the same layouts the issuers publish, at any number of ISINs, so the
+loaders, the store and the analytics can be run at many times production
+volume without network access:
+
+    python synthetic_data.py --out synthetic --scale 100
+    python nasdaq_stub.py --data synthetic/debitor --redemption synthetic/redemption
+
+Every ISIN gets a random subset of the seven restgæld intervals. Each of
+those has a D block for loan groups A and B, and sometimes an I block
+(terminated loans) for group C. Amounts are the loan count times a loan size
+drawn from the interval's range. Redemption schedules are annuities with
+quarterly terms. The same seed gives the same files.
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# How the issuers lay out their files:
+# indent: spaces per nesting level; compact: each record on three lines (RD);
+# zero_pad: integers as 15 digits, rates as 00008.59 (Nykredit, DLR);
+# line_width: every line padded with spaces to this width (Nykredit)
+STYLES = {
+    'nykredit': {'indent': 0, 'compact': False, 'zero_pad': True, 'line_width': 80},
+    'dlr': {'indent': 0, 'compact': False, 'zero_pad': True, 'line_width': 0},
+    'jyske': {'indent': 2, 'compact': False, 'zero_pad': False, 'line_width': 0},
+    'rd': {'indent': 0, 'compact': True, 'zero_pad': False, 'line_width': 0},
+}
+
+# The bundled files: style and ISIN count at production volume
+ISSUER_FILES = {
+    'jyk.xml': ('jyske', 155),
+    'nda.xml': ('jyske', 134),
+    'nyk.xml': ('nykredit', 338),
+    'dlr.xml': ('dlr', 105),
+    'rd.xml': ('rd', 196),
+}
+
+# Loan size range of every restgaeldinterval (metrics_cube.INTERVAL_LABELS), in kroner
+INTERVAL_BOUNDS = {1: (10_000, 200_000), 2: (200_000, 500_000), 3: (500_000, 1_000_000), 4: (1_000_000, 3_000_000),
+                   5: (3_000_000, 10_000_000), 6: (10_000_000, 50_000_000), 7: (50_000_000, 200_000_000)}
+# Mean number of loans per record in each interval, roughly as in the bundled files
+INTERVAL_LOANS = {1: 40, 2: 110, 3: 200, 4: 300, 5: 60, 6: 8, 7: 2}
+
+DEBITOR_FIELDS = ['restgaeld_obl', 'restgaeld_obl_kontant', 'restgaeld_kontant', 'kontant_rente', 'antal_obl_laan',
+                  'antal_kontant_laan', 'fradrags_konto', 'fradrags_konto_laan']
+TERMINATED_FIELDS = ['antal_opsagte_laan', 'opsagt_beloeb']
+RATE_FIELDS = {'kontant_rente'}
+
+DEBITOR_HEADER = ('<?xml version="1.0" ?>\n<debitormasser xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+                  'xsi:noNamespaceSchemaLocation="debitormasse.xsd">\n')
+
+
+def make_isins(count, start=0):
+    """
+    count distinct Danish ISINs, DK followed by nine digits from start on and
+    a valid check digit.
+    """
+    isins = []
+    for number in range(start, start + count):
+        body = f"DK{number:09d}"
+        # ISIN check digit: letters become two digits (A=10), then Luhn over the digits
+        digits = ''.join(str(int(char, 36)) for char in body)
+        total = 0
+        for position, digit in enumerate(reversed(digits)):
+            value = int(digit) * (2 if position % 2 == 0 else 1)
+            total += value // 10 + value % 10
+        isins.append(body + str((10 - total % 10) % 10))
+    return isins
+
+
+def _field_format(field, zero_pad, amount=False):
+    if field in RATE_FIELDS:
+        return '08.2f' if zero_pad else '.2f'
+    if amount:
+        return '018.2f' if zero_pad else '.2f'
+    return '015d' if zero_pad else 'd'
+
+
+def _layout(elements, depth=0):
+    """
+    The lines of one element tree, each with its nesting depth.
+
+    Parameters:
+    elements (list): (tag, children) pairs; children is a list of pairs, or a
+    format field like '{0}' for a leaf.
+
+    Returns:
+    list: (depth, line) pairs.
+    """
+    lines = []
+    for tag, children in elements:
+        if isinstance(children, str):
+            lines.append((depth, f"<{tag}>{children}</{tag}>"))
+        else:
+            lines.append((depth, f"<{tag}>"))
+            lines += _layout(children, depth + 1)
+            lines.append((depth, f"</{tag}>"))
+    return lines
+
+
+def _render(style, lines, sample):
+    options = STYLES[style]
+    rendered = []
+    for depth, line in lines:
+        line = ' ' * (options['indent'] * depth) + line
+        if options['line_width']:
+            # Every field has a fixed width when zero-padded, so the padding is part of the template
+            line += ' ' * max(options['line_width'] - len(line.format(*sample)), 0)
+        rendered.append(line + '\n')
+    return ''.join(rendered)
+
+
+def record_templates(style):
+    """
+    The templates of a debitormasse record with a D block and with an I block.
+    Their positional fields are isin, laan_gruppe, restgaeldinterval and the
+    block's fields in DEBITOR_FIELDS or TERMINATED_FIELDS order.
+
+    Returns:
+    tuple: (D template, I template).
+    """
+    options = STYLES[style]
+    zero_pad = options['zero_pad']
+    templates = []
+    for block, fields in [('D', DEBITOR_FIELDS), ('I', TERMINATED_FIELDS)]:
+        values = [(field, f"{{{index + 3}:{_field_format(field, zero_pad)}}}") for index, field in enumerate(fields)]
+        keys = [('isin', '{0}'), ('laan_gruppe', '{1}'), ('restgaeldinterval', '{2}')]
+        if options['compact']:
+            templates.append('<debitormasse>' + ''.join(f"<{tag}>{field}</{tag}>" for tag, field in keys) + '\n'
+                             + f"<{block}>" + ''.join(f"<{tag}>{field}</{tag}>" for tag, field in values)
+                             + f"</{block}>\n</debitormasse>\n")
+        else:
+            lines = _layout([('debitormasse', keys + [(block, values)])], depth=1 if options['indent'] else 0)
+            templates.append(_render(style, lines, ['DK0000000000', 'A', 1] + [0] * len(fields)))
+    return tuple(templates)
+
+
+def debitor_records(isins, seed=0, interval_rate=0.65, terminated_rate=0.5):
+    """
+    Random debitormasse records for the given ISINs.
+
+    Parameters:
+    seed (int or np.random.Generator): Seed, or a generator to draw from.
+    interval_rate (float): Chance that an ISIN has loans in each interval;
+    every ISIN has at least one.
+    terminated_rate (float): Chance that an ISIN and interval has an I block.
+
+    Returns:
+    tuple: (D records, I records) as DataFrames with isin, laan_gruppe,
+    restgaeldinterval and the block's fields, in file order.
+    """
+    rng = np.random.default_rng(seed)
+    intervals = np.arange(1, 8)
+    present = rng.random((len(isins), len(intervals))) < interval_rate
+    present[np.arange(len(isins)), rng.integers(0, len(intervals), len(isins))] = True
+    isin_positions, interval_positions = np.nonzero(present)
+    keys = pd.DataFrame({'isin': np.asarray(isins, dtype=object)[isin_positions],
+                         'restgaeldinterval': intervals[interval_positions]})
+
+    # Loan groups A and B of every ISIN and interval, next to each other as in the files
+    debitor = keys.loc[keys.index.repeat(2)].reset_index(drop=True)
+    debitor.insert(1, 'laan_gruppe', np.tile(['A', 'B'], len(keys)))
+    n = len(debitor)
+    interval = debitor['restgaeldinterval'].to_numpy()
+    low = np.array([INTERVAL_BOUNDS[i][0] for i in intervals])[interval - 1]
+    high = np.array([INTERVAL_BOUNDS[i][1] for i in intervals])[interval - 1]
+    mean_loans = np.array([INTERVAL_LOANS[i] for i in intervals])[interval - 1]
+    # About a third of the records have no bond loans and half no cash loans, as in the bundled files
+    antal_obl = rng.poisson(mean_loans) * (rng.random(n) > 0.35)
+    antal_kontant = rng.poisson(mean_loans / 20) * (rng.random(n) > 0.5)
+    restgaeld_obl = (antal_obl * rng.uniform(low, high)).astype(np.int64)
+    restgaeld_obl_kontant = (antal_kontant * rng.uniform(low, high)).astype(np.int64)
+    debitor['restgaeld_obl'] = restgaeld_obl
+    debitor['restgaeld_obl_kontant'] = restgaeld_obl_kontant
+    debitor['restgaeld_kontant'] = (restgaeld_obl_kontant * rng.uniform(0.95, 1.0, n)).astype(np.int64)
+    debitor['kontant_rente'] = np.where(antal_kontant > 0, rng.uniform(0.5, 9.5, n).round(2), 0.0)
+    debitor['antal_obl_laan'] = antal_obl
+    debitor['antal_kontant_laan'] = antal_kontant
+    fradrags_laan = rng.binomial(antal_obl + antal_kontant, 0.1)
+    debitor['fradrags_konto'] = (fradrags_laan * rng.uniform(0, 20_000, n)).astype(np.int64)
+    debitor['fradrags_konto_laan'] = fradrags_laan
+
+    terminated = keys[rng.random(len(keys)) < terminated_rate].reset_index(drop=True)
+    terminated.insert(1, 'laan_gruppe', 'C')
+    m = len(terminated)
+    interval = terminated['restgaeldinterval'].to_numpy()
+    opsagte = rng.poisson(np.array([INTERVAL_LOANS[i] for i in intervals])[interval - 1] / 10)
+    low = np.array([INTERVAL_BOUNDS[i][0] for i in intervals])[interval - 1]
+    high = np.array([INTERVAL_BOUNDS[i][1] for i in intervals])[interval - 1]
+    terminated['antal_opsagte_laan'] = opsagte
+    terminated['opsagt_beloeb'] = (opsagte * rng.uniform(low, high, m)).astype(np.int64)
+    return debitor, terminated
+
+
+def _format_records(template, records):
+    rows = zip(*(records[column].tolist() for column in records.columns))
+    return [template.format(*row) for row in rows]
+
+
+def write_debitor_file(file_path, isins, style='nykredit', seed=0, interval_rate=0.65, terminated_rate=0.5,
+                       chunk_isins=10_000):
+    """
+    Writes a debitormasse file for the given ISINs in an issuer's layout (see
+    STYLES), chunk_isins ISINs at a time so memory does not grow with the file.
+
+    Returns:
+    tuple: (D records, I records) written.
+    """
+    rng = np.random.default_rng(seed)
+    d_template, i_template = record_templates(style)
+    header, footer = DEBITOR_HEADER, '</debitormasser>\n'
+    if STYLES[style]['line_width']:
+        # Nykredit breaks the root element's attributes over two lines too
+        header = header.replace(' xsi:noNamespaceSchemaLocation', '\nxsi:noNamespaceSchemaLocation')
+        header, footer = (''.join(line.ljust(STYLES[style]['line_width']) + '\n' for line in text.splitlines())
+                          for text in (header, footer))
+    debitor_rows = terminated_rows = 0
+    # The files are published with Windows line endings
+    with open(file_path, 'w', encoding='utf-8', newline='\r\n') as file:
+        file.write(header)
+        for first in range(0, len(isins), chunk_isins):
+            debitor, terminated = debitor_records(isins[first:first + chunk_isins], rng, interval_rate, terminated_rate)
+            d_records = _format_records(d_template, debitor)
+            # Each ISIN and interval is its A and B records, then its I record when it has one
+            records = [a + b for a, b in zip(d_records[::2], d_records[1::2])]
+            keys = pd.MultiIndex.from_frame(debitor[['isin', 'restgaeldinterval']].iloc[::2])
+            positions = keys.get_indexer(pd.MultiIndex.from_frame(terminated[['isin', 'restgaeldinterval']]))
+            for position, record in zip(positions, _format_records(i_template, terminated)):
+                records[position] += record
+            file.writelines(records)
+            debitor_rows += len(debitor)
+            terminated_rows += len(terminated)
+        file.write(footer)
+    return debitor_rows, terminated_rows
+
+
+def write_redemption_file(file_path, isins, terms=40, start='2024-07-01', style='jyske', seed=0):
+    """
+    Writes a ydelsesraekke file with an annuity schedule of quarterly terms
+    for every ISIN.
+
+    Parameters:
+    terms (int or tuple): Terms per ISIN, or (fewest, most) to draw each ISIN's
+    count from; a schedule starts at start and has its own rate and principal.
+
+    Returns:
+    int: Terms written.
+    """
+    rng = np.random.default_rng(seed)
+    counts = (np.full(len(isins), terms) if np.isscalar(terms)
+              else rng.integers(terms[0], terms[1] + 1, len(isins)))
+    dates = pd.date_range(start, periods=int(counts.max()) if len(counts) else 0, freq='3MS').strftime('%Y-%m-%d')
+    options = STYLES[style]
+    amount = _field_format('afdrag_belob', options['zero_pad'], amount=True)
+    if options['compact']:
+        termin = (f"<termin><terminsdato>{{0}}</terminsdato><afdrag_belob>{{1:{amount}}}</afdrag_belob>"
+                  f"<rente_belob>{{2:{amount}}}</rente_belob></termin>\n")
+        opening, closing = '<ydelsesraekke><isin>{0}</isin><terminer>\n', '</terminer></ydelsesraekke>\n'
+    else:
+        termin = _render(style, _layout([('termin', [('terminsdato', '{0}'), ('afdrag_belob', f"{{1:{amount}}}"),
+                                                            ('rente_belob', f"{{2:{amount}}}")])], depth=3),
+                         ['2024-07-01', 0.0, 0.0])
+        opening = _render(style, [(1, '<ydelsesraekke>'), (2, '<isin>{0}</isin>'), (2, '<terminer>')], ['DK0000000000'])
+        closing = _render(style, [(2, '</terminer>'), (1, '</ydelsesraekke>')], [])
+
+    header = _render(style, [(0, '<?xml version="1.0" ?>'), (0, '<ydelsesraekker>')], [])
+    with open(file_path, 'w', encoding='utf-8', newline='\r\n') as file:
+        file.write(header)
+        for isin, count in zip(isins, counts):
+            principal = rng.uniform(1e8, 2e10)
+            rate = rng.uniform(0.005, 0.05) / 4
+            payment = principal * rate / (1 - (1 + rate) ** -count)
+            # Balance before each term of the annuity, then the interest and repayment it implies
+            balance = principal * ((1 + rate) ** count - (1 + rate) ** np.arange(count)) / ((1 + rate) ** count - 1)
+            rente = balance * rate
+            afdrag = payment - rente
+            file.write(opening.format(isin))
+            file.writelines(termin.format(date, a, r) for date, a, r in
+                            zip(dates[:count], afdrag.round(2).tolist(), rente.round(2).tolist()))
+            file.write(closing.format())
+        file.write(_render(style, [(0, '</ydelsesraekker>')], []))
+    return int(counts.sum())
+
+
+def write_issuer_files(debitor_folder, redemption_folder=None, scale=1, terms=40, seed=0):
+    """
+    Writes one debtor file (and, with redemption_folder, one redemption file)
+    per bundled issuer file, each with scale times that issuer's ISIN count
+    and named like the bundled file so nasdaq_stub.bundled_announcements()
+    can serve them. Issuers get disjoint ISINs.
+
+    Returns:
+    dict: File name -> (debtor rows, terminated rows, redemption terms).
+    """
+    os.makedirs(debitor_folder, exist_ok=True)
+    if redemption_folder:
+        os.makedirs(redemption_folder, exist_ok=True)
+    written = {}
+    first = 0
+    for index, (file_name, (style, count)) in enumerate(ISSUER_FILES.items()):
+        isins = make_isins(count * scale, start=first)
+        first += count * scale
+        debitor_rows, terminated_rows = write_debitor_file(os.path.join(debitor_folder, file_name), isins, style,
+                                                           seed + index)
+        redemption_terms = 0
+        if redemption_folder:
+            redemption_terms = write_redemption_file(os.path.join(redemption_folder, file_name), isins, terms,
+                                                     style=style, seed=seed + index)
+        written[file_name] = (debitor_rows, terminated_rows, redemption_terms)
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic debtor and redemption files for scale testing.")
+    parser.add_argument('--out', default='synthetic', help="Folder for the debitor/ and redemption/ files")
+    parser.add_argument('--scale', type=int, default=10, help="Multiple of each bundled issuer's ISIN count")
+    parser.add_argument('--terms', type=int, nargs='+', default=[40],
+                        help="Terms per ISIN, or the fewest and most to draw from")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    terms = args.terms[0] if len(args.terms) == 1 else tuple(args.terms[:2])
+    written = write_issuer_files(os.path.join(args.out, 'debitor'), os.path.join(args.out, 'redemption'), args.scale,
+                                 terms, args.seed)
+    for file_name, (debitor_rows, terminated_rows, redemption_terms) in written.items():
+        print(f"{file_name}: {debitor_rows} debtor rows, {terminated_rows} terminated rows, {redemption_terms} terms")
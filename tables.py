@@ -0,0 +1,131 @@
+"""
+HTML tables in the app's styled-table look, built without DataFrame.to_html.
+
+Numbers are formatted a column at a time and the HTML is assembled from
+those column arrays, without the per-cell Python calls of df.map(...) and
+to_html's own formatters. Callers page through long tables with
+page_bounds() and render only the rows in view. The markup matches to_html's (a dataframe/
+styled-table <table> with <thead>/<tbody>, index cells as <th>), so
+styles.css applies unchanged.
+"""
+import html
+import numpy as np
+import pandas as pd
+
+PAGE_ROWS = 50
+# Decimals DataFrame.to_html() shows for floats (pandas' display.precision)
+TO_HTML_DECIMALS = 6
+
+
+def format_numbers(values, decimals=2, thousands=False, suffix='', na_rep='', trim_zeros=False):
+    """
+    Formats numbers like f"{x:,.{decimals}f}{suffix}", a whole array per call:
+    one format string is mapped over the values instead of a Python function
+    per cell.
+
+    Parameters:
+    values (array-like): Numbers; NaN and infinities are written as na_rep.
+    decimals (int): Digits after the decimal point.
+    thousands (bool): Separate thousands with ','.
+    suffix (str): Appended to every number, e.g. '%'.
+    trim_zeros (bool): Drop the trailing zeros all the numbers have in
+    common, keeping one decimal, as DataFrame.to_html() does for a float column.
+
+    Returns:
+    np.ndarray: The formatted strings, as objects.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    template = '{:' + (',' if thousands else '') + f'.{decimals}f}}' + suffix.replace('{', '{{').replace('}', '}}')
+    text = np.full(values.shape, na_rep, dtype=object)
+    numbers = list(map(template.format, values[finite].tolist()))
+    if trim_zeros and decimals > 1 and not suffix:
+        # Every number has the same number of decimals, so one column of characters goes at a time
+        trim = 0
+        while trim < decimals - 1 and all(number[-1 - trim] == '0' for number in numbers):
+            trim += 1
+        if trim:
+            numbers = [number[:-trim] for number in numbers]
+    text[finite] = numbers
+    return text
+
+
+def _escape(values):
+    return np.array([html.escape(str(value)) for value in values], dtype=object)
+
+
+def _format_column(column, number_format, na_rep):
+    if column.dtype.kind in 'iufb':
+        return format_numbers(column.to_numpy(dtype=np.float64, na_value=np.nan), na_rep=na_rep, **number_format)
+    if column.dtype.kind == 'M':
+        text = column.dt.strftime('%Y-%m-%d').to_numpy(dtype=object)
+        return np.where(column.isna().to_numpy(), na_rep, text)
+    values = column.to_numpy(dtype=object)
+    return np.where(pd.isna(values), na_rep, _escape(values))
+
+
+def _label(value):
+    return '' if value is None else html.escape(str(value))
+
+
+def _header(df):
+    """The <thead> rows: a row per column level, plus one for the index names when set."""
+    index_levels = df.index.nlevels
+    rows = []
+    for level in range(df.columns.nlevels):
+        labels = list(df.columns.get_level_values(level))
+        cells = ['<th></th>'] * (index_levels - 1) + [f'<th>{_label(df.columns.names[level])}</th>']
+        if level < df.columns.nlevels - 1:
+            # Upper levels span their run of equal labels, as in to_html
+            start = 0
+            while start < len(labels):
+                stop = start + 1
+                while stop < len(labels) and labels[stop] == labels[start]:
+                    stop += 1
+                span = f' colspan="{stop - start}" halign="left"' if stop - start > 1 else ''
+                cells.append(f'<th{span}>{_label(labels[start])}</th>')
+                start = stop
+        else:
+            cells += [f'<th>{_label(label)}</th>' for label in labels]
+        style = ' style="text-align: right;"' if df.columns.nlevels == 1 else ''
+        rows.append(f'<tr{style}>' + ''.join(cells) + '</tr>')
+    if any(name is not None for name in df.index.names):
+        cells = [f'<th>{_label(name)}</th>' for name in df.index.names] + ['<th></th>'] * df.shape[1]
+        rows.append('<tr>' + ''.join(cells) + '</tr>')
+    return '\n'.join(rows)
+
+
+def html_table(df, decimals=2, thousands=False, suffix='', na_rep='', classes='styled-table', trim_zeros=False):
+    """
+    Renders df as an HTML table styled like df.to_html(classes=classes).
+
+    Every numeric column is formatted with format_numbers(decimals, thousands,
+    suffix, trim_zeros); missing values are written as na_rep. Pass only the
+    rows that are shown (see page_bounds()), since every row given is serialized.
+
+    Returns:
+    str: The <table> element.
+    """
+    number_format = {'decimals': decimals, 'thousands': thousands, 'suffix': suffix, 'trim_zeros': trim_zeros}
+    index = [_escape(df.index.get_level_values(level)) for level in range(df.index.nlevels)]
+    columns = [_format_column(df.iloc[:, position], number_format, na_rep) for position in range(df.shape[1])]
+
+    rows = np.full(len(df), '<tr>', dtype=object)
+    for values in index:
+        rows = rows + '<th>' + values + '</th>'
+    for values in columns:
+        rows = rows + '<td>' + values + '</td>'
+    body = '\n'.join(rows + '</tr>')
+    return (f'<table border="1" class="dataframe {classes}">\n<thead>\n{_header(df)}\n</thead>\n'
+            f'<tbody>\n{body}\n</tbody>\n</table>')
+
+
+def page_bounds(rows, page, page_rows=PAGE_ROWS):
+    """
+    Returns:
+    tuple: (start, stop) row positions of a 1-based page, clipped to the last page.
+    """
+    pages = max(-(-rows // page_rows), 1)
+    page = min(max(page, 1), pages)
+    start = (page - 1) * page_rows
+    return start, min(start + page_rows, rows)